@@ -9,7 +9,9 @@ A script to slowly push a system alongside the eigenvector direction.
 
 import numpy as np
 import os
-import subprocess
+
+import source.IO as IO
+import source.Jobs as Jobs
 
 _constStepFrom =  0.0
 _constStepTo   =  1.0
@@ -17,7 +19,11 @@ _constStepStep =  0.01
 _constEigenVectorNumber = 1
 
 _constPathToAims = "/Users/Tomas/Software/fhi-aims.160328_2/bin/aims.160328_1.serial.x"
-_constPathToAims = "mpirun -np 16 /home/tomas/bin/aims.071914_2.mpi.x"
+_constPathToAims = "mpirun -np {cores} /home/tomas/bin/aims.071914_2.mpi.x"
+
+# number of steps evaluated at the same time and cores per step ({cores} in the command)
+_constJobs = 1
+_constCoresPerJob = 16
 
 _constControlFile = "control.in"
 _constGeometryFile = "geometry.in"
@@ -54,18 +60,34 @@ class Geometry():
   
   def performAnalysis(self):
     """
-    Performs analysis within a certain step range
+    Performs analysis within a certain step range: prepares all the steps, evaluates them with the job runner
+    (the steps which have already been evaluated are skipped) and reads in the energies
     
     """
     
+    steps = []
+    dirList = []
+    
     step = _constStepFrom
     while step < _constStepTo+_constStepStep/2:
       
-      print "Analysing ", step
+      print "Preparing ", step
       
-      self.pushGeometry(step)
+      dirList.append(self.pushGeometry(step))
+      steps.append(step)
       
       step += _constStepStep
+    
+    runner = Jobs.JobRunner(_constPathToAims, _constFHIaimsOutFile, jobs=_constJobs, coresPerJob=_constCoresPerJob)
+    
+    success, error, _ = runner.run(dirList)
+    
+    if not success:
+      print "Error: ", error
+    
+    for step, dirName in zip(steps, dirList):
+      self.stepSize.append(step)
+      self.stepEnergy.append(readAimsEnergy(os.path.join(dirName, _constFHIaimsOutFile)))
   
   def printResults(self):
     """
@@ -78,7 +100,10 @@ class Geometry():
     
   def pushGeometry(self, stepSize):
     """
-    Pushes the structure in the direction of the eigenvector and evaluates the energy
+    Pushes the structure in the direction of the eigenvector and prepares a directory to evaluate its energy.
+    The output of a previous evaluation is removed if the geometry has changed.
+    
+    Returns the directory name.
     
     """
     
@@ -86,34 +111,43 @@ class Geometry():
     
     dirName = "step_%f" % (stepSize)
     
-    os.system("rm -rf %s" % dirName)
-    os.system("mkdir %s" % dirName)
+    if not os.path.isdir(dirName):
+      os.makedirs(dirName)
     
-    lcwd = os.getcwd()
-    os.chdir(dirName)
-        
-    self.saveGeometryFile(newPos, self.types, self.atomCnt)
-    os.system("cp ../%s ." % (_constControlFile))
+    geometryFile = os.path.join(dirName, _constGeometryFile)
     
-    runAims()
-    energy = readAimsEnergy()
+    oldGeometry = None
+    if os.path.isfile(geometryFile):
+      f = open(geometryFile, "r")
+      oldGeometry = f.read()
+      f.close()
+    
+    self.saveGeometryFile(newPos, self.types, self.atomCnt, geometryFile)
+    
+    f = open(geometryFile, "r")
+    newGeometry = f.read()
+    f.close()
     
-    self.stepSize.append(stepSize)
-    self.stepEnergy.append(energy)
+    outFile = os.path.join(dirName, _constFHIaimsOutFile)
     
-    os.chdir(lcwd)    
+    if (oldGeometry != newGeometry) and os.path.isfile(outFile):
+      os.remove(outFile)
+    
+    IO.linkFile(_constControlFile, os.path.join(dirName, _constControlFile))
+    
+    return dirName
   
-  def saveGeometryFile(self, pos, types, atomCnt):
+  def saveGeometryFile(self, pos, types, atomCnt, fileName=_constGeometryFile):
     """
     Saves new structure into a file
     
     """
     
     try:
-      f = open(_constGeometryFile, "w")
+      f = open(fileName, "w")
       
     except:
-      print "Cannot read file [%s]" % (_constGeometryFile)
+      print "Cannot read file [%s]" % (fileName)
     
     for i in range(atomCnt):
       f.write("%s %.10f %.10f %.10f %s\n" % ("atom", pos[i][0], pos[i][1], pos[i][2], types[i]))
@@ -204,7 +238,7 @@ def readinGeometry():
     
   return Geometry(atomCnt, pos, types)
 
-def readAimsEnergy():
+def readAimsEnergy(fileName=_constFHIaimsOutFile):
   """
   Reads the system's energy from the fhiaims output file
   
@@ -213,7 +247,7 @@ def readAimsEnergy():
   energy = None
 
   try:
-    fin = open(_constFHIaimsOutFile, "r")
+    fin = open(fileName, "r")
     
   except:    
     return energy
@@ -229,25 +263,6 @@ def readAimsEnergy():
   
   return energy
 
-def runAims():
-  """
-  Executes FHI-aims in the current directory
-  
-  """
-  
-  out = open(_constFHIaimsOutFile, "w")
-  null = open('/dev/null', "r")
-  
-  cmd = _constPathToAims
-  
-  p = subprocess.Popen(cmd, shell=True, stdin=null, stdout=out, stderr=subprocess.STDOUT) 
-  p.communicate()
-
-  status = p.poll() 
-
-  out.close()
-  null.close()
-  
 if __name__ == "__main__":
     
   # reads in geometry.in
@@ -7,12 +7,17 @@ A script to identify defects by comparing initial and final systems
 
 """
 
+import os
+import re
+import sys
 from optparse import OptionParser
 import numpy as np
 
 import source.IO as IO
 import source.Defects as Defects
 
+_trajectoryOutputFile = "DefectCounts.csv"
+
 def check_systems(input_system, final_system):
   """
   Checks whether the analysis can be performed.
@@ -42,10 +47,26 @@ def cmdLineArgs():
   
   """
   
-  usage = "usage: %prog input_file output_file defect_radius"
+  usage = "usage: %prog input_file output_file defect_radius\n" + \
+          "       %prog -t input_file frames_dir defect_radius"
   
   parser = OptionParser(usage=usage)
 
+  parser.add_option("-n", "--threads", dest="threads", default=1, type="int",
+    help="Number of threads used to search for defects (0 - all available cores). Default = 1")
+  
+  parser.add_option("-t", "--trajectory", dest="trajectory", action="store_true", default=False, 
+    help="Compare every frame in the frames_dir directory with the input file")
+  
+  parser.add_option("-e", "--extension", dest="extension", default="xyz", 
+    help="Extension of the frame files in trajectory mode. Default = xyz")
+  
+  parser.add_option("-o", "--output", dest="output", default=_trajectoryOutputFile, 
+    help="Output file of the defect counts in trajectory mode. Default = %s" % (_trajectoryOutputFile))
+  
+  parser.add_option("-c", "--cluster_radius", dest="cluster_radius", default=None, type="float", 
+    help="Group the defects into clusters of defects closer than this radius")
+
   parser.disable_interspersed_args()
       
   (options, args) = parser.parse_args()
@@ -55,6 +76,100 @@ def cmdLineArgs():
 
   return options, args
 
+def get_frame_files(dir_path, extension):
+  """
+  Returns the frame files in the directory in their natural order (frame_2 before frame_10).
+  
+  """
+  
+  def natural_key(file_name):
+    return [int(item) if item.isdigit() else item for item in re.split(r"(\d+)", file_name)]
+  
+  frame_files = [file_name for file_name in os.listdir(dir_path) if file_name.endswith(".%s" % (extension))]
+  frame_files.sort(key=natural_key)
+  
+  return [os.path.join(dir_path, file_name) for file_name in frame_files]
+
+def read_frames(frame_files):
+  """
+  Generator which reads in the frames one by one.
+  
+  """
+  
+  for frame_file in frame_files:
+    frame, error = IO.readSystemFromFile(frame_file)
+    
+    if len(error) > 0:
+      print "Error reading in [%s]: %s" % (frame_file, error)
+      continue
+    
+    yield frame
+
+def print_clusters(clusters):
+  """
+  Prints the defect clusters.
+  
+  """
+  
+  print "Number of clusters: %d" % (clusters.NClusters)
+  
+  for i in xrange(clusters.NClusters):
+    print ("Cluster %d : %d defects (%d vacancies, %d interstitials, %d antisites) centred at %f %f %f" % (i+1, 
+      clusters.sizes[i], clusters.composition[i, 0], clusters.composition[i, 1], clusters.composition[i, 2],
+      clusters.centroids[i, 0], clusters.centroids[i, 1], clusters.centroids[i, 2]))
+  
+  for size in xrange(1, len(clusters.sizeHistogram)):
+    if clusters.sizeHistogram[size] > 0:
+      print "Clusters of size %d: %d" % (size, clusters.sizeHistogram[size])
+
+def analyse_trajectory(input_system, frame_files, vac_radius, num_threads, output_file, cluster_radius=None):
+  """
+  Finds defects in every frame reusing the boxed reference lattice and saves the defect counts.
+  
+  """
+  
+  success = True
+  error = ""
+  
+  reference = Defects.ReferenceLattice(input_system, vac_radius, num_threads, verbose_level=0)
+  
+  f = open(output_file, "w")
+  f.write("Frame,NDef,NVac,NInt,NAnt")
+  
+  if cluster_radius is not None:
+    f.write(",NClusters,MaxClusterSize")
+  
+  f.write("\n")
+  
+  print "%-30s %8s %8s %8s %8s" % ("Frame", "NDef", "NVac", "NInt", "NAnt")
+  
+  for frame in read_frames(frame_files):
+    success, error = check_systems(input_system, frame)
+    
+    if success:
+      success, error = reference.find(frame)
+    
+    if not success:
+      print "Error in frame [%s]: %s" % (frame.name, error)
+      continue
+    
+    print "%-30s %8d %8d %8d %8d" % (frame.name, frame.NDef, frame.NVac, frame.NInt, frame.NAnt)
+    
+    f.write("%s,%d,%d,%d,%d" % (frame.name, frame.NDef, frame.NVac, frame.NInt, frame.NAnt))
+    
+    if cluster_radius is not None:
+      clusters = frame.defectResult.find_clusters(cluster_radius)
+      
+      f.write(",%d,%d" % (clusters.NClusters, clusters.sizes.max() if clusters.NClusters > 0 else 0))
+    
+    f.write("\n")
+  
+  f.close()
+  
+  reference.free()
+  
+  return True, ""
+
 def read_systems(input_file, final_file):
   """
   Reads in input and final systems
@@ -87,6 +202,23 @@ if __name__ == "__main__":
   # command line arguments and options
   options, args = cmdLineArgs()
   
+  if options.trajectory:
+    input_system, error = IO.readSystemFromFile(args[0])
+    
+    if len(error) == 0:
+      frame_files = get_frame_files(args[1], options.extension)
+      
+      success, error = analyse_trajectory(input_system, frame_files, np.float(args[2]), options.threads, options.output, 
+                                          options.cluster_radius)
+    
+    if len(error) == 0:
+      print "Finished!"
+    
+    else:
+      print "ERROR: %s" % (error)
+    
+    sys.exit(0)
+  
   # reading in the systems
   success, error, input_system, final_system = read_systems(args[0], args[1])
   
@@ -95,7 +227,7 @@ if __name__ == "__main__":
     
   if success:
     vac_radius = np.float(args[2])
-    success, error = Defects.find_defects(input_system, final_system, vac_radius)
+    success, error = Defects.find_defects(input_system, final_system, vac_radius, options.threads)
     
   else:
     print "Error: " + error
@@ -104,6 +236,9 @@ if __name__ == "__main__":
     
     final_system.printDefectsPositions()
     
+    if options.cluster_radius is not None:
+      print_clusters(final_system.defectResult.find_clusters(options.cluster_radius))
+    
     print "Finished!"
     
   else:
@@ -1,20 +1,30 @@
 """
 Finds unique structures by examining the working directory (recursively) and reading in systems with the predefined extension. Then examines them using the hashkey and creates a directory with all the unique systems and a statistics file.
 
+The read in systems and their hashkeys are recorded in a manifest (in the unique directory), hence a rerun reads in only the new or modified files. The listing of the directories is cached too: only the changed directories are listed again (use --verify to find the files modified in place).
+
 @author Tomas Lazauskas, 2017
 @web www.lazauskas.net
 @email tomas.lazauskas[a]gmail.com
 """
 
 from optparse import OptionParser
+import os
 import sys
 
 # Analysis toolkit modules
 import source.IO as IO
+import source.Manifest as Manifest
 import source.Utilities as Utilities
 
 # constants
 _uniqueDir = "unique"
+_manifestFile = "manifest.db"
+_filesManifestFile = "files.json"
+
+# 2.98
+# GaAs - 2.899
+_hashkeyRadius = 3.34
 
 def cmd_line_args():
   """
@@ -26,6 +36,21 @@ def cmd_line_args():
   
   parser = OptionParser(usage=usage)
   
+  parser.add_option("-s", "--single_file", dest="single_file", default=None, 
+    help="Save all the unique structures into this multi-frame xyz file (in the unique directory) instead of one file per structure")
+  
+  parser.add_option("-m", "--manifest", dest="manifest", default=os.path.join(_uniqueDir, _manifestFile), 
+    help="Manifest of the read in systems. Default = %s" % (os.path.join(_uniqueDir, _manifestFile)))
+  
+  parser.add_option("-v", "--verify", dest="verify", action="store_true", default=False, 
+    help="Check every file for changes, not only the files of the changed directories")
+  
+  parser.add_option("-r", "--rebuild", dest="rebuild", action="store_true", default=False, 
+    help="Discard the manifest and read in all the systems again")
+  
+  parser.add_option("-n", "--processes", dest="processes", default=None, type="int", 
+    help="Number of worker processes reading in the systems. Default: number of CPUs")
+  
   parser.disable_interspersed_args()
   
   (options, args) = parser.parse_args()
@@ -40,23 +65,43 @@ if __name__ == "__main__":
   # reading in input arguments
   options, args = cmd_line_args()
   
-  # finding the structures (paths)
-  systems_files_list = IO.get_file_list_recursive_simple(extension=args[0])
+  IO.checkDirectory(_uniqueDir, True)
+  
+  manifest = Manifest.AnalysisManifest(options.manifest, params={"extension" : args[0], 
+                                                                 "hashkeyRadius" : _hashkeyRadius})
+  
+  if options.rebuild:
+    manifest.clear()
   
-  # reading in the systems
-  systems = IO.read_in_systems(systems_files_list)
+  # finding the structures (paths), the saved unique structures are not analysed
+  unique_dir_path = os.path.abspath(_uniqueDir) + os.sep
   
-  # getting the hashkeys and finding the unique ones
-  # 2.98
-  # GaAs - 2.899
-  unique_systems = IO.get_unique_systems_hashkeys(systems, 3.34)
+  files_manifest = IO.FileManifest(os.path.join(os.path.dirname(options.manifest), _filesManifestFile))
+  
+  entries, changed_files = files_manifest.scan(os.getcwd(), extension=args[0], verify=options.verify)
+  
+  systems_files_list = [file_path for file_path, _, _ in entries if not file_path.startswith(unique_dir_path)]
+  
+  # reading in the new and modified systems
+  read_cnt, failed_cnt, removed_cnt = manifest.sync(systems_files_list, IO.readSystemFromFile, 
+                                                    processes=options.processes, changedPaths=changed_files)
+  
+  files_manifest.save()
+  
+  print ("Read in %d new or modified files (%d failed), %d removed" % (read_cnt, failed_cnt, removed_cnt))
+  
+  systems = manifest.systems()
+  
+  # getting the hashkeys (of the new systems) and finding the unique ones
+  unique_systems = IO.get_unique_systems_hashkeys(systems, _hashkeyRadius, recalculate=False)
+  
+  manifest.save_hashkeys(systems)
+  manifest.close()
   
   # sorting the systems
   Utilities.sort_systems(unique_systems)
   
   # generating the combined unique top structures and saves them in the unique directory
-  IO.checkDirectory(_uniqueDir, True)
-  
-  IO.save_systems_to_xyz(unique_systems, _uniqueDir)
+  IO.save_systems_to_xyz(unique_systems, _uniqueDir, file_name=options.single_file)
   
-  Utilities.systems_statistics(unique_systems, _uniqueDir)
\ No newline at end of file
+  Utilities.systems_statistics(unique_systems, _uniqueDir)
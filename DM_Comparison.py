@@ -3,20 +3,38 @@
 """
 A script to compare unique structures in terms of their energy ranking between different levels of theory (IPs (GULP) and DFT (FHIaims))
 
+With a configuration file any number of levels of theory (one section per level, in the order of the comparison)
+are read in in parallel, the structures are matched by their hashkeys and the Spearman's and Kendall's rank
+correlation matrices are saved together with the plots:
+
+  [IP (cores)]
+  path = /Volumes/DATA/ZnO/90_GA_10x_Results/n12/run/run/200/
+  type = KLMC_GA
+  limit = 50
+
+  [PBESol (light)]
+  path = /Volumes/DATA/ZnO/94_Aims_Archer/1_Light_12_32/2_Sims/n12/
+  type = JOBARR_DM
+
 @author Tomas Lazauskas, 2016
 @web www.lazauskas.net
 @email tomas.lazauskas[a]gmail.com
 
 """
 
+import ConfigParser
 import os
 import sys
+from optparse import OptionParser
 
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.lines as lines
+from matplotlib.collections import LineCollection
+from scipy import stats
 
 import source.IO as IO
+import source.Utilities as Utilities
 
 _inputTypeKLMC_GA = "KLMC_GA"
 _inputTypeKLMC_DM = "KLMC_DM"
@@ -36,6 +54,14 @@ _jobArrOutDir = "output/"
 _jobArrUniqueDir = "output/unique/"
 _jobArrStatsFile = "Stats.csv"
 
+# initial capacity of the results arrays
+_initialCapacity = 64
+
+_inputTypes = [_inputTypeKLMC_GA, _inputTypeKLMC_DM, _inputTypeJobArr]
+
+# output of the configuration driven comparison
+_comparisonPrefix = "Comparison"
+
 # TODO: Maybe this should be defined in a more general way, input file?
 # Input 
 theoryTypeCnt = 4
@@ -64,6 +90,49 @@ theory4Limit = 50
 theory4Type = _inputTypeJobArr
 theory4Format = ""
 
+def cmd_line_args():
+  """
+  Handles command line arguments and options.
+  
+  """
+  
+  usage = "usage: %prog [options]"
+  
+  parser = OptionParser(usage=usage)
+  
+  parser.add_option("-l", "--limit", dest="limit", default=None, type="int", 
+    help="Number of structures to compare for every level of theory (0 - all of them). " + 
+         "Default: the limits defined in the script (configuration file)")
+  
+  parser.add_option("-c", "--config", dest="config", default=None, 
+    help="Configuration file of the levels of theory to compare. Default: the four levels defined in the script")
+  
+  parser.add_option("-n", "--processes", dest="processes", default=None, type="int", 
+    help="Number of worker processes reading in the levels of theory. Default: number of CPUs")
+  
+  parser.add_option("-o", "--output", dest="output", default=_comparisonPrefix, 
+    help="Prefix of the output files of the configuration driven comparison. Default = %s" % (_comparisonPrefix))
+  
+  parser.disable_interspersed_args()
+  
+  (options, args) = parser.parse_args()
+  
+  return options, args
+
+def getStructureLimit(theoryLimit, limit=None):
+  """
+  Returns the structure limit of a level of theory (None - no limit) taking into account the command line limit
+  
+  """
+  
+  if limit is None:
+    return theoryLimit
+  
+  if limit > 0:
+    return limit
+  
+  return None
+
 class SimulationResult(object):
   """
   A class to save the simulation data
@@ -80,9 +149,9 @@ class SimulationResult(object):
   currRank  = None
   currRankHash = None
   
-  def __init__(self, simType, structCntLimit):
+  def __init__(self, simType, structCntLimit=None):
     """
-    Constructor
+    Constructor (structCntLimit is the initial capacity, the arrays grow as the structures are appended)
     
     """
     
@@ -93,18 +162,36 @@ class SimulationResult(object):
     self.success   = False
     self.error     = None
     
-    self.energyArr = np.zeros(structCntLimit, np.float64)
+    capacity = structCntLimit if structCntLimit else _initialCapacity
+    
+    self.energyArr = np.zeros(capacity, np.float64)
     self.hashkeys  = []
-    self.prevRank  = np.zeros(structCntLimit, np.int16)
-    self.currRank  = np.zeros(structCntLimit, np.int16)
-    self.currRankHash = np.zeros(structCntLimit, np.int16)
+    self.prevRank  = np.zeros(capacity, np.int32)
+    self.currRank  = np.zeros(capacity, np.int32)
+    self.currRankHash = np.zeros(capacity, np.int32)
+  
+  def _grow(self):
+    """
+    Doubles the capacity of the arrays
+    
+    """
+    
+    capacity = 2 * len(self.energyArr)
+    
+    self.energyArr = np.resize(self.energyArr, capacity)
+    self.prevRank = np.resize(self.prevRank, capacity)
+    self.currRank = np.resize(self.currRank, capacity)
+    self.currRankHash = np.resize(self.currRankHash, capacity)
   
   def appendStructure(self, energy, hashkey, prevRankEl, currRankEl, hashkeyRankEl):
     """
     Appends a structure to the results 
     
     """
-
+    
+    if self.structCnt == len(self.energyArr):
+      self._grow()
+    
     self.energyArr[self.structCnt] = energy
     self.hashkeys.append(hashkey)      
     self.prevRank[self.structCnt] = int(prevRankEl)
@@ -113,127 +200,117 @@ class SimulationResult(object):
     
     self.structCnt += 1
     
-def lookForIniStructureKLMC(klmcOut, structureName):
+def readIniStructuresKLMC(klmcOut):
   """
-  Scans klmc outfile, expecting it to be in the DM mode and tries to locate the initial file name
+  Scans klmc outfile, expecting it to be in the DM mode, and returns the initial ranks of the structures 
+  (structure name with A replaced by X -> rank)
   
   """
   
-  prevRank = -1
-  
-  # TODO: Names can also start with B, C, D, E!
-  structureNameReplaced = structureName.replace("A", "X")
+  prevRanks = {}
   
   try:
     f = open(klmcOut, "r")
    
   except:
-    return prevRank
+    return prevRanks
+  
+  startExpr = "from restart/"
   
-  strExpr = " as %s " % (structureNameReplaced)
-
   for line in f: 
-    if strExpr in line:
-      startExpr = "from restart/"
-      
-      fileNameStart = line.find(startExpr)
-      fileNameEnd = line.find(strExpr)
-      
-      fileName = line[fileNameStart+len(startExpr):fileNameEnd]
-      
-      # TODO: This might not be allways the case!
-      prevRank = int(fileName.split("_")[0])
-
+    fileNameStart = line.find(startExpr)
+    
+    if fileNameStart < 0:
+      continue
+    
+    fileNameEnd = line.find(" as ", fileNameStart)
+    
+    if fileNameEnd < 0:
+      continue
+    
+    nameArray = line[fileNameEnd+4:].split(" ")
+    
+    if len(nameArray) < 2:
+      continue
+    
+    fileName = line[fileNameStart+len(startExpr):fileNameEnd]
+    
+    # TODO: This might not be allways the case!
+    try:
+      prevRanks[nameArray[0]] = int(fileName.split("_")[0])
+    except ValueError:
+      continue
+  
   f.close()
   
-  return prevRank
+  return prevRanks
 
-def lookForStructureRankKLMC(filePath, structureName, structureHashkey):
+def lookForIniStructureKLMC(prevRanks, structureName):
   """
-  Scans through a statistics file to find the rank of a structure
+  Returns the initial rank of a structure (-1 if it was not found)
   
   """
   
-  rank = -1
-  lineCnt = 0
-  
   # TODO: Names can also start with B, C, D, E!
-  if (structureName is not None):
-    structureNameReplaced = structureName.replace("A", "X")
+  return prevRanks.get(structureName.replace("A", "X"), -1)
+
+def readStructureRanksKLMC(filePath, column):
+  """
+  Reads a statistics file and returns the ranks of the structures by the values of the column 
+  (1 - name, 2 - hashkey)
+  
+  """
+  
+  ranks = {}
+  lineCnt = 0
   
   try:
     f = open(filePath, "r")
   except:
-    return rank
+    return ranks
   
   for line in f:
     if lineCnt > 0:
-      line = line.strip()
-
-      array = line.split()
-      name = array[1].strip()
-      rankFile = int(array[0].strip())
-      
-      if (structureHashkey is not None):
-        hashkey = array[2].strip()
-      else:
-        hashkey = None
-      
-      if ((structureName is not None) and (name == structureName)):
-        rank = rankFile
-        return rank
+      array = line.strip().split()
       
-      elif ((structureHashkey is not None) and (hashkey == structureHashkey)):
-        rank = rankFile
-        return rank
+      if len(array) > column:
+        ranks.setdefault(array[column].strip(), int(array[0].strip()))
     
     lineCnt += 1
   
-  return rank
+  f.close()
+  
+  return ranks
 
-def lookForStructureRankJobArr(filePath, structureName, structureHashkey):
+def readStructureRanksJobArr(filePath):
   """
-  Scans through a top structures file to find the rank of a structure
+  Reads a top structures file and returns the ranks of the structures by their names and by their hashkeys
   
   """
   
-  rank = -1
+  nameRanks = {}
+  hashkeyRanks = {}
   lineCnt = 0
-  lookForHashkey = False
-  
-  # TODO: Names can also start with B, C, D, E!
-  if (structureName is not None):
-    structureNameReplaced = structureName.replace("A", "X")
-  
-  if (structureHashkey is not None):
-    lookForHashkey = True
   
   try:
     f = open(filePath, "r")
     
   except:
-    return rank
+    return nameRanks, hashkeyRanks
   
   for line in f:
     if lineCnt > 0:
-      line = line.strip()
-
-      array = line.split(",")
-      name = array[0].strip()
-      hashkey = array[2].strip()
-          
-      if lookForHashkey:
-        if hashkey == structureHashkey:
-          rank = lineCnt
-          break
-        
-      elif name == structureName:
-        rank = lineCnt
-        break
+      array = line.strip().split(",")
+      
+      if len(array) > 2:
+        nameRanks.setdefault(array[0].strip(), lineCnt)
+        hashkeyRanks.setdefault(array[2].strip(), lineCnt)
       
     lineCnt += 1
   
-  return rank
+  f.close()
+  
+  return nameRanks, hashkeyRanks
 
 def plot(mSimulationResult1, label1, mSimulationResult2, label2, mSimulationResult3, label3, 
          mSimulationResult4, label4):
@@ -291,25 +368,26 @@ def plot(mSimulationResult1, label1, mSimulationResult2, label2, mSimulationResu
   # Joining plot 1 - plot 2
   transFigure = fig.transFigure.inverted()
   
+  # previous rank -> index of the first structure of the plot 2
+  prevRanks2 = {}
+  for j in range(mSimulationResult2.structCnt):
+    prevRanks2.setdefault(mSimulationResult2.prevRank[j], j)
+  
   for i in range(mSimulationResult1.structCnt):
     
     currRank1 = mSimulationResult1.currRank[i]
     nextRank1 = -1
     
-    for j in range(mSimulationResult2.structCnt):
-      
-      prevRank2 = mSimulationResult2.prevRank[j]
+    j = prevRanks2.get(currRank1)
+    
+    if j is not None:
+      currRank2 = mSimulationResult2.currRank[j]
+      currHashRank2 = mSimulationResult2.currRankHash[j]
       
-      if prevRank2 == currRank1:
-        
-        currRank2 = mSimulationResult2.currRank[j]
-        currHashRank2 = mSimulationResult2.currRankHash[j]
-        
-        if currRank2 > 0:
-          nextRank1 = currRank2
-        else:
-          nextRank1 = currHashRank2
-        break
+      if currRank2 > 0:
+        nextRank1 = currRank2
+      else:
+        nextRank1 = currHashRank2
       
     if currRank1 > 0 and nextRank1 > 0:
       
@@ -347,6 +425,19 @@ def plot(mSimulationResult1, label1, mSimulationResult2, label2, mSimulationResu
     fig.lines.append(line)
     
   # Joining plot 3 - plot 4
+  
+  # rank -> index of the first structure of the plot 3
+  ranks3 = {}
+  for j in range(mSimulationResult3.structCnt):
+    
+    if mSimulationResult3.currRank[j] != -1:
+      currRank3 = mSimulationResult3.currRank[j]
+      
+    else:
+      currRank3 = mSimulationResult3.currRankHash[j]
+    
+    ranks3.setdefault(currRank3, j)
+  
   for i in range(mSimulationResult4.structCnt):
     
     prevRank4 = mSimulationResult4.prevRank[i]
@@ -354,19 +445,12 @@ def plot(mSimulationResult1, label1, mSimulationResult2, label2, mSimulationResu
     hashRank4 = mSimulationResult4.currRankHash[i]
      
     prevIniRank4 = -1
-        
-    for j in range(mSimulationResult3.structCnt):
-      
-      if mSimulationResult3.currRank[j] != -1:
-        currRank3 = mSimulationResult3.currRank[j]
-        
-      else:
-        currRank3 = mSimulationResult3.currRankHash[j]
-      
-      if currRank3 == prevRank4:
-
-        prevIniRank4 = mSimulationResult3.prevRank[j]
-        break
+    
+    # the last structure if the rank was not found
+    j = ranks3.get(prevRank4, mSimulationResult3.structCnt - 1)
+    
+    if prevRank4 in ranks3:
+      prevIniRank4 = mSimulationResult3.prevRank[j]
         
     if currRank4 != -1:
       rank4 = currRank4
@@ -388,9 +472,17 @@ def plot(mSimulationResult1, label1, mSimulationResult2, label2, mSimulationResu
   fig.savefig('Comparison.png')
 
 
-def readDMFiles(structureLimit):
+def withinLimit(structCnt, structureLimit):
   """
-  Extracts energies and hashkeys from DM simulations
+  Checks whether another structure can be read (structureLimit=None - no limit)
+  
+  """
+  
+  return (structureLimit is None) or (structCnt < structureLimit)
+
+def readDMFiles(structureLimit=None):
+  """
+  Extracts energies and hashkeys from DM simulations (structureLimit=None reads all of them)
   
   """
   
@@ -406,6 +498,11 @@ def readDMFiles(structureLimit):
   except:
     return mSimulationResult
   
+  # the ranks are read once
+  prevRanks = readIniStructuresKLMC(_klmcLogFile)
+  currRanks = readStructureRanksKLMC("%s/%s" % (_klmcTopDir, _klmcDMStatsFile), 1)
+  hashkeyRanks = readStructureRanksKLMC("%s/%s" % (_klmcTopDir, _klmcDMHashkeysFile), 2)
+  
   for line in f:
     line = line.strip()
     
@@ -419,13 +516,13 @@ def readDMFiles(structureLimit):
       energy = float(array[4])
       
       # Getting the ranking
-      prevRankEl = lookForIniStructureKLMC(_klmcLogFile, name)
+      prevRankEl = lookForIniStructureKLMC(prevRanks, name)
       
-      currRankEl = lookForStructureRankKLMC("%s/%s" % (_klmcTopDir, _klmcDMStatsFile), name, None)
+      currRankEl = currRanks.get(name, -1)
       
-      hashkeyRankEl = lookForStructureRankKLMC("%s/%s" % (_klmcTopDir, _klmcDMHashkeysFile), None, hashkey)
+      hashkeyRankEl = hashkeyRanks.get(hashkey, -1)
             
-      if edfn > 0 and energy != 0.0 and structCnt < structureLimit:
+      if edfn > 0 and energy != 0.0 and withinLimit(structCnt, structureLimit):
                 
         # Appending the result
         mSimulationResult.appendStructure(energy, hashkey, prevRankEl, currRankEl, hashkeyRankEl)
@@ -438,10 +535,10 @@ def readDMFiles(structureLimit):
       
   return mSimulationResult
 
-def readGAStatsFile(filePath, structureLimit):
+def readGAStatsFile(filePath, structureLimit=None):
   """
   Extracts energies and hashkeys from the GA statistics file assuming that the entries are ordered 
-  with respect to the energy.
+  with respect to the energy (structureLimit=None reads all of them).
   
   """
   structCnt = 0
@@ -466,7 +563,7 @@ def readGAStatsFile(filePath, structureLimit):
       status = int(array[4])
       energy = float(array[5])
         
-      if edfn > 0 and status == 1 and energy != 0.0 and structCnt < structureLimit:
+      if edfn > 0 and status == 1 and energy != 0.0 and withinLimit(structCnt, structureLimit):
         structCnt += 1
          
         prevRankEl = -1
@@ -483,9 +580,9 @@ def readGAStatsFile(filePath, structureLimit):
   
   return mSimulationResult
 
-def readJobArrFiles(structureLimit):
+def readJobArrFiles(structureLimit=None):
   """
-  Extracts energies and hashkeys from job array simulations
+  Extracts energies and hashkeys from job array simulations (structureLimit=None reads all of them)
   
   """
   
@@ -500,6 +597,9 @@ def readJobArrFiles(structureLimit):
    
   except:
     return mSimulationResult
+  
+  # the ranks are read once
+  nameRanks, hashkeyRanks = readStructureRanksJobArr("%s/%s" % (_jobArrUniqueDir, _jobArrStatsFile))
     
   for line in f:
     line = line.strip()
@@ -528,10 +628,10 @@ def readJobArrFiles(structureLimit):
         except:
           prevRankEl = -1
       
-      currRankEl = lookForStructureRankJobArr("%s/%s" % (_jobArrUniqueDir, _jobArrStatsFile), name, None)
-      hashkeyRankEl = lookForStructureRankJobArr("%s/%s" % (_jobArrUniqueDir, _jobArrStatsFile), name, hashkey)
+      currRankEl = nameRanks.get(name, -1)
+      hashkeyRankEl = hashkeyRanks.get(hashkey, -1)
              
-      if energy != 0.0 and structCnt < structureLimit:       
+      if energy != 0.0 and withinLimit(structCnt, structureLimit):       
         # Appending the result
         mSimulationResult.appendStructure(energy, hashkey, prevRankEl, currRankEl, hashkeyRankEl)
             
@@ -571,17 +671,22 @@ def readStructuresData(dirPath, limit, type, format):
     if ((csvFile is None) or (not IO.checkFile(csvFile))):
       error = "File does not exist: %s" % (csvFile)
       
+      os.chdir(cwd)
+      
       return success, error, mSimulationResult
       
     mSimulationResult = readGAStatsFile(csvFile, limit)
+    success = True
   
   elif (type == _inputTypeKLMC_DM):
     
     mSimulationResult = readDMFiles(limit)
+    success = True
   
   elif (type == _inputTypeJobArr):
   
     mSimulationResult = readJobArrFiles(limit)
+    success = True
     
   else:
     error = "Type '%s' cannot be used at the moment " % (type)
@@ -590,28 +695,309 @@ def readStructuresData(dirPath, limit, type, format):
   
   return success, error, mSimulationResult
   
+def readConfig(configFile, limit=None):
+  """
+  Reads in the configuration file: one section (label) per level of theory with the path, type and 
+  optionally limit (0 - no limit) and format options.
+  
+  Returns success, error, list of the levels of theory (dictionaries).
+  
+  """
+  
+  theories = []
+  
+  if not IO.checkFile(configFile):
+    return False, "File does not exist: %s" % (configFile), theories
+  
+  config = ConfigParser.RawConfigParser()
+  
+  try:
+    config.read(configFile)
+  except ConfigParser.Error as e:
+    return False, "Cannot read the configuration file %s: %s" % (configFile, e), theories
+  
+  for section in config.sections():
+    if (not config.has_option(section, "path")) or (not config.has_option(section, "type")):
+      return False, "Level of theory '%s' must define the path and the type" % (section), theories
+    
+    theoryType = config.get(section, "type").strip()
+    
+    if theoryType not in _inputTypes:
+      return False, "Level of theory '%s': type '%s' cannot be used at the moment" % (section, theoryType), theories
+    
+    theoryLimit = config.getint(section, "limit") if config.has_option(section, "limit") else 0
+    
+    theories.append({"label" : section, 
+                     "path" : os.path.expanduser(config.get(section, "path").strip()), 
+                     "type" : theoryType, 
+                     "limit" : getStructureLimit(theoryLimit if theoryLimit > 0 else None, limit), 
+                     "format" : config.get(section, "format") if config.has_option(section, "format") else ""})
+  
+  if len(theories) < 2:
+    return False, "At least two levels of theory must be defined in %s" % (configFile), theories
+  
+  return True, "", theories
+
+def _readStructuresDataStar(args):
+  """
+  Unpacks the arguments for the worker pool.
+  
+  """
+  
+  return readStructuresData(*args)
+
+def readAllStructuresData(theories, processes=None):
+  """
+  Reads in the structural data of the levels of theory in a process pool (processes=None uses all cores).
+  
+  Returns a list of success, error, SimulationResult in the order of the levels of theory.
+  
+  """
+  
+  args = [(theory["path"], theory["limit"], theory["type"], theory["format"]) for theory in theories]
+  
+  if processes is not None:
+    processes = min(processes, len(args))
+  
+  return Utilities.pool_map(_readStructuresDataStar, args, processes, chunksize=1)
+
+def getHashkeyEnergies(mSimulationResult):
+  """
+  Returns the lowest energy of every hashkey of the results (the structures without a hashkey are ignored).
+  
+  """
+  
+  energies = {}
+  
+  for hashkey, energy in zip(mSimulationResult.hashkeys, mSimulationResult.energyArr[:mSimulationResult.structCnt]):
+    if (hashkey == "") or (hashkey == "-"):
+      continue
+    
+    if (hashkey not in energies) or (energy < energies[hashkey]):
+      energies[hashkey] = energy
+  
+  return energies
+
+def matchStructures(energies1, energies2):
+  """
+  Joins two hashkey -> energy dictionaries.
+  
+  Returns the common hashkeys (sorted) and their energies in both of the levels of theory.
+  
+  """
+  
+  hashkeys = sorted(set(energies1).intersection(energies2))
+  
+  e1 = np.array([energies1[hashkey] for hashkey in hashkeys], np.float64)
+  e2 = np.array([energies2[hashkey] for hashkey in hashkeys], np.float64)
+  
+  return hashkeys, e1, e2
+
+def rankCorrelations(hashkeyEnergies):
+  """
+  Calculates the Spearman's and Kendall's rank correlations of the energies of the common structures of every 
+  pair of the levels of theory (NaN if they have less than two structures in common).
+  
+  Returns spearman, kendall, common (number of the common structures) matrices.
+  
+  """
+  
+  theoriesCnt = len(hashkeyEnergies)
+  
+  spearman = np.empty([theoriesCnt, theoriesCnt], np.float64)
+  kendall = np.empty([theoriesCnt, theoriesCnt], np.float64)
+  common = np.zeros([theoriesCnt, theoriesCnt], np.int32)
+  
+  spearman.fill(np.nan)
+  kendall.fill(np.nan)
+  
+  for i in range(theoriesCnt):
+    for j in range(i, theoriesCnt):
+      hashkeys, e1, e2 = matchStructures(hashkeyEnergies[i], hashkeyEnergies[j])
+      
+      common[i, j] = common[j, i] = len(hashkeys)
+      
+      if len(hashkeys) < 2:
+        continue
+      
+      spearman[i, j] = spearman[j, i] = stats.spearmanr(e1, e2)[0]
+      kendall[i, j] = kendall[j, i] = stats.kendalltau(e1, e2)[0]
+  
+  return spearman, kendall, common
+
+def saveMatrix(fileName, labels, matrix, valueFormat="%f"):
+  """
+  Saves a matrix of the levels of theory as a csv file.
+  
+  """
+  
+  f = open(fileName, "w")
+  
+  f.write(",%s\n" % (",".join(labels)))
+  
+  for label, row in zip(labels, matrix):
+    f.write("%s,%s\n" % (label, ",".join([valueFormat % (value) for value in row])))
+  
+  f.close()
+
+def plotLandscapes(labels, hashkeyEnergies, fileName):
+  """
+  Plots the energies of the levels of theory side by side and joins the same structures (hashkeys) of the 
+  adjacent levels.
+  
+  """
+  
+  theoriesCnt = len(labels)
+  
+  fig, axes = plt.subplots(nrows=1, ncols=theoriesCnt, sharex=False, sharey=False, 
+                           figsize=(3 * theoriesCnt, 8))
+  
+  for axis, label, energies in zip(axes, labels, hashkeyEnergies):
+    y = np.array(sorted(energies.values()), np.float64)
+    
+    axis.scatter(np.zeros(len(y)), y, s=100)
+    axis.ticklabel_format(style='plain', axis='y', useOffset=False)
+    axis.set_xticks([0])
+    axis.set_xticklabels([label])
+  
+  transFigure = fig.transFigure.inverted()
+  
+  segments = []
+  
+  for i in range(theoriesCnt - 1):
+    hashkeys, e1, e2 = matchStructures(hashkeyEnergies[i], hashkeyEnergies[i+1])
+    
+    if len(hashkeys) == 0:
+      continue
+    
+    zeros = np.zeros(len(hashkeys))
+    
+    coords1 = transFigure.transform(axes[i].transData.transform(np.column_stack((zeros, e1))))
+    coords2 = transFigure.transform(axes[i+1].transData.transform(np.column_stack((zeros, e2))))
+    
+    segments.extend(zip(coords1, coords2))
+  
+  collection = LineCollection(segments, transform=fig.transFigure, linewidths=0.5)
+  
+  if hasattr(fig, "add_artist"):
+    fig.add_artist(collection)
+  else:
+    fig.artists.append(collection)
+  
+  fig.savefig(fileName)
+  plt.close(fig)
+
+def plotCorrelationMatrix(labels, matrix, title, fileName):
+  """
+  Plots a rank correlation matrix.
+  
+  """
+  
+  theoriesCnt = len(labels)
+  
+  fig, axis = plt.subplots(figsize=(2 + theoriesCnt, 1 + theoriesCnt))
+  
+  image = axis.imshow(np.ma.masked_invalid(matrix), vmin=-1.0, vmax=1.0, cmap="RdBu_r", interpolation="nearest")
+  
+  axis.set_xticks(range(theoriesCnt))
+  axis.set_yticks(range(theoriesCnt))
+  axis.set_xticklabels(labels, rotation=45, ha="right")
+  axis.set_yticklabels(labels)
+  axis.set_title(title)
+  
+  for i in range(theoriesCnt):
+    for j in range(theoriesCnt):
+      if not np.isnan(matrix[i, j]):
+        axis.text(j, i, "%.2f" % (matrix[i, j]), ha="center", va="center", fontsize=8)
+  
+  fig.colorbar(image)
+  fig.tight_layout()
+  
+  fig.savefig(fileName)
+  plt.close(fig)
+
+def compareLandscapes(configFile, limit=None, processes=None, outputPrefix=_comparisonPrefix):
+  """
+  Compares the levels of theory defined in the configuration file: reads them in in parallel, matches the 
+  structures by their hashkeys and saves the rank correlation matrices and the plots.
+  
+  Returns success, error.
+  
+  """
+  
+  success, error, theories = readConfig(configFile, limit=limit)
+  
+  if not success:
+    return success, error
+  
+  labels = []
+  hashkeyEnergies = []
+  
+  for theory, (successS, errorS, mSimulationResult) in zip(theories, readAllStructuresData(theories, processes)):
+    if not successS:
+      print ("Level of theory '%s' is skipped: %s" % (theory["label"], errorS))
+      continue
+    
+    print ("%s: %d structures" % (theory["label"], mSimulationResult.structCnt))
+    
+    labels.append(theory["label"])
+    hashkeyEnergies.append(getHashkeyEnergies(mSimulationResult))
+  
+  if len(labels) < 2:
+    return False, "Less than two levels of theory have been read in"
+  
+  spearman, kendall, common = rankCorrelations(hashkeyEnergies)
+  
+  saveMatrix("%s_Spearman.csv" % (outputPrefix), labels, spearman)
+  saveMatrix("%s_Kendall.csv" % (outputPrefix), labels, kendall)
+  saveMatrix("%s_Common.csv" % (outputPrefix), labels, common, valueFormat="%d")
+  
+  plotLandscapes(labels, hashkeyEnergies, "%s.png" % (outputPrefix))
+  
+  plotCorrelationMatrix(labels, spearman, "Spearman", "%s_Spearman.png" % (outputPrefix))
+  plotCorrelationMatrix(labels, kendall, "Kendall", "%s_Kendall.png" % (outputPrefix))
+  
+  return True, ""
+  
 if __name__ == "__main__":
   
+  options, _ = cmd_line_args()
+  
+  # comparison of the levels of theory defined in the configuration file
+  if options.config is not None:
+    success, error = compareLandscapes(options.config, limit=options.limit, processes=options.processes, 
+                                       outputPrefix=options.output)
+    
+    if not success:
+      print error
+      sys.exit(1)
+    
+    sys.exit(0)
+  
   # reading the data1
-  success, error, mSimulationResult1 = readStructuresData(theory1Path, theory1Limit, theory1Type, theory1Format)
+  success, error, mSimulationResult1 = readStructuresData(theory1Path, getStructureLimit(theory1Limit, options.limit), 
+                                                          theory1Type, theory1Format)
   
   if not success:
     print error
   
   # reading the data2
-  success, error, mSimulationResult2 = readStructuresData(theory2Path, theory2Limit, theory2Type, theory2Format)
+  success, error, mSimulationResult2 = readStructuresData(theory2Path, getStructureLimit(theory2Limit, options.limit), 
+                                                          theory2Type, theory2Format)
   
   if not success:
     print error
     
   # reading the data3
-  success, error, mSimulationResult3 = readStructuresData(theory3Path, theory3Limit, theory3Type, theory3Format)
+  success, error, mSimulationResult3 = readStructuresData(theory3Path, getStructureLimit(theory3Limit, options.limit), 
+                                                          theory3Type, theory3Format)
   
   if not success:
     print error
     
   # reading the data4
-  success, error, mSimulationResult4 = readStructuresData(theory4Path, theory4Limit, theory4Type, theory4Format)
+  success, error, mSimulationResult4 = readStructuresData(theory4Path, getStructureLimit(theory4Limit, options.limit), 
+                                                          theory4Type, theory4Format)
     
   if not success:
     print error
@@ -1,22 +1,32 @@
 #!/usr/bin/env python
 
 """
-A script to convert files. Works with XYZ, CAR, and GIN formats.
+A script to convert files. Works with XYZ, CAR, GIN and FHI-aims output (input only) formats.
+
+In the batch mode the files of a directory (recursively with -r) are converted in parallel. The files which
+already have an up to date (newer than the source) output file are skipped.
 
 @author Tomas Lazauskas, 2016
 @web www.lazauskas.net
 @email tomas.lazauskas[a]gmail.com
 """
 
-import glob
 import os
 import sys
-import numpy as np
+import time
 from optparse import OptionParser
 
-import source.Atoms as Atoms
 import source.IO as IO
 import source.Fhiaims as Fhiaims
+import source.Utilities as Utilities
+from source.Messages import log
+
+# verbose level: 0 - off, 1 - on
+_verbose = 1
+
+# supported formats
+_inputFormats = [".xyz", ".car", ".gin", ".out", ".output"]
+_outputFormats = [".xyz", ".car", ".gin", ".in"]
 
 def cmdLineArgs():
   """
@@ -24,17 +34,33 @@ def cmdLineArgs():
   
   """
   
-  usage = "usage: %prog inputFile outputFile"
+  usage = "usage: %prog [options] inputFile outputFile [controlFile]\n" + \
+          "       %prog [options] .inputExtension .outputExtension [controlFile]"
   
   parser = OptionParser(usage=usage)
-
+  
+  parser.add_option("-i", "--input_dir", dest="input_dir", default=".",
+    help="Directory of the files to convert in the batch mode (extensions as arguments). Default = .")
+  
+  parser.add_option("-o", "--output_dir", dest="output_dir", default=None,
+    help="Directory of the converted files (the input directory tree is mirrored). Default: next to the sources")
+  
+  parser.add_option("-r", "--recursive", dest="recursive", action="store_true", default=False,
+    help="Walk the input directory tree")
+  
+  parser.add_option("-f", "--force", dest="force", action="store_true", default=False,
+    help="Convert the files even if the output files are up to date")
+  
+  parser.add_option("-n", "--processes", dest="processes", default=None, type="int",
+    help="Number of worker processes in the batch mode. Default: number of CPUs")
+  
   parser.disable_interspersed_args()
-      
+  
   (options, args) = parser.parse_args()
-
-  if (len(args) < 2 and len(args) > 3):
+  
+  if (len(args) < 2 or len(args) > 3):
     parser.error("incorrect number of arguments")
-
+  
   return options, args
 
 def convertFile(cluster, outFile, controlFile=None):
@@ -50,28 +76,165 @@ def convertFile(cluster, outFile, controlFile=None):
   
   if outFile.endswith(".xyz"):
     success, error = IO.writeXYZ(cluster, outFile)
-    
+  
   elif outFile.endswith(".car"):
     success, error = IO.writeCAR(cluster, outFile)
-    
+  
   elif outFile.endswith(".gin"):
     success, error = IO.writeGIN(cluster, outFile, controlFile=controlFile, outputXYZ=False)
-    
+  
   elif outFile.endswith(".in"):
     success, error = IO.writeAimsGeometry(cluster, outFile)
   
   else:
     error = "Undefined output format"
     success = False
-    
+  
   return success, error
+
+def getExtension(fileName):
+  """
+  Returns the extension of a file name or of an extension (.xyz) argument.
+  
+  """
+  
+  if fileName.startswith(".") and (fileName.count(".") == 1):
+    return fileName
+  
+  return os.path.splitext(fileName)[1]
+
+def getInputFiles(inputDir, extension, recursive=False):
+  """
+  Returns the sorted list of files with the extension in the directory (and its subdirectories).
+  
+  """
+  
+  fileList = IO.find_files(inputDir, extension=extension.lstrip("."), max_depth=None if recursive else 0)
+  
+  return fileList
+
+def getOutputFile(inputFile, outExtension, inputDir, outputDir=None):
+  """
+  Returns the output file of an input file: the same name with the output extension, next to the input file
+  or in the mirrored directory tree of the output directory.
+  
+  """
+  
+  outputFile = os.path.splitext(inputFile)[0] + outExtension
+  
+  if outputDir is not None:
+    outputFile = os.path.join(outputDir, os.path.relpath(outputFile, inputDir))
+  
+  return outputFile
+
+def isUpToDate(inputFile, outputFile):
+  """
+  Checks whether the output file exists and is not older than the input file.
+  
+  """
+  
+  try:
+    return os.path.getmtime(outputFile) >= os.path.getmtime(inputFile)
+  
+  except OSError:
+    return False
+
+def convertFileStar(args):
+  """
+  Reads in a file and saves it in the output format (a worker of the batch mode).
+  
+  Returns success, error.
+  
+  """
+  
+  inputFile, outputFile, controlFile = args
+  
+  try:
+    cluster, error = IO.readSystemFromFile(inputFile)
+    
+    if cluster is None:
+      return False, "System cannot be read from file: %s %s" % (inputFile, error)
+    
+    return convertFile(cluster, outputFile, controlFile)
+  
+  except Exception as e:
+    return False, "%s: %s" % (inputFile, e)
+
+def batchConvert(inputDir, inExtension, outExtension, controlFile=None, outputDir=None, recursive=False,
+                 processes=None, force=False):
+  """
+  Converts the files of a directory in a process pool (processes=None uses all cores). The files with an up to
+  date output file are skipped unless force is set.
+  
+  Returns success, error, (number of converted, skipped and failed files).
+  
+  """
+  
+  success = True
+  error = ""
+  
+  timeStart = time.time()
+  
+  if inExtension not in _inputFormats:
+    return False, "Unsupported input format: %s" % (inExtension), (0, 0, 0)
+  
+  if outExtension not in _outputFormats:
+    return False, "Unsupported output format: %s" % (outExtension), (0, 0, 0)
+  
+  if not os.path.isdir(inputDir):
+    return False, "Directory does not exist: %s" % (inputDir), (0, 0, 0)
+  
+  # the template is read relative to the workers' working directory
+  if controlFile is not None:
+    controlFile = os.path.abspath(controlFile)
+  
+  inputFiles = getInputFiles(inputDir, inExtension, recursive=recursive)
+  
+  args = []
+  skippedCnt = 0
+  
+  for inputFile in inputFiles:
+    outputFile = os.path.abspath(getOutputFile(inputFile, outExtension, inputDir, outputDir))
+    
+    if (not force) and isUpToDate(inputFile, outputFile):
+      skippedCnt += 1
+      continue
+    
+    outputFileDir = os.path.dirname(outputFile)
+    
+    if not os.path.isdir(outputFileDir):
+      os.makedirs(outputFileDir)
     
+    args.append((os.path.abspath(inputFile), outputFile, controlFile))
+  
+  results = Utilities.pool_map(convertFileStar, args, processes)
+  
+  failedCnt = 0
+  
+  for (successS, errorS) in results:
+    if not successS:
+      failedCnt += 1
+      
+      if success:
+        success = False
+        error = errorS
+  
+  convertedCnt = len(args) - failedCnt
+  
+  timeTaken = time.time() - timeStart
+  
+  message = "Converted %d files (%d skipped, %d failed) in %.2f s (%.1f files/s)" % (convertedCnt, skippedCnt,
+    failedCnt, timeTaken, convertedCnt / max(timeTaken, 1e-6))
+  log(__name__, message, verbose=_verbose)
+  
+  return success, error, (convertedCnt, skippedCnt, failedCnt)
+
 if __name__ == "__main__":
   
   ok = 1
   error = ""
   
-  _, args = cmdLineArgs()
+  options, args = cmdLineArgs()
   
   inFileName = args[0]
   outFileName = args[1]
@@ -80,52 +243,25 @@ if __name__ == "__main__":
     controlFile = args[2]
   else:
     controlFile = None
-    
-#   if inFileName[-3:] == outFileName[-3:]:
-#     sys.exit("Formats must differ!")
-  
-  if inFileName == ".gin":
-    fileList = glob.glob("*.gin")
-      
-    for fileName in fileList:
-      cluster, error = IO.readSystemFromFileGIN(fileName)
-        
-      outputFile = fileName[:-3] + outFileName[-3:]
-      
-      ok, error = convertFile(cluster, outputFile, controlFile)
   
-  elif inFileName == ".car":
-    fileList = glob.glob("*.car")
+  # batch mode: the arguments are the extensions
+  if inFileName in _inputFormats:
+    ok, error, _ = batchConvert(options.input_dir, inFileName, getExtension(outFileName), controlFile=controlFile,
+                                outputDir=options.output_dir, recursive=options.recursive,
+                                processes=options.processes, force=options.force)
     
-    for fileName in fileList:
-            
-      cluster = IO.readSystemFromFileCAR(fileName)
-       
-      outputFile = fileName[:-3] + outFileName[-3:]
-      
-      ok, error = convertFile(cluster, outputFile, controlFile)
+    if ok:
+      print ("Finished!")
+    
+    else:
+      print ("Error: ", error)
+      sys.exit(1)
   
-  elif inFileName == ".xyz":
-    fileList = glob.glob("*.xyz")
-        
-    for fileName in fileList:
-      cluster = IO.readSystemFromFileXYZ(fileName)
-      
-      if outFileName.endswith(".in"):
-        outputFile = fileName[:-3] + outFileName[-2:]
-      else:
-        outputFile = fileName[:-3] + outFileName[-3:]
-            
-      ok, error = convertFile(cluster, outputFile, controlFile)
-  
-  elif inFileName == ".output":
-     print ("Not implemented yet.")
-     
   else:
     
     if inFileName.endswith(".xyz"):
       cluster = IO.readSystemFromFileXYZ(inFileName)
-      
+    
     elif inFileName.endswith(".car"):
       cluster = IO.readSystemFromFileCAR(inFileName)
     
@@ -134,12 +270,12 @@ if __name__ == "__main__":
     
     # FHI-aims output file
     elif (inFileName.endswith(".out") or inFileName.endswith(".output")):
-      _, _, cluster = Fhiaims._readAimsStructure("geometry.in", inFileName)     
-     
+      _, _, cluster = Fhiaims._readAimsStructure("geometry.in", inFileName)
+    
     else:
       print ("Unrecognised input file ", inFileName, " format")
       sys.exit()
-      
+    
     ok, error = convertFile(cluster, outFileName, controlFile)
     
     if ok:
@@ -147,4 +283,3 @@ if __name__ == "__main__":
     
     else:
       print ("Error: ", error)
-      
\ No newline at end of file
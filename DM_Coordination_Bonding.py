@@ -10,9 +10,9 @@ A script to analyse systems (xyz format) in terms of avg. bond distance and coor
 """
 
 import copy
-import math
 import os
 import sys
+import time
 
 import numpy as np
 from optparse import OptionParser
@@ -23,86 +23,97 @@ import Atoms as Atoms
 import IO as IO
 import System as System
 import Utilities as Utilities
+
+# batch mode output file
+_batchOutputFile = "Coordination.csv"
             
 class Connectivity(object):
   """
   A class to determine the connectivity of the system
   
+  The bonds are stored as arrays (bondAtoms1[B], bondAtoms2[B], bondDistances[B]) and all the 
+  coordination statistics are reduced from them.
+  
   """
   
   def __init__(self, system, superCell, minRadius, maxRadius):
     """
     Initializes the class.
     
+    superCell: cell dimensions to be used with periodic boundary conditions, if None
+               the cell dimensions and the PBC flags of the system are used.
+    
     """
     
     self._error = 0
-    self.vertices = []
+    self._errMsg = ""
     
     self.nVert = system.NAtoms
     
     self.nTotVertColors = len(system.specieList)
     self.vertColors = copy.copy(system.specieList)
-    
-    self.__createVertices(system)
+    self.vertColorIdx = np.asarray(system.specie[:self.nVert], dtype=np.int32)
     
     self.__getConnectivity(system, superCell, minRadius, maxRadius)
     
-  def __createVertices(self, system):
-    """
-    Creates vertices according to every atom in the system
-    
-    """
-    
-    for i in range(system.NAtoms):
-      
-      vertex = Vertex(i, system.specie[i], self.nTotVertColors)
-      
-      self.vertices.append(vertex)
+    self.__reduceConnectivity()
   
   def __getConnectivity(self, system, superCell, minRadius, maxRadius):
     """
-    Determines the connectivity of a system
+    Determines the connectivity of a system using a neighbour list
     
     """
     
-    minRadiusSq = minRadius * minRadius
-    maxRadiusSq = maxRadius * maxRadius
-     
-    for i in range(system.NAtoms-1):
-      for j in range(i+1, system.NAtoms):
-
-        distSq = Utilities.distanceSq(system.pos[3*i+0], system.pos[3*i+1], system.pos[3*i+2],
-                                      system.pos[3*j+0], system.pos[3*j+1], system.pos[3*j+2])
-        
-        if distSq > minRadiusSq and distSq < maxRadiusSq:
-          
-          iAtomColor = system.specie[i]
-          jAtomColor = system.specie[j]
-          
-          self.__updateVertConnect(i, jAtomColor, distSq)
-          self.__updateVertConnect(j, iAtomColor, distSq)
-  
     if superCell is not None:
-      
-      self._errMsg = "PBC are not implemented yet"
+      cellDims = np.asarray(superCell, dtype=np.float64)
+      PBC = np.ones(3, np.int32)
+    
+    else:
+      cellDims = system.cellDims
+      PBC = system.PBC
+    
+    if np.any((np.asarray(PBC) == 1) & (cellDims <= 0.0)):
+      self._errMsg = ": cell dimensions must be positive to use PBC"
       self._error = True
+      
+      PBC = np.zeros(3, np.int32)
+    
+    self.bondAtoms1, self.bondAtoms2, self.bondDistances = Utilities.neighbour_list(
+      system.pos[:3*self.nVert], cellDims, PBC, maxRadius, minRadius=minRadius)
   
-  def __updateVertConnect(self, vertIdx, connColor, distSq):
+  def __reduceConnectivity(self):
     """
-    If two vertices are connected - update their information
+    Reduces the bond arrays to the coordination numbers and the bond distance sums
     
     """
     
-    vertex = self.vertices[vertIdx]
+    nVert = self.nVert
+    nColors = self.nTotVertColors
     
-    if vertex.vertAtomIdx != vertIdx:
-      
-      self._errMsg = ": indexes must match!"
-      self._error = True
+    colors1 = self.vertColorIdx[self.bondAtoms1]
+    colors2 = self.vertColorIdx[self.bondAtoms2]
+    
+    # coordination of every atom by the neighbour's colour (atom type)
+    self.vertConnectColors = np.zeros([nVert, nColors], np.int32)
+    np.add.at(self.vertConnectColors, (self.bondAtoms1, colors2), 1)
+    np.add.at(self.vertConnectColors, (self.bondAtoms2, colors1), 1)
+    
+    self.vertConnectColorsDist = np.zeros([nVert, nColors], np.float64)
+    np.add.at(self.vertConnectColorsDist, (self.bondAtoms1, colors2), self.bondDistances)
+    np.add.at(self.vertConnectColorsDist, (self.bondAtoms2, colors1), self.bondDistances)
+    
+    self.coordNumbers = (np.bincount(self.bondAtoms1, minlength=nVert) + 
+                         np.bincount(self.bondAtoms2, minlength=nVert)).astype(np.int32)
     
-    vertex.vertConnectColors[connColor] += 1
-    vertex.vertConnectColorsDist[connColor] += math.sqrt(distSq)
+    # bonds by the colour pair (upper triangle)
+    pairIdx1 = np.minimum(colors1, colors2)
+    pairIdx2 = np.maximum(colors1, colors2)
+    
+    self.pairBondCnt = np.zeros([nColors, nColors], np.int32)
+    np.add.at(self.pairBondCnt, (pairIdx1, pairIdx2), 1)
+    
+    self.pairBondDist = np.zeros([nColors, nColors], np.float64)
+    np.add.at(self.pairBondDist, (pairIdx1, pairIdx2), self.bondDistances)
   
   def avgCoordNumber(self):
     """
@@ -110,17 +121,8 @@ class Connectivity(object):
     
     """
     
-    sumCoord = 0.0
-    
-    for i in range(self.nVert):
-      vertex = self.vertices[i]
-            
-      vertCoord = vertex.getCoordNumber()
-  
-      sumCoord += vertCoord
-    
     if (self.nVert > 0):
-      avgCoord = sumCoord / self.nVert
+      avgCoord = np.sum(self.coordNumbers) / float(self.nVert)
     else:
       avgCoord = 0.0
     
@@ -134,26 +136,17 @@ class Connectivity(object):
   
     specieCoord = {}
     
+    vertCnt = np.bincount(self.vertColorIdx, minlength=self.nTotVertColors)
+    vertSumCoor = np.bincount(self.vertColorIdx, weights=self.coordNumbers, minlength=self.nTotVertColors)
+    
     for i in range(self.nTotVertColors):
       
-      vertCnt = 0.0
-      vertSumCoor = 0.0
+      if vertCnt[i] > 0:
+        avgCoord = vertSumCoor[i] / float(vertCnt[i])
+      else:
+        avgCoord = 0.0
       
-      vertColor = self.vertColors[i]
-      
-      for j in range(self.nVert):
-        vertex = self.vertices[j]
-        
-        if (self.vertColors[vertex.vertColorIdx] == vertColor):
-          vertCnt += 1.0
-          vertSumCoor += vertex.getCoordNumber()
-        
-        if vertCnt > 0.0:
-          avgCoord = vertSumCoor / vertCnt
-        else:
-          avgCoord = 0.0
-        
-        specieCoord[vertColor] = avgCoord
+      specieCoord[self.vertColors[i]] = avgCoord
       
     return specieCoord
   
@@ -164,33 +157,16 @@ class Connectivity(object):
     """
     
     bondDist = {}
-    bondCnt = {}
     
-    # creating dictionaries
     for i in range(self.nTotVertColors):
       for j in range(i, self.nTotVertColors):
-        bondDist["%s-%s" % (self.vertColors[i], self.vertColors[j])] = 0.0 
-        bondCnt["%s-%s" % (self.vertColors[i], self.vertColors[j])] = 0.0
-    
-    # summing the bond distances and counting them 
-    for i in range(self.nVert):
-      vertex = self.vertices[i]
-      
-      for j in range(self.nTotVertColors):
-        try:
-          bondDist["%s-%s" % (self.vertColors[j], self.vertColors[vertex.vertColorIdx])] += vertex.vertConnectColorsDist[j]
-          bondCnt["%s-%s" % (self.vertColors[j], self.vertColors[vertex.vertColorIdx])] += vertex.vertConnectColors[j]
-          
-        except:
-          bondDist["%s-%s" % (self.vertColors[vertex.vertColorIdx], self.vertColors[j])] += vertex.vertConnectColorsDist[j]
-          bondCnt["%s-%s" % (self.vertColors[vertex.vertColorIdx], self.vertColors[j])] += vertex.vertConnectColors[j]
-    
-    # calculating averages
-    for i in range(self.nTotVertColors):
-      for j in range(i, self.nTotVertColors):
-
-        if bondDist["%s-%s" % (self.vertColors[i], self.vertColors[j])] != 0.0:
-          bondDist["%s-%s" % (self.vertColors[i], self.vertColors[j])] /= bondCnt["%s-%s" % (self.vertColors[i], self.vertColors[j])]
+        
+        if self.pairBondCnt[i][j] > 0:
+          avgDist = self.pairBondDist[i][j] / self.pairBondCnt[i][j]
+        else:
+          avgDist = 0.0
+        
+        bondDist["-".join(sorted((self.vertColors[i], self.vertColors[j])))] = avgDist
         
     return bondDist
   
@@ -200,19 +176,11 @@ class Connectivity(object):
     
     """
     
-    maxCoord = 0.0
-    noOccur = 0
+    if self.nVert == 0:
+      return 0.0, 0
     
-    for i in range(self.nVert):
-      vertex = self.vertices[i]
-      vertCoord = vertex.getCoordNumber()
-  
-      if (vertCoord > maxCoord):
-        maxCoord = vertCoord
-        noOccur = 1
-        
-      elif (vertCoord == maxCoord):
-        noOccur += 1
+    maxCoord = np.max(self.coordNumbers)
+    noOccur = np.count_nonzero(self.coordNumbers == maxCoord)
     
     return maxCoord, noOccur
   
@@ -222,19 +190,11 @@ class Connectivity(object):
     
     """
     
-    minCoord = 10**3
-    noOccur = 0
+    if self.nVert == 0:
+      return 10**3, 0
     
-    for i in range(self.nVert):
-      vertex = self.vertices[i]
-      vertCoord = vertex.getCoordNumber()
-  
-      if (vertCoord < minCoord):
-        minCoord = vertCoord
-        noOccur = 1
-        
-      elif (vertCoord == minCoord):
-        noOccur += 1
+    minCoord = np.min(self.coordNumbers)
+    noOccur = np.count_nonzero(self.coordNumbers == minCoord)
     
     return minCoord, noOccur
   
@@ -244,42 +204,117 @@ class Connectivity(object):
     
     """
     
-    vertCoord = np.zeros(self.nVert, np.float32)
-    
-    for i in range(self.nVert):
-      vertex = self.vertices[i]
-            
-      vertCoord[i] = vertex.getCoordNumber()
-        
-    return np.std(vertCoord)
-    
-class Vertex(object):
+    return np.std(self.coordNumbers.astype(np.float32))
+
+def analyseFile(fileName, minRadius, maxRadius):
   """
-  A class to save the data about a vertex
+  Reads in a system and returns its coordination and bonding descriptors
   
   """
   
-  def __init__(self, vertAtomIdx, vertColorIdx, totAtomSpecieCount):
-    """
-    Initiates the vertex class
-    
-    """
-    
-    self._error = False
-    self._errMsg = ""
+  try:
+    system, error = IO.readSystemFromFile(fileName)
+  
+  except:
+    system = None
+    error = "cannot read in the file"
+  
+  if system is None:
+    return fileName, None, error
+  
+  connO = Connectivity(system, None, minRadius, maxRadius)
+  
+  if connO._error:
+    return fileName, None, connO._errMsg
+  
+  minCoord, _ = connO.minCoordNumber()
+  maxCoord, _ = connO.maxCoordNumber()
+  
+  pairCnt = {}
+  for i in range(connO.nTotVertColors):
+    for j in range(i, connO.nTotVertColors):
+      pairCnt["-".join(sorted((connO.vertColors[i], connO.vertColors[j])))] = int(connO.pairBondCnt[i][j])
+  
+  descriptors = {"name" : system.name,
+                 "NAtoms" : system.NAtoms,
+                 "avgCoord" : connO.avgCoordNumber(),
+                 "minCoord" : minCoord,
+                 "maxCoord" : maxCoord,
+                 "stdCoord" : connO.stdCoordination(),
+                 "bondDist" : connO.avgBondDistance(),
+                 "bondCnt" : pairCnt}
+  
+  return fileName, descriptors, ""
+
+def _analyseFileStar(args):
+  """
+  Unpacks the arguments for the worker pool
+  
+  """
+  
+  return analyseFile(*args)
+
+def analyseDirectory(dirPath, extension, minRadius, maxRadius, outputFile=_batchOutputFile, processes=None):
+  """
+  Analyses all the systems in a directory (recursively) in a worker pool and saves the per-structure 
+  descriptors into one csv file. Only the descriptors are kept in memory: the file is written once all the 
+  structures are analysed as its columns depend on the bond pairs found in all of them.
+  
+  """
+  
+  fileList = []
+  for root, _, files in os.walk(dirPath):
+    for fileName in files:
+      if fileName.endswith(".%s" % (extension)):
+        fileList.append(os.path.join(root, fileName))
+  
+  fileList.sort()
+  filesCnt = len(fileList)
+  
+  timeStart = time.time()
+  
+  results = []
+  tasks = [(fileName, minRadius, maxRadius) for fileName in fileList]
+  
+  for result in Utilities.pool_imap(_analyseFileStar, tasks, processes, chunksize=16):
+    results.append(result)
     
-    self.vertAtomIdx = vertAtomIdx
-    self.vertColorIdx = vertColorIdx
-    self.vertConnectColors = np.zeros(totAtomSpecieCount, np.int32)
-    self.vertConnectColorsDist = np.zeros(totAtomSpecieCount, np.float64)
+    if (len(results) % 1000 == 0):
+      print "Analysed %d/%d" % (len(results), filesCnt)
   
-  def getCoordNumber(self):
-    """
-    Gets the coordination number of an atom
+  # all bond pairs found in the structures
+  pairs = set()
+  for _, descriptors, _ in results:
+    if descriptors is not None:
+      pairs.update(descriptors["bondDist"].keys())
+  
+  pairs = sorted(pairs)
+  
+  f = open(outputFile, "w")
+  
+  f.write("System,File,NAtoms,AvgCoord,MinCoord,MaxCoord,StdCoord")
+  for pair in pairs:
+    f.write(",%s_AvgDist,%s_Cnt" % (pair, pair))
+  f.write("\n")
+  
+  analysedCnt = 0
+  for fileName, descriptors, error in results:
+    if descriptors is None:
+      print "Error analysing [%s]: %s" % (fileName, error)
+      continue
     
-    """
+    f.write("%s,%s,%d,%f,%d,%d,%f" % (descriptors["name"], fileName, descriptors["NAtoms"], descriptors["avgCoord"],
+                                      descriptors["minCoord"], descriptors["maxCoord"], descriptors["stdCoord"]))
+    
+    for pair in pairs:
+      f.write(",%f,%d" % (descriptors["bondDist"].get(pair, 0.0), descriptors["bondCnt"].get(pair, 0)))
     
-    return np.sum(self.vertConnectColors)
+    f.write("\n")
+    analysedCnt += 1
+  
+  f.close()
+  
+  print "Analysed %d/%d structures in %.2f s. Saved: %s" % (analysedCnt, filesCnt, time.time() - timeStart, outputFile)
 
 def cmdLineArgs():
   """
@@ -287,9 +322,21 @@ def cmdLineArgs():
   
   """
   
-  usage = "usage: %prog inputFile minRadius maxRadius"
+  usage = "usage: %prog [options] inputFile minRadius maxRadius"
   
   parser = OptionParser(usage=usage)
+  
+  parser.add_option("-b", "--batch", dest="batch", action="store_true", default=False, 
+    help="inputFile is a directory: analyses all the structures in it (recursively) and saves the descriptors into a csv file")
+  
+  parser.add_option("-e", "--extension", dest="extension", default="xyz", 
+    help="Extension of the structure files in the batch mode (default xyz)")
+  
+  parser.add_option("-n", "--processes", dest="processes", default=None, type="int", 
+    help="Number of worker processes in the batch mode (default: number of CPUs)")
+  
+  parser.add_option("-o", "--output", dest="output", default=_batchOutputFile, 
+    help="Output file of the batch mode (default %s)" % (_batchOutputFile))
 
   parser.disable_interspersed_args()
       
@@ -302,17 +349,28 @@ def cmdLineArgs():
 
 if __name__ == "__main__":
   
-  _, args = cmdLineArgs()
+  options, args = cmdLineArgs()
   
   fileName = args[0]
   minRadius = float(args[1])
   maxRadius = float(args[2])
   
+  if options.batch:
+    print "Analysing directory: ", fileName
+    print "Analysis radius: ", minRadius, "-", maxRadius
+    
+    analyseDirectory(fileName, options.extension, minRadius, maxRadius, outputFile=options.output, 
+                     processes=options.processes)
+    
+    print "Finished."
+    sys.exit(0)
+  
   print "Reading: ", fileName
   print "Analysis radius: ", minRadius, "-", maxRadius
   
   system = IO.readSystemFromFileXYZ(fileName)
   
+  # PBC are applied if the cell dimensions are given in the xyz file
   connO = Connectivity(system, None, minRadius, maxRadius)
   
   if connO._error:
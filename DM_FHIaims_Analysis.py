@@ -3,28 +3,38 @@
 """
 A script to analyse FHI-aims simulations
 
+The read in simulations and their hashkeys are recorded in a manifest, hence a rerun reads in only the new or
+finished (modified) simulations. The listing of the directories is cached too, only the output files are
+checked for changes.
+
 @author Tomas Lazauskas, 2016
 @web www.lazauskas.net
 @email tomas.lazauskas[a]gmail.com
 
 """
 
-import copy
+import functools
 import os
+import shutil
 import sys
 
 import numpy as np
 from optparse import OptionParser
 
-import source.Atoms as Atoms
 import source.Fhiaims as FHIaims
 import source.IO as IO
+import source.Manifest as Manifest
+import source.System as System
 
 _fhiaimsGeometryFile = "geometry.in"
 _fhiaimsOutFile = "fhiAims.out"
 _outputDir = "output"
 _topDir = "tops"
 _uniqueDir = "unique"
+_manifestFile = "manifest.db"
+_filesManifestFile = "files.json"
+
+_hashkeyRadius = 2.8
 
 def cmd_line_args():
   """
@@ -38,6 +48,15 @@ def cmd_line_args():
     
   parser.add_option("-s", "--single", dest="single", action="store_true", default=False, 
     help="Whether geometry relaxation was used.")
+  
+  parser.add_option("-m", "--manifest", dest="manifest", default=_manifestFile, 
+    help="Manifest of the read in simulations. Default = %s" % (_manifestFile))
+  
+  parser.add_option("-r", "--rebuild", dest="rebuild", action="store_true", default=False, 
+    help="Discard the manifest and read in all the simulations again")
+  
+  parser.add_option("-n", "--processes", dest="processes", default=None, type="int", 
+    help="Number of worker processes reading in the simulations. Default: number of CPUs")
     
   parser.disable_interspersed_args()
       
@@ -52,15 +71,33 @@ def getFileList(dirPath=None):
   """
     
   dirList = []
-
-  for root, _, files in os.walk("./"):
-    for fileName in files:
-      if fileName == _fhiaimsOutFile:
-        
-        dirList.append(os.path.join(root[2:]))
+  
+  for filePath in IO.iter_files(".", extension="out", prefix=_fhiaimsOutFile[:-4]):
+    if os.path.basename(filePath) == _fhiaimsOutFile:
+      
+      dirList.append(os.path.dirname(filePath)[2:])
     
   return dirList
 
+def findOutputFiles(filesManifest):
+  """
+  Looks for the fhiaims output files using the cached listing of the directories. The output files are appended
+  in place, hence all of them are checked for changes.
+  
+  Returns the output files and the ones which have changed since the last run (relative paths).
+  
+  """
+  
+  entries, changedFiles = filesManifest.scan(".", extension="out", prefix=_fhiaimsOutFile[:-4], verify=True)
+  
+  outFiles = [os.path.relpath(filePath) for filePath, _, _ in entries 
+              if os.path.basename(filePath) == _fhiaimsOutFile]
+  
+  changedFiles = [os.path.relpath(filePath) for filePath in changedFiles 
+                  if os.path.basename(filePath) == _fhiaimsOutFile]
+  
+  return outFiles, changedFiles
+
 def generateStatistics(systemlist, unique=False):
   """
   Generates statistics about the FHI-aims simulations
@@ -108,6 +145,32 @@ def generateStatistics(systemlist, unique=False):
   print ("Max run time: ", np.max(runTimes))
   print ("Stdev run time: ", np.std(runTimes))
   
+def readFHIaimsSystem(outFile, single=False):
+  """
+  Reads in the FHI-aims system of the simulation's output file.
+  
+  Returns system (None on failure), error.
+  
+  """
+  
+  cwd = os.getcwd()
+  
+  dirName = os.path.dirname(os.path.abspath(outFile))
+  
+  os.chdir(dirName)
+  
+  success, error, system = FHIaims._readAimsStructure(_fhiaimsGeometryFile, os.path.basename(outFile), 
+                                                      relaxed=(not single))
+  
+  os.chdir(cwd)
+  
+  if not success:
+    return None, error
+  
+  system.name = os.path.basename(dirName)
+  
+  return system, error
+
 def readFHIaimsSystems(fhiaimsDirs, single=False):
   """
   Reads in the FHI-aims systems.
@@ -122,84 +185,74 @@ def readFHIaimsSystems(fhiaimsDirs, single=False):
     
     if (cnt % 10 == 0): print ("Reading %d/%d" % (cnt+1, totalCnt))
     
-    cwd = os.getcwd()
-    
-    os.chdir(dirName)
-    #systemName = dirName[len(_outputDir)+1:-2].strip()
+    system, error = readFHIaimsSystem(os.path.join(dirName, _fhiaimsOutFile), single=single)
     
-    nameArray = (dirName.strip()).split("/")
-    nameArrayLen = len(nameArray)
-    systemName = nameArray[nameArrayLen-1]
-   
-    success, error, system = FHIaims._readAimsStructure(_fhiaimsGeometryFile, _fhiaimsOutFile, relaxed=(not single))
-    
-    if success:
-      system.name = systemName
-      
+    if system is not None:
       systemsList.append(system)
     
     else:
-      print ("Error reading in [%s]: %s" % (systemName, error))
+      print ("Error reading in [%s]: %s" % (dirName, error))
     
-    os.chdir(cwd)
     cnt += 1
   
   return systemsList
 
-def saveFiles(systemsList):
+def saveFiles(systemsList, processes=None):
   """
   Saves systems as xyz files
   
   """
   
-  cwd = os.getcwd()
-    
-  os.system("rm -rf %s" % (_topDir))
-  os.system("rm -rf %s" % (_uniqueDir))
+  shutil.rmtree(_uniqueDir, ignore_errors=True)
   
   IO.checkDirectory(_uniqueDir, True)
   IO.checkDirectory(_topDir, True)
-  os.chdir(_topDir)
   
-  systemListLen = len(systemsList)
+  # the systems recorded by the previous runs keep their files and hashkeys
+  newSystems = [system for system in systemsList 
+                if (system.hashkey == "") or (not os.path.isfile(os.path.join(_topDir, "%s.xyz" % (system.name))))]
+  
+  for system in newSystems:
+    success_, error_ = IO.writeXYZ(system, os.path.join(_topDir, "%s.xyz" % (system.name)))
+  
+  #hashkeyRadius = 3.06
+  #hashkeyRadius = 2.6
+  System.calculate_hashkeys(newSystems, hashkeyRadius=_hashkeyRadius, processes=processes)
+  
+  for system in newSystems:
+    if system.hashkey is None:
+      system.hashkey = ""
   
-  uniquehashkeys = []
+  uniquehashkeys = set()
   uniqueSystems = []
   uniqueCnt = 0
-   
-  for i in range(systemListLen):
-    
-    nStr = "n%02d" % (systemsList[i].NAtoms)
-    
-    #fileName = "%s_%03d_%s.xyz" % (nStr, i+1, systemsList[i].name)
-    fileName = "%s.xyz" % (systemsList[i].name)
-        
-    success_, error_ = IO.writeXYZ(systemsList[i], fileName)
-    
-    hashkeyRadius = Atoms.getRadius(systemsList[i]) + 1.0
-    
-    hashkeyRadius = 2.8
-    #hashkeyRadius = 3.06
-    #hashkeyRadius = 2.6
+  
+  topFiles = set()
+  
+  # the systems are in the order of their energies, hence the unique ones are the same in every run
+  for system in systemsList:
     
-    cmdLine = "python ~/git/hkg/hkg.py %s %f" % (fileName, hashkeyRadius)
+    nStr = "n%02d" % (system.NAtoms)
     
-    hashkey = os.popen(cmdLine).read().strip()
+    fileName = "%s.xyz" % (system.name)
     
-    systemsList[i].hashkey = copy.deepcopy(hashkey)
+    topFiles.add(fileName)
     
-    # saving only uniques:
-    if not (hashkey in uniquehashkeys):
+    # saving only uniques (systems without a hashkey are unique):
+    if (system.hashkey == "") or (not (system.hashkey in uniquehashkeys)):
       uniqueCnt += 1
-      uniquehashkeys.append(hashkey)
+      uniquehashkeys.add(system.hashkey)
+      
+      uniqueSystems.append(system)
       
-      uniqueSystems.append(systemsList[i])
+      fileName2 = "%s_%03d_%s.xyz" % (nStr, uniqueCnt, system.name)
       
-      fileName2 = "%s_%03d_%s.xyz" % (nStr, uniqueCnt, systemsList[i].name)
-            
-      os.system("cp %s ../%s/%s" % (fileName, _uniqueDir, fileName2))
+      IO.linkFile(os.path.join(_topDir, fileName), os.path.join(_uniqueDir, fileName2))
   
-  os.chdir(cwd)
+  # removing the files of the systems which do not exist anymore
+  for fileName in os.listdir(_topDir):
+    if fileName.endswith(".xyz") and (fileName not in topFiles):
+      os.unlink(os.path.join(_topDir, fileName))
   
   return uniqueSystems
 
@@ -209,34 +262,42 @@ def sortSystems(systemsList):
   
   """
   
-  systemListLen = len(systemsList)
-  
-  for i in range(systemListLen):
-    for j in range(systemListLen):
-      if systemsList[i].totalEnergy < systemsList[j].totalEnergy:
-        tempSystem = copy.deepcopy(systemsList[i])
-        
-        systemsList[i] = copy.deepcopy(systemsList[j])
-        systemsList[j] = copy.deepcopy(tempSystem)
+  systemsList.sort(key=lambda system: system.totalEnergy)
   
 if __name__ == "__main__":
   
   # reading the command line arguments and options
   options, _ = cmd_line_args()
   
-  # looks for FHI-aims simulations in the output directory
-  fhiaimsDirs = getFileList()
-    
-  # reads in the FHI-aims systems
-  systems = readFHIaimsSystems(fhiaimsDirs, options.single)
+  manifest = Manifest.AnalysisManifest(options.manifest, params={"single" : options.single, 
+                                                                 "hashkeyRadius" : _hashkeyRadius})
   
-  # sort the systems according to energy
-  sortSystems(systems)
+  if options.rebuild:
+    manifest.clear()
+  
+  # looks for FHI-aims simulations
+  filesManifest = IO.FileManifest(os.path.join(os.path.dirname(options.manifest), _filesManifestFile))
+  
+  outFiles, changedFiles = findOutputFiles(filesManifest)
+  
+  # reads in the new and finished FHI-aims systems
+  readCnt, failedCnt, removedCnt = manifest.sync(outFiles, functools.partial(readFHIaimsSystem, single=options.single), 
+                                                 processes=options.processes, changedPaths=changedFiles)
+  
+  filesManifest.save()
+  
+  print ("Read in %d new or modified simulations (%d failed), %d removed" % (readCnt, failedCnt, removedCnt))
+  
+  # the systems are sorted according to energy
+  systems = manifest.systems()
   
   # save files
-  uniqueSystems = saveFiles(systems)
+  uniqueSystems = saveFiles(systems, processes=options.processes)
   sortSystems(uniqueSystems)
   
+  manifest.save_hashkeys(systems)
+  manifest.close()
+  
   # generate statistics
   generateStatistics(systems)
   
@@ -10,6 +10,7 @@ import os
 from optparse import OptionParser
 
 import source.IO as IO
+import source.Jobs as Jobs
 import source.Messages as Messages
 from source.Messages import log
 
@@ -27,8 +28,10 @@ _aims_control = "control.in"
 _aims_geometry = "geometry.in"
 # default_initial_moment keyword in the control.in file
 _aims_keyword_def_ini_moment = "default_initial_moment"
-# fhiaims execution command (as an example)
-_aims_exe_cmd = "source /opt/intel/composer_xe_2015/mkl/bin/mklvars.sh intel64; mpirun -n 8 /Users/Tomas/Software/fhi-aims.160328/bin/aims.160328_1.mpi.x > fhiaims.out"
+# fhiaims execution command (as an example), {cores} is replaced by the number of cores per simulation
+_aims_exe_cmd = "source /opt/intel/composer_xe_2015/mkl/bin/mklvars.sh intel64; mpirun -n {cores} /Users/Tomas/Software/fhi-aims.160328/bin/aims.160328_1.mpi.x"
+# fhi-aims output file name
+_aims_output = "fhiaims.out"
 
 def cmd_line_args():
   """
@@ -52,6 +55,12 @@ def cmd_line_args():
   parser.add_option("-x", "--execute", dest="execute", action="store_true", default=False, 
     help="Executes the simulations")
   
+  parser.add_option("-j", "--jobs", dest="jobs", default=1, type="int",
+    help="Number of simulations to run at the same time. Default = 1")
+  
+  parser.add_option("-c", "--cores", dest="cores", default=8, type="int",
+    help="Number of cores per simulation. Default = 8")
+  
 #   parser.add_option("-l", "--analyse", dest="analyse", action="store_true", default=False, 
 #     help="Analyses the simulations")
   
@@ -61,62 +70,46 @@ def cmd_line_args():
   
   return options, args
 
-def execute():
+def execute(options):
   """
-  Executes the fhi-aims calculations
+  Executes the fhi-aims calculations. The simulations which have already finished are skipped (the state of
+  the simulations is saved in the jobs state file).
   
   """
   
-  main_dir_path = os.getcwd()
-  
   Messages.log(__name__, "Running the simulations in: %s" % (_output_directory))
   
-  dir_list = IO.get_dir_list(_aims_geometry)
+  dir_list = sorted(IO.get_dir_list(_aims_geometry))
   
-  cwd = os.getcwd()
+  runner = Jobs.JobRunner(_aims_exe_cmd, _aims_output, jobs=options.jobs, coresPerJob=options.cores)
   
-  dir_tot_str = str(len(dir_list))
-  dir_cnt = 1
+  success, error, (done_cnt, failed_cnt, skipped_cnt) = runner.run(dir_list)
   
-  for dir_path in dir_list:
-    
-    Messages.log(__name__, "%s/%s Executing FHI-aims in: %s " % (str(dir_cnt), dir_tot_str, dir_path), 1)
-    
-    os.chdir(dir_path)
-    
-    os.system(_aims_exe_cmd)
-    
-    os.chdir(cwd)
-    
-    dir_cnt += 1
+  if not success:
+    Messages.log(__name__, error, 1)
   
-  Messages.log(__name__, "Finished executing FHI-aims calculations")
+  Messages.log(__name__, "Finished executing FHI-aims calculations: %d done, %d failed, %d skipped" %
+               (done_cnt, failed_cnt, skipped_cnt))
     
-def prepare_control_file(ini_spin_value):
+def render_control_file(control_lines, ini_spin_value):
   """
-  Copies the control file and adjusts the "default_initial_moment"
+  Renders the control file template with the adjusted "default_initial_moment"
   
   """
   
-  aims_control_temp = "_%s" % (_aims_control)
+  out_lines = []
   
-  f_cntlr_in = open(_aims_control, "r")
-  f_cntlr_out = open(aims_control_temp, "w")
-    
-  for line in f_cntlr_in:
+  for line in control_lines:
     
     # change the default initial spin value
     if _aims_keyword_def_ini_moment in line:
-      f_cntlr_out.write("%s %s\n" % (_aims_keyword_def_ini_moment, str(ini_spin_value)))
+      out_lines.append("%s %s\n" % (_aims_keyword_def_ini_moment, str(ini_spin_value)))
       
     # write the rest of the lines as they are
     else:
-      f_cntlr_out.write(line)
-  
-  f_cntlr_in.close()
-  f_cntlr_out.close()
+      out_lines.append(line)
   
-  os.system("mv -f %s %s" % (aims_control_temp, _aims_control))
+  return "".join(out_lines)
   
 def prepare_directories(options):
   """
@@ -134,38 +127,42 @@ def prepare_directories(options):
 
 def prepare_spins(systems_list, options):
   """
-  Prepares simulation directories for the read systems
+  Prepares simulation directories for the read systems. The control file is rendered once per spin value and
+  every geometry file is written once: the simulation directories get hard links to them.
   
   """
-    
-  main_dir_path = os.getcwd()
   
   Messages.log(__name__, "Preparing the simulation files. The files will be saved in: %s" % (_output_directory))
   
   IO.checkDirectory(_output_directory, createMd=1)
-  os.chdir(_output_directory)
   
-  output_dir_path = os.getcwd()
+  f_cntlr_in = open(os.path.join(_input_directory, _aims_control), "r")
+  control_lines = f_cntlr_in.readlines()
+  f_cntlr_in.close()
   
   spins_from = options.spinfr
   spins_to = options.spinto
   
+  # system name -> the written geometry file
+  geometry_files = {}
+  
   for spin in range(int(spins_from), int(spins_to)+1):
     
     Messages.log(__name__, "Preparing: %s %s" % (_aims_keyword_def_ini_moment, str(spin)), 1)
     
     # creates directories for the systems
-    spin_dir_name = "%s%s" % (_output_prefix, str(spin))
-    IO.checkDirectory(spin_dir_name, createMd=1)
+    spin_dir_path = os.path.join(_output_directory, "%s%s" % (_output_prefix, str(spin)))
+    IO.checkDirectory(spin_dir_path, createMd=1)
     
-    os.chdir(spin_dir_name)
+    # the control.in file of the spin value
+    control_file = os.path.join(spin_dir_path, _aims_control)
     
-    # prepares control.in and geometry.in files
-    write_systems(systems_list, spin, main_dir_path)
+    f_cntlr_out = open(control_file, "w")
+    f_cntlr_out.write(render_control_file(control_lines, spin))
+    f_cntlr_out.close()
     
-    os.chdir(output_dir_path)
-      
-  os.chdir(main_dir_path)
+    # prepares control.in and geometry.in files
+    write_systems(systems_list, spin_dir_path, control_file, geometry_files)
   
 def read_systems(file_extension):
   """
@@ -193,31 +190,31 @@ def read_systems(file_extension):
   
   return systems_list
 
-def write_systems(systems_list, spin_file, main_dir_path):
+def write_systems(systems_list, spin_dir_path, control_file, geometry_files):
   """
-  Writing systems as geometry.in files and copy a control file to the system directory
+  Writing systems as geometry.in files (or linking the already written ones) and linking the control file
+  in the system directories
   
   """
   
-  cwd = os.getcwd()
-  
   for system in systems_list:
-    system_name = system.name
+    system_dir_path = os.path.join(spin_dir_path, system.name)
     
-    IO.checkDirectory(system_name, createMd=1)
-    os.chdir(system_name)
+    IO.checkDirectory(system_dir_path, createMd=1)
     
-    # writes system as a geometry.in file
-    _, _ = IO.writeAimsGeometry(system, _aims_geometry)
+    geometry_file = os.path.join(system_dir_path, _aims_geometry)
     
-    # copies the control.in file
-    cmd_line = "cp %s/%s/%s . " % (main_dir_path, _input_directory, _aims_control)
-    os.system(cmd_line)
+    # writes system as a geometry.in file
+    if system.name in geometry_files:
+      IO.linkFile(geometry_files[system.name], geometry_file)
     
-    # adjusts the control.in file
-    prepare_control_file(spin_file)    
+    else:
+      _, _ = IO.writeAimsGeometry(system, geometry_file)
+      
+      geometry_files[system.name] = geometry_file
     
-    os.chdir(cwd)
+    # links the control.in file
+    IO.linkFile(control_file, os.path.join(system_dir_path, _aims_control))
     
 if __name__ == "__main__":
   
@@ -232,7 +229,7 @@ if __name__ == "__main__":
     
   # execute the simulations?
   if options.execute:
-    execute()
+    execute(options)
   
   Messages.log(__name__, "Finished.")
   Messages.printAuthor()
@@ -1,41 +1,363 @@
 """
 A script to calculate surface energy for a cluster.
 
+In the batch mode the surface energies of all the structures in a directory (or listed in a Stats.csv file)
+are calculated in parallel and saved into one table. The areas are cached by the structure digest, hence
+changing the bulk energy does not trigger their recalculation.
+
 @author Tomas Lazauskas, 2017
 @web www.lazauskas.net
 @email tomas.lazauskas[a]gmail.com
 """
 
+import hashlib
 import os
 import sys
+import time
 
 from optparse import OptionParser
 
 import source.IO as IO
+import source.System as System
+import source.Utilities as Utilities
 from source.Messages import log
 
 # verbose level: 0 - off, 1 - on
 _verbose = 1
 
+_methodArvo = "arvo"
+_methodDelaunay = "delaunay"
+
+# batch mode files
+_batchOutputFile = "SurfaceEnergies.csv"
+_cacheFile = "SurfaceAreas.csv"
+
+# directory with the structures of the Stats.csv file (DM_FHIaims_Analysis)
+_statsStructuresDir = "tops"
+
 def cmd_line_args():
   """
   Handles command line arguments and options.
   
   """
   
-  usage = "usage: %prog input_file radius energy"
+  usage = "usage: %prog [options] input_file radius energy\n" + \
+          "       %prog -b [options] input_dir|Stats.csv radius energy"
   
   parser = OptionParser(usage=usage)
   
+  parser.add_option("-b", "--batch", dest="batch", action="store_true", default=False,
+    help="input is a directory (analysed recursively) or a Stats.csv file: calculates the surface energies " +
+         "of all the structures and saves them into one table")
+  
+  parser.add_option("-m", "--method", dest="method", default=_methodArvo,
+    help="Area estimation method: %s or %s (Delaunay's triangulation). Default = %s" % (_methodArvo,
+                                                                                        _methodDelaunay, _methodArvo))
+  
+  parser.add_option("-d", "--delaunay_backend", dest="backend", default=None,
+    help="Backend of the %s method: vtk or scipy. Default: vtk if available" % (_methodDelaunay))
+  
+  parser.add_option("-a", "--arvo_path", dest="arvo_path", default=None,
+    help="Path to the arvo_c executable. Default: %s" % (System.get_arvo_path()))
+  
+  parser.add_option("-e", "--extension", dest="extension", default="xyz",
+    help="Extension of the structure files in the batch mode. Default = xyz")
+  
+  parser.add_option("-s", "--structures_dir", dest="structures_dir", default=None,
+    help="Directory of the structures listed in the Stats.csv file. Default: the directory of the Stats.csv " +
+         "file or its %s subdirectory" % (_statsStructuresDir))
+  
+  parser.add_option("-n", "--processes", dest="processes", default=None, type="int",
+    help="Number of worker processes in the batch mode. Default: number of CPUs")
+  
+  parser.add_option("-o", "--output", dest="output", default=_batchOutputFile,
+    help="Output file of the batch mode. Default = %s" % (_batchOutputFile))
+  
+  parser.add_option("-c", "--cache", dest="cache", default=_cacheFile,
+    help="Cache file of the calculated areas. Default = %s" % (_cacheFile))
+  
   parser.disable_interspersed_args()
   
   (options, args) = parser.parse_args()
-    
+  
   if (len(args) != 3):
     parser.error("incorrect number of arguments")
-
+  
+  if options.method not in [_methodArvo, _methodDelaunay]:
+    parser.error("unknown method: %s" % (options.method))
+  
   return options, args
 
+def get_method_key(method, backend=None):
+  """
+  Returns the method (with the Delaunay's backend resolved) under which the areas are cached.
+  
+  """
+  
+  if method == _methodDelaunay:
+    if backend is None:
+      backend = "vtk" if Utilities.vtk_imported else "scipy"
+    
+    return "%s-%s" % (method, backend)
+  
+  return method
+
+def structure_digest(system, method_key, radius):
+  """
+  Returns the digest of the structure (species and positions rounded to 1e-6) and the area parameters.
+  
+  """
+  
+  digest = hashlib.sha1()
+  
+  digest.update("%s %.6f %d\n" % (method_key, radius, system.NAtoms))
+  
+  for i in xrange(system.NAtoms):
+    digest.update("%s %.6f %.6f %.6f\n" % (system.specieList[system.specie[i]],
+                                           system.pos[3*i], system.pos[3*i+1], system.pos[3*i+2]))
+  
+  return digest.hexdigest()
+
+def read_cache(cache_file):
+  """
+  Reads in the cached areas: digest -> (area, volume, spheres).
+  
+  """
+  
+  cache = {}
+  
+  if (cache_file is None) or (not os.path.isfile(cache_file)):
+    return cache
+  
+  f = open(cache_file, "r")
+  
+  # header
+  f.readline()
+  
+  for line in f:
+    array = line.strip().split(",")
+    
+    if len(array) != 6:
+      continue
+    
+    cache[array[0]] = (float(array[3]), float(array[4]), int(array[5]))
+  
+  f.close()
+  
+  return cache
+
+def write_cache(cache_file, cache, new_entries):
+  """
+  Appends the newly calculated areas to the cache file.
+  
+  new_entries: list of (digest, method_key, radius)
+  
+  """
+  
+  if (cache_file is None) or (len(new_entries) == 0):
+    return
+  
+  new_file = not os.path.isfile(cache_file)
+  
+  f = open(cache_file, "a")
+  
+  if new_file:
+    f.write("Digest,Method,Radius,Area,Volume,Spheres\n")
+  
+  for digest, method_key, radius in new_entries:
+    area, volume, spheres = cache[digest]
+    
+    f.write("%s,%s,%f,%.10f,%.10f,%d\n" % (digest, method_key, radius, area, volume, spheres))
+  
+  f.close()
+
+def get_structure_files(dir_path, extension):
+  """
+  Returns the structure files in the directory (recursively) and None as their energies (read from the files).
+  
+  """
+  
+  file_list = []
+  for root, _, files in os.walk(dir_path):
+    for file_name in files:
+      if file_name.endswith(".%s" % (extension)):
+        file_list.append(os.path.join(root, file_name))
+  
+  file_list.sort()
+  
+  return [(file_name, None) for file_name in file_list]
+
+def read_stats_file(stats_file, extension, structures_dir=None):
+  """
+  Returns the structure files and their energies listed in a Stats.csv file.
+  
+  """
+  
+  if structures_dir is None:
+    stats_dir = os.path.dirname(stats_file)
+    structures_dirs = [stats_dir, os.path.join(stats_dir, _statsStructuresDir)]
+  
+  else:
+    structures_dirs = [structures_dir]
+  
+  entries = []
+  
+  f = open(stats_file, "r")
+  
+  header = f.readline().strip().split(",")
+  
+  name_col = header.index("System")
+  energy_col = header.index("Energy")
+  
+  for line in f:
+    array = line.strip().split(",")
+    
+    if len(array) < len(header):
+      continue
+    
+    file_name = None
+    for dir_path in structures_dirs:
+      file_name = os.path.join(dir_path, "%s.%s" % (array[name_col], extension))
+      
+      if os.path.isfile(file_name):
+        break
+    
+    entries.append((file_name, float(array[energy_col])))
+  
+  f.close()
+  
+  return entries
+
+def calc_areas(systems, method, radius, backend=None, arvo_path=None, processes=None, cache_file=_cacheFile):
+  """
+  Calculates the areas (and the volumes with arvo) of the systems which are not in the cache.
+  
+  Returns success, error, [(area, volume, spheres) or None for every system], number of calculated areas.
+  
+  """
+  
+  method_key = get_method_key(method, backend)
+  
+  cache = read_cache(cache_file)
+  
+  digests = [structure_digest(system, method_key, radius) for system in systems]
+  
+  # the same structure can appear several times
+  to_calc = {}
+  for system, digest in zip(systems, digests):
+    if digest not in cache:
+      to_calc.setdefault(digest, system)
+  
+  calc_digests = sorted(to_calc.keys())
+  calc_systems = [to_calc[digest] for digest in calc_digests]
+  
+  success = True
+  error = ""
+  
+  if method == _methodArvo:
+    success, error = System.calc_arvo_geo_measures_batch(calc_systems, radius, arvo_path=arvo_path, processes=processes)
+  
+  else:
+    System.calc_del_areas(calc_systems, radius=radius, backend=backend, processes=processes)
+  
+  new_entries = []
+  
+  for digest, system in zip(calc_digests, calc_systems):
+    if method == _methodArvo:
+      if not system.arvo_calc:
+        continue
+      
+      cache[digest] = (system.arvo_area, system.arvo_volume, system.arvo_spheres)
+    
+    else:
+      if not system.del_calc:
+        continue
+      
+      cache[digest] = (system.del_area, 0.0, 0)
+    
+    new_entries.append((digest, method_key, radius))
+  
+  write_cache(cache_file, cache, new_entries)
+  
+  return success, error, [cache.get(digest) for digest in digests], len(new_entries)
+
+def calc_surface_energy(energy, NAtoms, bulk_energy, area):
+  """
+  Returns the surface energy (E - N * E_bulk) / A.
+  
+  """
+  
+  if area > 0.0:
+    return (energy - NAtoms * bulk_energy) / area
+  
+  return 0.0
+
+def batch_surface_energy(input_path, radius, bulk_energy, method=_methodArvo, backend=None, arvo_path=None,
+                         extension="xyz", structures_dir=None, processes=None, output_file=_batchOutputFile,
+                         cache_file=_cacheFile):
+  """
+  Calculates the surface energies of all the structures in a directory or listed in a Stats.csv file
+  and saves them into one table.
+  
+  Returns success, error.
+  
+  """
+  
+  timeStart = time.time()
+  
+  if os.path.isdir(input_path):
+    entries = get_structure_files(input_path, extension)
+  
+  else:
+    entries = read_stats_file(input_path, extension, structures_dir)
+  
+  files = []
+  systems = []
+  
+  for file_name, energy in entries:
+    if (file_name is None) or (not os.path.isfile(file_name)):
+      print "Error reading in [%s]: file does not exist" % (file_name)
+      continue
+    
+    # the reader follows the extension
+    system, read_error = IO.readSystemFromFile(file_name)
+    
+    if system is None:
+      print "Error reading in [%s]: %s" % (file_name, read_error)
+      continue
+    
+    if energy is not None:
+      system.totalEnergy = energy
+    
+    files.append(file_name)
+    systems.append(system)
+  
+  success, error, areas, calc_cnt = calc_areas(systems, method, radius, backend=backend, arvo_path=arvo_path,
+                                               processes=processes, cache_file=cache_file)
+  
+  f = open(output_file, "w")
+  f.write("System,File,NAtoms,Energy,Area,Volume,Spheres,SurfaceEnergy\n")
+  
+  saved_cnt = 0
+  for file_name, system, measures in zip(files, systems, areas):
+    if measures is None:
+      continue
+    
+    area, volume, spheres = measures
+    
+    f.write("%s,%s,%d,%f,%f,%f,%d,%f\n" % (system.name, file_name, system.NAtoms, system.totalEnergy, area, volume,
+                                           spheres, calc_surface_energy(system.totalEnergy, system.NAtoms,
+                                                                   bulk_energy, area)))
+    saved_cnt += 1
+  
+  f.close()
+  
+  message = "Saved %d/%d structures (%d areas calculated, %d cached) in %.2f s: %s" % (saved_cnt, len(entries),
+    calc_cnt, len(systems) - calc_cnt, time.time() - timeStart, output_file)
+  log(__name__, message, verbose=_verbose)
+  
+  return success, error
+
 if __name__ == "__main__":
   
   # reading in input arguments
@@ -45,23 +367,48 @@ if __name__ == "__main__":
   radius = float(args[1])
   n1_bulk_energy = float(args[2])
   
+  if options.batch:
+    message = "batch mode: %s (%s)" % (file_name, options.method)
+    log(__name__, message, verbose=_verbose)
+    
+    success, error = batch_surface_energy(file_name, radius, n1_bulk_energy, method=options.method,
+                                          backend=options.backend, arvo_path=options.arvo_path,
+                                          extension=options.extension, structures_dir=options.structures_dir,
+                                          processes=options.processes, output_file=options.output,
+                                          cache_file=options.cache)
+    
+    if not success:
+      print error
+      sys.exit(1)
+    
+    sys.exit(0)
+  
   message = "reading file: %s" % (file_name)
   log(__name__, message, verbose=_verbose)
   
   system = IO.readSystemFromFileXYZ(file_name)
   
   # estimating the geometrical measurements
-  system.calc_geo_measures(radius)
+  if options.method == _methodArvo:
+    success, error = system.calc_arvo_geo_measures(radius, arvo_path=options.arvo_path)
+    
+    if not success:
+      print error
+      sys.exit(1)
+    
+    area = system.arvo_area
+    
+    message = "Volume: %f, Area: %f, Spheres: %d" % (system.arvo_volume, system.arvo_area, system.arvo_spheres)
+  
+  else:
+    area = Utilities.delaunay3DArea(system, radius=radius, backend=options.backend)
+    
+    message = "Area: %f" % (area)
   
-  message = "Volume: %f, Area: %f, Spheres: %d" % (system.arvo_volume, system.arvo_area, system.arvo_spheres)
   log(__name__, message, verbose=_verbose)
   
   # estimating the surface energy
-  try:
-    surface_energy = (system.totalEnergy - system.NAtoms * n1_bulk_energy) / system.arvo_area
-  except:
-    surface_energy = 0.0
+  surface_energy = calc_surface_energy(system.totalEnergy, system.NAtoms, n1_bulk_energy, area)
   
   message = "Surface energy (E/A): %f" % (surface_energy)
   log(__name__, message, verbose=_verbose)
-  
\ No newline at end of file
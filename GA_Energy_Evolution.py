@@ -14,6 +14,8 @@ import matplotlib.pyplot as plt
 import re
 import time
 
+import source.KLMC as KLMC
+
 # Number of structres to be presented on the graph
 lowEnergyCnt = 20
 # Energy range to be presented on the graph
@@ -22,9 +24,10 @@ energyRange = 1.0
 # Settings below should not be changed if you are not sure what they are for
 #---------------------------------------------------------------------------
 _analyzeKLMCDir = "analysis"
+_runKLMCDir = "run"
 
-_statsPrefix = "gaStatistics"
-_statsSubfix = ".csv"
+# columnar store of the statistics (in the analysis directory)
+_statsStoreDir = "gaStatsStore"
 
 class GAIterStats:
   """
@@ -41,84 +44,86 @@ class GAIterStats:
     self.sigmaEnergy = sigmaEnergy
     self.lowEnergyArr = lowEnergyArr
 
-def analyseGARun(gaItNoList, filesList, unzipFlag=False):
+def analyseGARun(columns):
   """
-  Reads in the statistics files and generates statistics of the GA run.
+  Generates statistics of the GA run from the statistics columns and plots them.
 
   """
 
-  totGaIter = len(gaItNoList)
-
-  statistics = []
-  prevIterStats = None
-
-  for i in range(totGaIter):
-
-    if i > 0:
-      prevIterStats = gaIterStat
-
-    filePath = getIterFile(i, totGaIter, gaItNoList, filesList)
-
-    gaIterStat = readGAStatsFile(i, filePath, prevIterStats)
-
-    statistics.append(gaIterStat)
+  statistics = calcGAIterStats(columns)
 
   plotGASimStatistics(statistics)
 
   return statistics
 
-def getIterFile(iter, totGaIter, gaItNoList, filesList):
+def calcGAIterStats(columns):
   """
-  Returns a filepath from filesList with respect to the generation number.
+  Calculates the statistics of every GA iteration from the first lowEnergyCnt successful structures 
+  (in the order of the statistics file). If the statistics of an iteration are missing the statistics 
+  of the previous iteration are used.
 
   """
 
-  filePath = None
+  generation = columns["generation"]
 
-  for i in range(totGaIter):
+  if len(generation) == 0:
+    return []
 
-    if gaItNoList[i] == iter:
+  firstGen = int(generation.min())
+  genCnt = int(generation.max()) - firstGen + 1
 
-      filePath = filesList[i]
+  present = np.zeros(genCnt, np.bool)
+  present[generation - firstGen] = True
 
-      return filePath
+  valid = (columns["edfn"] > 0) & (columns["status"] == 1) & (columns["energy"] != 0.0)
 
-def getFileList(dirPath=None):
-  """
-  Checks the directory for ga statistics files and makes a list of them
+  order = np.argsort(generation, kind="mergesort")
+  order = order[valid[order]]
 
-  """
+  idx = generation[order] - firstGen
+  energies = columns["energy"][order]
 
-  filesList = []
-  gaItNoList = []
+  # the first lowEnergyCnt structures of every iteration
+  keep = np.arange(len(idx)) - np.searchsorted(idx, idx) < lowEnergyCnt
+  idx = idx[keep]
+  energies = energies[keep]
 
-  if (dirPath is not None):
-    cwd = os.getcwd()
-    os.chdir(dirPath)
+  structCnt = np.bincount(idx, minlength=genCnt)
+  energySum = np.bincount(idx, energies, minlength=genCnt)
+  energySqSum = np.bincount(idx, energies * energies, minlength=genCnt)
 
-  else:
-    cwd = None
+  lowEnergy = np.zeros(genCnt, np.float64)
+  np.minimum.at(lowEnergy, idx, energies)
 
-  subfixLen = len(_statsSubfix)
-  prefixLen = len(_statsPrefix)
+  highEnergy = np.zeros(genCnt, np.float64)
+  np.maximum.at(highEnergy, idx, energies)
 
-  for root, _, files in os.walk("./"):
+  avgEnergy = energySum / structCnt.clip(min=1)
+  sigmaEnergy = np.sqrt((energySqSum / structCnt.clip(min=1) - avgEnergy * avgEnergy).clip(min=0.0))
 
-    for fileName in files:
+  # top structures' energies sorted within every iteration
+  order = np.lexsort((energies, idx))
+  ranks = np.arange(len(order)) - np.searchsorted(idx[order], idx[order])
 
-      if fileName.startswith(_statsPrefix) and fileName.endswith(_statsSubfix):
-        fileNameLen = len(fileName)
+  lowEnergyArr = np.zeros([genCnt, lowEnergyCnt], np.float64)
+  lowEnergyArr[idx[order], ranks] = energies[order]
+
+  statistics = []
 
-        gaItNo = int(fileName[prefixLen:fileNameLen-subfixLen])
+  for i in range(genCnt):
+    if (not present[i]) and (len(statistics) > 0):
+      prevStats = statistics[-1]
 
-        gaItNoList.append(gaItNo)
+      gaIterStat = GAIterStats(firstGen + i, prevStats.structCnt, prevStats.lowEnergy, prevStats.avgEnergy,
+                               prevStats.highEnergy, prevStats.sigmaEnergy, prevStats.lowEnergyArr)
 
-        filesList.append(os.path.join(_analyzeKLMCDir, fileName))
+    else:
+      gaIterStat = GAIterStats(firstGen + i, structCnt[i], lowEnergy[i], avgEnergy[i], highEnergy[i], sigmaEnergy[i],
+                               lowEnergyArr[i])
 
-  if (dirPath is not None):
-    os.chdir(cwd)
+    statistics.append(gaIterStat)
 
-  return gaItNoList, filesList
+  return statistics
 
 def checkDirectory(dirPath, createMd=0):
   """
@@ -215,145 +220,14 @@ def plotGASimStatistics(statistics):
 
   fig.savefig('GA_top_analysis.pdf')
 
-def readGAStatsFile(gaIter, filePath, prevStats):
-  """
-  Reads in the GA iteration statistics file.
-
-  """
-
-  lineCnt = 0
-  structCnt = 0
-  lowEnergy = 0.0
-  avgEnergy = 0.0
-  highEnergy = 0.0
-  sigmaEnergy = 0.0
-
-  energySum = 0.0
-  energiesTmp = np.zeros(1000, np.float64)
-
-  lowEnergyArr = np.zeros(lowEnergyCnt, np.float64)
-
-  statusUsed = 1
-
-  # if the stats file is missing we have to use stats from the previous step
-  if filePath == None:
-    if prevStats is not None:
-      gaIterStat = GAIterStats(prevStats.iter, prevStats.structCnt, prevStats.lowEnergy, prevStats.avgEnergy,
-                               prevStats.highEnergy, prevStats.sigmaEnergy, prevStats.lowEnergyArr)
-
-    else:
-      gaIterStat = GAIterStats(gaIter, structCnt, lowEnergy, avgEnergy, highEnergy, sigmaEnergy, lowEnergyArr)
-
-    return gaIterStat
-
-  try:
-    f = open(filePath, "r")
-  except:
-    sys.exit(__name__ + ": error: cannot open <" + filePath)
-
-  for line in f:
-
-    if lineCnt > 0:
-      line = line.strip()
-      array = line.split(",")
-
-      if statusUsed:
-        edfn = int(array[3])
-        status = int(array[4])
-        energy = float(array[5])
-
-      else:
-        edfn = int(array[3])
-        status = 1
-        energy = float(array[4])
-
-      if edfn > 0 and status == 1 and energy != 0.0 and structCnt < lowEnergyCnt:
-        structCnt += 1
-
-        energySum += energy
-
-        energiesTmp[structCnt-1] = energy
-
-        if energy < lowEnergy:
-          lowEnergy = energy
-
-        if energy > highEnergy:
-          highEnergy = energy
-
-    lineCnt += 1
-
-  f.close()
-
-  energies = np.zeros(structCnt, np.float64)
-
-  for i in range(structCnt): energies[i] = energiesTmp[i]
-
-  sigmaEnergy = np.std(energies)
-
-  if structCnt > 0: avgEnergy = energySum / float(structCnt)
-
-  # Preparing top x structures' energies
-  # sorting according to the energy
-  energiesRanked = np.sort(copy.deepcopy(energies))
-
- # print gaIter, energiesTmp
-
-  noTopStructures = min(len(energiesRanked), lowEnergyCnt)
-
-  lowEnergyArr[:noTopStructures] = copy.deepcopy(energiesRanked[:noTopStructures])
-
-  gaIterStat = GAIterStats(gaIter, structCnt, lowEnergy, avgEnergy, highEnergy, sigmaEnergy, lowEnergyArr)
-
-  return gaIterStat
-
-def getStatsFileList():
-  """
-  Looks for zippped files and unzips them. Returns a list of directories.
-
-  """
-
-  dirName = "run/"
-
-  subFix = ".tar.gz"
-
-  cwd = os.getcwd()
-  os.chdir(dirName)
-
-  for root, _, files in os.walk("./"):
-    for fileName in files:
-      if fileName.endswith(subFix):
-
-        stepNo = fileName.split(".")[0]
-        analysisFile = "%s%s%s" % (_statsPrefix, stepNo, _statsSubfix)
-        analysisFilePath = os.path.join(cwd, _analyzeKLMCDir, analysisFile)
-
-        if (not os.path.isfile(analysisFilePath)):
-
-          cmdLine = "gzip -d < %s | tar xf -" % (fileName)
-          os.system(cmdLine)
-
-          cmdLine = "cp -rf %s %s" % (os.path.join(dirName, stepNo, analysisFile), analysisFilePath)
-          os.system(cmdLine)
-    
-      elif fileName.startswith(_statsPrefix) and fileName.endswith(_statsSubfix):
-        stepNo = fileName.split(".")[0][len(_statsPrefix):]
-        
-        analysisFilePath = os.path.join(cwd, _analyzeKLMCDir, fileName)
-        
-        cmdLine = "cp -rf %s %s" % (os.path.join(stepNo, fileName), analysisFilePath)
-        os.system(cmdLine)
-        
-  cmdLine = "rm -rf %s" % (dirName)
-  os.system(cmdLine)
-
-  os.chdir(cwd)
-
 if __name__ == "__main__":
 
   checkDirectory(_analyzeKLMCDir, createMd=1)
 
-  getStatsFileList()
+  # appends the new GA iterations to the statistics store
+  store = KLMC.GAStatsStore(os.path.join(_analyzeKLMCDir, _statsStoreDir))
+
+  newCnt = store.update(_runKLMCDir)
+  print "Statistics store: %d new GA iterations, last: %d" % (newCnt, store.lastGeneration)
 
-  gaItNoList, filesList = getFileList(dirPath=_analyzeKLMCDir)
-    
-  analyseGARun(gaItNoList, filesList)
+  analyseGARun(store.read(["generation", "edfn", "status", "energy"]))
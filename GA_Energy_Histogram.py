@@ -16,26 +16,27 @@ import numpy as np
 import matplotlib.pyplot as plt
 import time
 
+import source.KLMC as KLMC
+
 _energyRange = 2.0
 _energyBinSize = 0.02
 
 # Settings below should not be changed if you are not sure what they are for
-_statsPrefix = "gaStatistics"
-_statsSubfix = ".csv"
-
 _runDirPath = "run/"
-_zipSubFix = ".tar.gz"
 
 _analyzeKLMCDir = "analysis"
 
-def analyse(statsFile):
+# columnar store of the statistics (in the analysis directory, shared with GA_Energy_Evolution)
+_statsStoreDir = "gaStatsStore"
+
+def analyse(store):
   """
-  Reads in the statistics file, puts the data into bins and plots the histogram
+  Reads in the energies of the last GA iteration, puts the data into bins and plots the histogram
   
   """
   
   # reads the energy values
-  energyArr = readGAStatsFile(statsFile)
+  energyArr = readLastGAIterEnergies(store)
   
   # puts the data into bins
   binTheEnergies(energyArr)
@@ -100,54 +101,6 @@ def checkDirectory(dirPath, createMd=0):
       
   return exists
 
-def getLastStatsFile():
-  """
-  Looks for zippped files and unzips them. Returns a list of directories.
-  
-  """
-    
-  cwd = os.getcwd()
-  os.chdir(_runDirPath)
-  
-  maxStep = -1
-  zipPath = None
-  
-  # finding the last iteration of the GA simulation
-  for root, _, files in os.walk("./"):
-    for fileName in files:
-      if fileName.endswith(_zipSubFix):
-        
-        try:
-          stepNo = int(fileName.split(".")[0])
-        except:
-          stepNo = -1
-        
-        if maxStep < stepNo:
-          maxStep = stepNo
-          zipPath = fileName
-  
-  if maxStep < 0:
-    sys.exit("Error: could not find any data from a GA simulation")
-  
-  # extracting the zip file of the last iteration
-  cmdLine = "gzip -d < %s | tar xf -" % (zipPath)
-  os.system(cmdLine)
-  
-  # copy the analysis file from the zip file
-  analysisFile = "%s%s%s" % (_statsPrefix, maxStep, _statsSubfix)
-  analysisFilePath = os.path.join(cwd, _analyzeKLMCDir, analysisFile)
-  
-  cmdLine = "cp -rf %s %s" % (os.path.join(_runDirPath, str(maxStep), analysisFile), analysisFilePath)
-  os.system(cmdLine)
-  
-  # clean up
-  cmdLine = "rm -rf %s" % (_runDirPath)
-  os.system(cmdLine)
-  
-  os.chdir(cwd)
-  
-  return analysisFilePath
-
 def frange(a, b, step):
   """
   Range for float numbers
@@ -164,11 +117,15 @@ def main():
   # does the analysis directory exist?
   checkDirectory(_analyzeKLMCDir, createMd=1)
   
-  # finds the last iteration
-  statsFile = getLastStatsFile()
+  # appends the new GA iterations to the statistics store
+  store = KLMC.GAStatsStore(os.path.join(_analyzeKLMCDir, _statsStoreDir))
+  store.update(_runDirPath)
+  
+  if store.lastGeneration < 0:
+    sys.exit("Error: could not find any data from a GA simulation")
   
   # reads in the statistics and plots the data
-  analyse(statsFile)
+  analyse(store)
   
   # Final message
   printFinalMessage(timeStart)
@@ -191,66 +148,38 @@ def printFinalMessage(timeStart=None):
   print "Website: www.lazauskas.net"
   print
 
-def readGAStatsFile(filePath):
+def readLastGAIterEnergies(store):
   """
-  Reads in the GA iteration statistics file.
+  Reads in the energies of the successful structures of the last GA iteration from the statistics store.
   
   """
   
-  lineCnt = 0
-  structCnt = 0
+  columns = store.read(["generation", "edfn", "status", "energy"])
   
-  lowEnergy = 0.0
-  highEnergy = -1000000000000.0
-
-  energiesTmp = np.zeros(10000, np.float64)
-    
-  statusUsed = 1
+  generation = columns["generation"]
   
-  try:
-    f = open(filePath, "r")
-    
-  except:
-    sys.exit("Error: cannot open: " + filePath)
+  if len(generation) == 0:
+    sys.exit("Error: could not find any data from a GA simulation")
   
-  for line in f:
-
-    if lineCnt > 0:
-      line = line.strip()
-      array = line.split(",")
-      
-      if statusUsed:
-        edfn = int(array[3])
-        status = int(array[4])
-        energy = float(array[5])
-        
-      else:
-        edfn = int(array[3])
-        status = 1
-        energy = float(array[4])
-      
-      if edfn > 0 and status == 1 and energy != 0.0:
-        structCnt += 1
-      
-        energiesTmp[structCnt-1] = energy
-        
-        if energy < lowEnergy:
-          lowEnergy = energy
-          
-        if energy > highEnergy:
-          highEnergy = energy
-        
-    lineCnt += 1
-    
-  f.close()
+  lastGen = generation[-1]
+  
+  # the GA iterations are appended in order, the rows of the last one are at the end of the store
+  start = np.searchsorted(generation, lastGen)
+  
+  mask = (columns["edfn"][start:] > 0) & (columns["status"][start:] == 1) & (columns["energy"][start:] != 0.0)
   
+  energies = np.array(columns["energy"][start:][mask])
+  
+  structCnt = len(energies)
+  
+  lowEnergy = min(0.0, energies.min()) if structCnt > 0 else 0.0
+  highEnergy = energies.max() if structCnt > 0 else -1000000000000.0
+  
+  print "Last GA iteration: %d" % (lastGen)
   print "Lowest energy structure: %f" % (lowEnergy)
   print "Highest energy structure: %f" % (highEnergy)
   print "Total number of unique structures: %d" % (structCnt)
   
-  energies = np.zeros(structCnt, np.float64)
-  for i in range(structCnt): energies[i] = energiesTmp[i]
-
   return energies
 
 if __name__ == "__main__":
@@ -11,6 +11,8 @@ import subprocess
 import sys
 from optparse import OptionParser
 
+import source.KLMC as KLMC
+
 # 
 GARecursiveDepth = 10
 
@@ -24,6 +26,8 @@ _statsPrefix = "gaStatistics"
 _statsSubfix = ".csv"
 _tarSubfix = ".tar.gz"
 
+_genealogyIndexFile = "genealogy.db"
+
 def cmdLineArgs():
   """
   Handles command line arguments and options.
@@ -39,6 +43,15 @@ def cmdLineArgs():
   parser.add_option("-s", "--step", dest="step", default=None, type="int", help="")
   parser.add_option("-d", "--depth", dest="depth", default=None, type="int", help="")
   
+  parser.add_option("-i", "--index", dest="index", action="store_true", default=False, 
+    help="Trace the ancestry with the genealogy index (built or updated on the first use), the depth is not limited by default")
+  
+  parser.add_option("-f", "--index_file", dest="index_file", default=_genealogyIndexFile, 
+    help="Genealogy index file. Default = %s" % (_genealogyIndexFile))
+  
+  parser.add_option("-n", "--processes", dest="processes", default=None, type="int", 
+    help="Number of worker processes scanning the archives for the genealogy index. Default: number of CPUs")
+  
   (options, args) = parser.parse_args()
 
   if (len(args) != 0):
@@ -129,6 +142,20 @@ def analyze(latestGAStep, initiateMode=False, depth=0, lookFor=None, lookForStri
     else:
       print "Analysing: %d"% (_nextGAStep), "could not understand the origin of the structure"
     
+def traceAncestry(index, latestGAStep, depth=None):
+  """
+  Traces the ancestry with the genealogy index.
+  
+  """
+  
+  for _depth, gaStep, record in index.trace_ancestry(latestGAStep, maxDepth=depth):
+    if record is None:
+      print "Analysing: %d"% (gaStep), "could not locate next step"
+    
+    else:
+      print "Analysing: %d"% (gaStep), _depth, True, record.rank, record.hashkey, record.energy, record.origin, \
+                                       record.gaGenNo, record.parent1, record.parent2
+    
 def findFile(stepNo, fileName):
   """
   Looks for a specific file and returns its info from the statistics file.
@@ -138,39 +165,34 @@ def findFile(stepNo, fileName):
   found = False
   rank = -1
   hashkey = ""
+  energy = 0.0
   origin  = ""
   gaGenNo = -1
   parent1 = ""
   parent2 = ""
   
-  # unzip the tar file
-  cmdLine = "gzip -d < %s | tar xf -" % ("%d%s" % (stepNo, _tarSubfix))
-  os.system(cmdLine)
-  
-  cwd = os.getcwd()
-  os.chdir(os.path.join(_runKLMCDir, "%d" % (stepNo), _popKLMCDir))
+  # the POP directory is listed from the archive's member index
+  success, error, popFiles = KLMC.read_pop_files(stepNo)
   
-  cmdLine = "ls *%s_1.xyz" % (fileName.strip())  
-  output, stderr, status = runSubProcess(cmdLine)
+  if not success:
+    sys.exit("Error: " + error)
   
-  os.chdir(cwd)
+  suffix = "%s_1.xyz" % (fileName.strip())
   
-  try:
-    rank = int(output.strip().split("_")[0])
-    found = True
-    
-  except:
-    rank = -1
+  for popFile in popFiles:
+    if popFile.endswith(suffix):
+      try:
+        rank = int(popFile.split("_")[0])
+        found = True
+        
+      except:
+        rank = -1
+      
+      break
   
   # lets read the data from the statistics file
   if found:    
-    filePath = os.path.join(_runKLMCDir, "%d" % (stepNo), "%s%d%s" % (_statsPrefix, stepNo, _statsSubfix))
-    
-    found, hashkey, energy, origin, gaGenNo, parent1, parent2 = readGAStatsFileRank(filePath, rank)
-      
-  # cleaning up
-  cmdLine = "rm -rf run"
-  os.system(cmdLine)
+    found, hashkey, energy, origin, gaGenNo, parent1, parent2 = readGAStatsFileRank(readStatsLines(stepNo), rank)
   
   return found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2
     
@@ -180,17 +202,7 @@ def findHashkey(stepNo, hashkey):
   
   """
   
-  # unzip the tar file
-  cmdLine = "gzip -d < %s | tar xf -" % ("%d%s" % (stepNo, _tarSubfix))
-  os.system(cmdLine)
-  
-  # reading the statistics file
-  filePath = os.path.join(_runKLMCDir, "%d" % (stepNo), "%s%d%s" % (_statsPrefix, stepNo, _statsSubfix))
-  found, rank, energy, origin, gaGenNo, parent1, parent2 = readGAStatsFileHashkey(filePath, hashkey)
-  
-  # cleaning up
-  cmdLine = "rm -rf run"
-  os.system(cmdLine)
+  found, rank, energy, origin, gaGenNo, parent1, parent2 = readGAStatsFileHashkey(readStatsLines(stepNo), hashkey)
   
   return found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2
   
@@ -200,17 +212,7 @@ def findLowest(stepNo):
   
   """
   
-  # unzip the tar file
-  cmdLine = "gzip -d < %s | tar xf -" % ("%d%s" % (stepNo, _tarSubfix))
-  os.system(cmdLine)
-  
-  # reading the statistics file
-  filePath = os.path.join(_runKLMCDir, "%d" % (stepNo), "%s%d%s" % (_statsPrefix, stepNo, _statsSubfix))
-  found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2 = readGAStatsFileTop(filePath)
-  
-  # cleaning up
-  cmdLine = "rm -rf run"
-  os.system(cmdLine)
+  found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2 = readGAStatsFileTop(readStatsLines(stepNo))
   
   return found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2
   
@@ -248,7 +250,20 @@ def getLatestGaStep(dirPath=None):
     
   return maxGAIter
 
-def readGAStatsFileRank(filePath, rank):
+def readStatsLines(stepNo):
+  """
+  Reads the lines of the statistics file straight from the archive of the GA iteration.
+  
+  """
+  
+  success, error, lines = KLMC.read_stats_lines(stepNo)
+  
+  if not success:
+    sys.exit("Error: " + error)
+  
+  return lines
+
+def readGAStatsFileRank(lines, rank):
   """
   Returns statistics from the statistics file with respect to the rank.
   
@@ -264,13 +279,7 @@ def readGAStatsFileRank(filePath, rank):
   
   lineCnt = 0
   
-  try:
-    f = open(filePath, "r")
-    
-  except:
-    sys.exit("Error: cannot open: " + filePath)
-  
-  for line in f:
+  for line in lines:
 
     if lineCnt == rank:
       found = True
@@ -288,12 +297,10 @@ def readGAStatsFileRank(filePath, rank):
       break
       
     lineCnt += 1
-    
-  f.close()
   
   return found, hashkey, energy, origin, gaGenNo, parent1, parent2
 
-def readGAStatsFileHashkey(filePath, hashkey):
+def readGAStatsFileHashkey(lines, hashkey):
   """
   Returns statistics from the statistics file with respect to the hashkey.
   
@@ -310,13 +317,7 @@ def readGAStatsFileHashkey(filePath, hashkey):
   
   lineCnt = 0
   
-  try:
-    f = open(filePath, "r")
-    
-  except:
-    sys.exit("Error: cannot open: " + filePath)
-  
-  for line in f:
+  for line in lines:
     if lineCnt > 0:
       line = line.strip()
       array = line.split(",")
@@ -333,12 +334,10 @@ def readGAStatsFileHashkey(filePath, hashkey):
         break
       
     lineCnt += 1
-    
-  f.close()
   
   return found, rank, energy, origin, gaGenNo, parent1, parent2
 
-def readGAStatsFileTop(filePath):
+def readGAStatsFileTop(lines):
   """
   Reads in the GA iteration statistics file.
   
@@ -355,13 +354,7 @@ def readGAStatsFileTop(filePath):
   
   lineCnt = 0
   
-  try:
-    f = open(filePath, "r")
-    
-  except:
-    sys.exit("Error: cannot open: " + filePath)
-  
-  for line in f:
+  for line in lines:
     if lineCnt == 1:
       line = line.strip()
       array = line.split(",")
@@ -378,8 +371,6 @@ def readGAStatsFileTop(filePath):
       break
     
     lineCnt += 1
-    
-  f.close()
   
   return found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2
 
@@ -413,9 +404,21 @@ if __name__ == "__main__":
     latestGAStep = getLatestGaStep(_runKLMCDir)
 
   cwd = os.getcwd()
+  indexFile = os.path.abspath(options.index_file)
   os.chdir(_runKLMCDir)
   
-  # analyze
-  analyze(latestGAStep, initiateMode=True)
+  if options.index:
+    index = KLMC.GenealogyIndex(indexFile)
+    
+    scannedCnt = index.update(processes=options.processes)
+    print "Genealogy index: %s (%d archives scanned)" % (indexFile, scannedCnt)
+    
+    traceAncestry(index, latestGAStep, options.depth)
+    
+    index.close()
+  
+  else:
+    # analyze
+    analyze(latestGAStep, initiateMode=True)
   
   os.chdir(cwd)
\ No newline at end of file
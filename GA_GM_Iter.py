@@ -8,6 +8,8 @@ A script to find the GA iteration number on which the GM has been found
 
 import os, sys
 
+import source.KLMC as KLMC
+
 _runKLMCDir = "run"
 
 _statsPrefix = "gaStatistics"
@@ -20,17 +22,13 @@ def findLowest(stepNo):
   
   """
   
-  # unzip the tar file
-  cmdLine = "gzip -d < %s | tar xf -" % ("%d%s" % (stepNo, _tarSubfix))
-  os.system(cmdLine)
+  # reading the statistics file straight from the archive
+  success, error, lines = KLMC.read_stats_lines(stepNo)
   
-  # reading the statistics file
-  filePath = os.path.join(_runKLMCDir, "%d" % (stepNo), "%s%d%s" % (_statsPrefix, stepNo, _statsSubfix))
-  found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2 = readGAStatsFileTop(filePath)
+  if not success:
+    sys.exit("Error: " + error)
   
-  # cleaning up
-  cmdLine = "rm -rf run"
-  os.system(cmdLine)
+  found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2 = readGAStatsFileTop(lines)
   
   return found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2
 
@@ -68,7 +66,7 @@ def getLatestGAStep(dirPath=None):
     
   return maxGAIter
 
-def readGAStatsFileTop(filePath):
+def readGAStatsFileTop(lines):
   """
   Reads in the GA iteration statistics file.
   
@@ -85,13 +83,7 @@ def readGAStatsFileTop(filePath):
   
   lineCnt = 0
   
-  try:
-    f = open(filePath, "r")
-    
-  except:
-    sys.exit("Error: cannot open: " + filePath)
-  
-  for line in f:
+  for line in lines:
     if lineCnt == 1:
       line = line.strip()
       array = line.split(",")
@@ -108,8 +100,6 @@ def readGAStatsFileTop(filePath):
       break
     
     lineCnt += 1
-    
-  f.close()
   
   return found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2
 
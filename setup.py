@@ -37,8 +37,8 @@ if os.uname()[0] == "Darwin":
 elif os.uname()[0] == "Linux":
 
   CC = "gcc "
-  CCFLAGS = "-c -O3 -fPIC "
-  CCLINKFLAGS = "-shared "  
+  CCFLAGS = "-c -O3 -fPIC -fopenmp "
+  CCLINKFLAGS = "-shared -fopenmp "  
   INCLUDES = ""
   
   c_flags_set = True
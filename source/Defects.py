@@ -4,137 +4,287 @@ Defects module.
 @author Tomas Lazauskas
 """
 
-import copy
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 from c_libs import defects as defects_c
+import Utilities
 
-def find_defects(input_system, final_system, vac_radius):
+_defectNeighbourRadius = 10.0
+_defectClusterRadius = 3.5
+
+_defectAttributes = ["NDef", "NVac", "NInt", "NAnt", "vacancies", "interstitials", "antisites", "onAntisites", 
+                     "defectCluster", "vacSpecie", "vacPos", "intSpecie", "intPos", "antSpecie", "antPos", 
+                     "onAntSpecie", "onAntPos"]
+
+def _specie_list_c(specie_list):
   """
-  Compares two systems and tries to identify defects. This is based on the algorithm developed by Chris Scott
-  at Loughborough University for LAKMC software package.
+  Returns the specie list in the layout expected by the C library (two characters per specie).
   
   """
   
-  success = True
-  error = ""
+  return np.array([sym[:2] for sym in specie_list], "S2")
+
+class ReferenceLattice(object):
+  """
+  Reference system with its atoms boxed once, so that any number of systems (e.g. frames of a trajectory)
+  can be compared against it without rebuilding the spatial decomposition.
   
-  includeVacs = 1
-  includeInts = 1
-  includeAnts = 1
+  """
   
-  # make temporary list to store defects
-  defectCluster = np.zeros(final_system.NAtoms, np.int32)
+  def __init__(self, input_system, vac_radius, num_threads=1, verbose_level=3, 
+               inclusion_radius=_defectNeighbourRadius):
+    """
+    Boxes the atoms of the input (reference) system.
+    
+    inclusion_radius: atoms within this distance from a defect are included in defectCluster
+    
+    """
+    
+    self.input_system = input_system
+    self.vac_radius = vac_radius
+    self.num_threads = num_threads
+    self.verbose_level = verbose_level
+    self.inclusion_radius = inclusion_radius
+    
+    self.NAtoms = input_system.NAtoms
+    self.PBC = np.ones(3, np.int32)
+    
+    # here is the place where we can adjust the cell dimensions
+    self.cellDims = np.array(input_system.cellDims[:3], np.float64)
+    
+    # the C library keeps referring to these arrays, hence the local copies
+    self.pos = np.array(input_system.pos, np.float64)
+    self.specie = np.array(input_system.specie, np.int32)
+    self.specieList = _specie_list_c(input_system.specieList)
+    
+    input_system.minMaxPos(self.PBC)
+    
+    self.minPos = np.array(input_system.minPos, np.float64)
+    self.maxPos = np.array(input_system.maxPos, np.float64)
+    
+    self._boxes = defects_c.createReferenceBoxes(self.NAtoms, self.pos, self.vac_radius, self.minPos, self.maxPos, 
+                                                 self.PBC, self.cellDims)
   
-  NDefectsByType = np.zeros(4, np.int32)
-  vacancies = np.empty(input_system.NAtoms, np.int32)
-  antisites = np.empty(input_system.NAtoms, np.int32)
-  onAntisites = np.empty(input_system.NAtoms, np.int32)
-  interstitials = np.empty(final_system.NAtoms, np.int32)
+  def __del__(self):
+    
+    self.free()
   
-  forcedSpeciesList = input_system.specieList
+  def find(self, final_system):
+    """
+    Compares the system with the reference lattice and stores the identified defects on the system.
+    
+    """
+    
+    success = True
+    error = ""
+    
+    if self._boxes is None:
+      success = False
+      error = "Reference lattice has been freed"
+      
+      return success, error
+    
+    includeVacs = 1
+    includeInts = 1
+    includeAnts = 1
+    
+    # make temporary list to store defects
+    defectCluster = np.zeros(final_system.NAtoms, np.int32)
+    
+    NDefectsByType = np.zeros(4, np.int32)
+    vacancies = np.empty(self.NAtoms, np.int32)
+    antisites = np.empty(self.NAtoms, np.int32)
+    onAntisites = np.empty(self.NAtoms, np.int32)
+    interstitials = np.empty(final_system.NAtoms, np.int32)
+    
+    # species which are always treated as interstitials, none by default
+    forcedSpecies = np.empty(0, np.int32)
+    
+    # ignore these atoms as defects, by the fault everything is taken into account
+    inputStateExclSpecs = np.empty(0, np.int32)
+    refExclSpecs = np.empty(0, np.int32)
+    
+    pos = np.ascontiguousarray(final_system.pos, np.float64)
+    specie = np.ascontiguousarray(final_system.specie, np.int32)
+    
+    defects_cnt = defects_c.findDefectsReference(self._boxes, includeVacs, includeInts, includeAnts,
+                                                 defectCluster, NDefectsByType, 
+                                                 vacancies, interstitials, antisites, onAntisites,
+                                                 forcedSpecies, inputStateExclSpecs, refExclSpecs,
+                                                 final_system.NAtoms, _specie_list_c(final_system.specieList), specie, pos,
+                                                 self.NAtoms, self.specieList, self.specie, self.pos,
+                                                 self.cellDims, self.PBC, self.vac_radius, self.inclusion_radius, 
+                                                 self.minPos, self.maxPos, self.verbose_level, 1, self.num_threads)
+    
+    NDef, NVac, NInt, NAnt = NDefectsByType
+    
+    # views of the filled parts of the arrays, no copies are made
+    result = DefectResult(self.pos, self.specie, pos, specie, vacancies[:NVac], interstitials[:NInt], 
+                          antisites[:NAnt], onAntisites[:NAnt], defectCluster[:defects_cnt], NDef, 
+                          self.cellDims, self.PBC)
+    
+    result.attach(final_system)
+    
+    return success, error
   
-  # ignore these atoms as defects, by the fault everything is taken into account
-  inputStateExclSpecs = np.empty(0, np.int32)
-  refExclSpecs = np.empty(0, np.int32)
+  def find_frames(self, frames):
+    """
+    Generator which compares every frame with the reference lattice and yields (success, error, frame).
+    
+    """
+    
+    for frame in frames:
+      success, error = self.find(frame)
+      
+      yield success, error, frame
   
-  cellDims3 = np.empty(3, np.float64)
+  def free(self):
+    """
+    Releases the boxes of the reference lattice.
+    
+    """
+    
+    if getattr(self, "_boxes", None) is not None:
+      defects_c.freeBoxes(self._boxes)
+      self._boxes = None
+
+class DefectResult(object):
+  """
+  Defects identified by comparing a system with the reference lattice.
   
-  # here is the place where we can adjust the cell dimensions
-  cellDims3[0] = final_system.cellDims[0]
-  cellDims3[1] = final_system.cellDims[1]
-  cellDims3[2] = final_system.cellDims[2]
+  Indices refer to the reference (vacancies, antisites) or the compared system (interstitials, onAntisites,
+  defectCluster), positions are stored as flat [x1, y1, z1, x2, ...] arrays as in System.
   
-  PBC = np.ones(3, np.int32)
+  """
   
-  # checking whether the defects are in the same volume
-  defectNeighbourRadius = 10.0
+  def __init__(self, refPos, refSpecie, pos, specie, vacancies, interstitials, antisites, onAntisites, 
+               defectCluster, NDef, cellDims, PBC):
+    """
+    Gathers the species and positions of the defects.
+    
+    """
+    
+    self.NDef = int(NDef)
+    self.cellDims = cellDims
+    self.PBC = PBC
+    self.NVac = len(vacancies)
+    self.NInt = len(interstitials)
+    self.NAnt = len(antisites)
+    
+    self.vacancies = vacancies
+    self.interstitials = interstitials
+    self.antisites = antisites
+    self.onAntisites = onAntisites
+    self.defectCluster = defectCluster
+    
+    refPos = refPos.reshape(-1, 3)
+    pos = pos.reshape(-1, 3)
+    
+    self.vacSpecie = refSpecie[vacancies]
+    self.vacPos = refPos[vacancies].ravel()
+    
+    self.intSpecie = specie[interstitials]
+    self.intPos = pos[interstitials].ravel()
+    
+    self.antSpecie = refSpecie[antisites]
+    self.antPos = refPos[antisites].ravel()
+    
+    self.onAntSpecie = specie[onAntisites]
+    self.onAntPos = pos[onAntisites].ravel()
   
-  input_system.minMaxPos(PBC)
+  def attach(self, system):
+    """
+    Attaches the result to the system. The system's defect attributes refer to the arrays of the result.
+    
+    """
+    
+    system.defectResult = self
+    
+    for attr in _defectAttributes:
+      setattr(system, attr, getattr(self, attr))
   
-  defects_cnt = defects_c.findDefects(includeVacs, includeInts, includeAnts,
-                                      defectCluster, NDefectsByType, 
-                                      vacancies, interstitials, antisites, onAntisites,
-                                      forcedSpeciesList, inputStateExclSpecs, refExclSpecs,
-                                      final_system.NAtoms, final_system.specieList, final_system.specie, final_system.pos,
-                                      input_system.NAtoms, input_system.specieList, input_system.specie, input_system.pos,
-                                      cellDims3, PBC, vac_radius, defectNeighbourRadius, input_system.minPos, input_system.maxPos, 
-                                      3, 1)
+  def find_clusters(self, cluster_radius=_defectClusterRadius):
+    """
+    Groups the defects into clusters.
+    
+    """
+    
+    return DefectClusters(self, cluster_radius)
+
+class DefectClusters(object):
+  """
+  Clusters of defects, two defects belong to the same cluster if they are connected by a chain of defects
+  closer than the cluster radius.
   
-   # resize arrays
-  NDef = NDefectsByType[0]
-  NVac = NDefectsByType[1]
-  NInt = NDefectsByType[2]
-  NAnt = NDefectsByType[3]
+  Per defect arrays (vacancies, then interstitials, then antisites): defectType (0 - vacancy, 1 - interstitial, 
+  2 - antisite), defectIndex, pos[N, 3] and labels.
+  Per cluster arrays: sizes, composition[NClusters, 3] (vacancies, interstitials, antisites) and centroids[NClusters, 3].
+  sizeHistogram[s] is the number of clusters of size s.
   
-  vacancies.resize(NVac)
-  interstitials.resize(NInt)
-  antisites.resize(NAnt)
-  onAntisites.resize(NAnt)
-  defectCluster.resize(NDef)
+  """
   
-  # saving the positions
-  # build list of vacancies
-  vacSpecie = np.empty(NVac, np.int32)
-  vacPos = np.empty(3 * NVac, np.float64)
+  def __init__(self, result, cluster_radius):
+    """
+    Builds the defect graph with a neighbour list and labels its connected components.
     
-  for i in xrange(len(vacancies)):
-    index = vacancies[i]
+    """
     
-    vacSpecie[i] = input_system.specie[index]
-    vacPos[3*i] = input_system.pos[3*index]
-    vacPos[3*i+1] = input_system.pos[3*index+1]
-    vacPos[3*i+2] = input_system.pos[3*index+2]
+    self.clusterRadius = cluster_radius
     
-  # build list of interstitials
-  intSpecie = np.empty(NInt, np.int32)
-  intPos = np.empty(3 * NInt, np.float64)
-  
-  for i in xrange(len(interstitials)):
-    index = interstitials[i]
+    self.defectType = np.repeat(np.arange(3, dtype=np.int32), [result.NVac, result.NInt, result.NAnt])
+    self.defectIndex = np.concatenate((result.vacancies, result.interstitials, result.antisites))
+    self.pos = np.concatenate((result.vacPos, result.intPos, result.antPos)).reshape(-1, 3)
     
-    intSpecie[i] = final_system.specie[index]
-    intPos[3*i] = final_system.pos[3*index]
-    intPos[3*i+1] = final_system.pos[3*index+1]
-    intPos[3*i+2] = final_system.pos[3*index+2]
+    NDefects = len(self.defectType)
+    
+    if NDefects > 0:
+      bond_i, bond_j, _ = Utilities.neighbour_list(self.pos, result.cellDims, result.PBC, cluster_radius)
+      
+      graph = coo_matrix((np.ones(len(bond_i), np.int8), (bond_i, bond_j)), shape=(NDefects, NDefects))
       
-  # build list of antisites
-  antSpecie = np.empty(NAnt, np.int32)
-  antPos = np.empty(3 * NAnt, np.float64)
-  onAntPos = np.empty(3*NAnt, np.float64)
-  onAntSpecie = np.empty(3 * NAnt, np.int32)
-  
-  for i in xrange(len(antisites)):
-    index = antisites[i]
-    index2 = onAntisites[i]
-     
-    antSpecie[i] = input_system.specie[index]
-    onAntSpecie[i] = final_system.specie[index2]
-    
-    antPos[3*i] = input_system.pos[3*index]
-    antPos[3*i+1] = input_system.pos[3*index+1]
-    antPos[3*i+2] = input_system.pos[3*index+2]
-    
-    onAntPos[3*i] = final_system.pos[3*index2]
-    onAntPos[3*i+1] = final_system.pos[3*index2+1]
-    onAntPos[3*i+2] = final_system.pos[3*index2+2]
-  
-  final_system.NDef = NDef
-  final_system.NVac = NVac
-  final_system.NInt = NInt
-  final_system.NAnt = NAnt
-  final_system.vacSpecie = copy.deepcopy(vacSpecie)
-  final_system.vacPos = copy.deepcopy(vacPos)
-  final_system.intSpecie = copy.deepcopy(intSpecie)
-  final_system.intPos = copy.deepcopy(intPos)
-  final_system.antSpecie = copy.deepcopy(antSpecie)
-  final_system.antPos = copy.deepcopy(antPos)
-  final_system.onAntPos = copy.deepcopy(onAntPos)
-  final_system.onAntSpecie = copy.deepcopy(onAntSpecie)
-  final_system.vacancies = copy.deepcopy(vacancies)
-  final_system.interstitials = copy.deepcopy(interstitials)
-  final_system.antisites = copy.deepcopy(antisites)
-  final_system.onAntisites = copy.deepcopy(onAntisites)
-  final_system.defectCluster = copy.deepcopy(defectCluster)
+      self.NClusters, self.labels = connected_components(graph, directed=False)
     
+    else:
+      self.NClusters = 0
+      self.labels = np.empty(0, np.int32)
+    
+    self.sizes = np.bincount(self.labels, minlength=self.NClusters)
+    
+    self.composition = np.zeros([self.NClusters, 3], np.int32)
+    np.add.at(self.composition, (self.labels, self.defectType), 1)
+    
+    self.sizeHistogram = np.bincount(self.sizes)
+    
+    # centroids, positions are unwrapped relative to the first defect of the cluster
+    _, first = np.unique(self.labels, return_index=True)
+    
+    separations = Utilities.minimum_image(self.pos - self.pos[first[self.labels]], result.cellDims, result.PBC)
+    
+    sums = np.zeros([self.NClusters, 3], np.float64)
+    np.add.at(sums, self.labels, separations)
+    
+    self.centroids = self.pos[first] + sums / self.sizes[:, np.newaxis].clip(min=1)
+    
+    for k in range(3):
+      if result.PBC[k] == 1:
+        self.centroids[:, k] = np.mod(self.centroids[:, k], result.cellDims[k])
+
+def find_defects(input_system, final_system, vac_radius, num_threads=1, inclusion_radius=_defectNeighbourRadius):
+  """
+  Compares two systems and tries to identify defects. This is based on the algorithm developed by Chris Scott
+  at Loughborough University for LAKMC software package.
+  
+  num_threads sets the number of OpenMP threads used by the C library (0 - use all available cores).
+  The results do not depend on the number of threads.
+  
+  """
+  
+  reference = ReferenceLattice(input_system, vac_radius, num_threads, inclusion_radius=inclusion_radius)
+  
+  success, error = reference.find(final_system)
+  
+  reference.free()
+  
   return success, error
@@ -18,6 +18,7 @@ import subprocess
 # import System
 import IO
 import System
+import Utilities
 
 import numpy as np
 
@@ -406,7 +407,7 @@ def _readAimsFrequenciesFile(fileName):
   
   result = None
 
-  if not checkFile(fileName):    
+  if not IO.checkFile(fileName):    
     return result
   
   try:
@@ -441,9 +442,7 @@ def _readAimsFrequenciesFile(fileName):
     if sectionStarted and not sectionEnded:
     
       if lineCnt > 1:
-        array = line.split()
-        
-        eigenValues.append(array[1])
+        eigenValues.append(float(line.split()[1]))
       
       lineCnt += 1
     
@@ -453,6 +452,42 @@ def _readAimsFrequenciesFile(fileName):
   
   return result, cZPE, wZPE
 
+def read_aims_frequencies_files(file_list, processes=None):
+  """
+  Reads in a list of FHI-aims frequencies files (in parallel) and stacks the frequencies into a
+  zero padded array.
+  
+  Returns success flags[S], frequencies[S, M], number of modes[S], cumulative ZPEs[S] and
+  ZPEs without the first six eigenmodes[S].
+  
+  """
+  
+  files_cnt = len(file_list)
+  
+  results = Utilities.pool_map(_readAimsFrequenciesFile, file_list, processes)
+  
+  success = np.zeros(files_cnt, np.bool_)
+  modes_cnt = np.zeros(files_cnt, np.int32)
+  c_zpe = np.zeros(files_cnt, np.float64)
+  w_zpe = np.zeros(files_cnt, np.float64)
+  
+  for i in range(files_cnt):
+    if results[i] is not None:
+      success[i] = True
+      modes_cnt[i] = len(results[i][0])
+      c_zpe[i] = results[i][1]
+      w_zpe[i] = results[i][2]
+  
+  max_modes = np.max(modes_cnt) if files_cnt > 0 else 0
+  
+  frequencies = np.zeros((files_cnt, max_modes), np.float64)
+  
+  for i in range(files_cnt):
+    if success[i]:
+      frequencies[i, :modes_cnt[i]] = results[i][0]
+  
+  return success, frequencies, modes_cnt, c_zpe, w_zpe
+
 def _readAimsOutputEnergyAtoms(inputFile):
   """
   Reads in FHI-aims output as a system.
@@ -7,23 +7,42 @@ Input/Output module.
 """
 
 import copy
+import fnmatch
+import json
+import multiprocessing.pool
 import os
+import re
+import shutil
 import sys
 import glob
 import time
 import numpy as np
 
+try:
+  from os import scandir
+  scandir_imported = True
+except ImportError:
+  try:
+    from scandir import scandir
+    scandir_imported = True
+  except ImportError:
+    scandir_imported = False
+
 # import System
 # import Gulp
 # import Atoms
 import System
 import Gulp
 import Atoms
+import Utilities
 #import Fhiaims
 
 const_file_ext_xyz = "xyz"
 const_file_ext_out = "out"
 
+# buffer size of the multi-frame writer
+_writeBufferSize = 1 << 20
+
 def checkDirectory(dirPath, createMd=0):
   """
   Checks if directory exists
@@ -120,15 +139,16 @@ def countMixAtoms(fileName):
   success = True
   return success, error, atomsCnt
 
-def get_unique_systems_hashkeys(systems_list, hashkeyRadius=None):
+def get_unique_systems_hashkeys(systems_list, hashkeyRadius=None, recalculate=True):
   """
-  Evaluates the hashkeys
+  Evaluates the hashkeys (with recalculate=False only of the systems which do not have one yet)
   
   """
   
   system_list_len = len(systems_list)
   
-  unique_hashkeys = []
+  # hashkey -> index of the unique system
+  unique_hashkeys = {}
   unique_systems = []
   unique_cnt = 0
   
@@ -137,13 +157,12 @@ def get_unique_systems_hashkeys(systems_list, hashkeyRadius=None):
   system_cnt = 0
   for system in systems_list:
     
-    systems_list[system_cnt].calculateHashkey(hashkeyRadius=hashkeyRadius)
+    if recalculate or (systems_list[system_cnt].hashkey == ""):
+      systems_list[system_cnt].calculateHashkey(hashkeyRadius=hashkeyRadius)
+    
     hashkey = systems_list[system_cnt].hashkey
-      
-    try:
-      hashkey_idx = unique_hashkeys.index(hashkey)
-    except:
-      hashkey_idx = -1
+    
+    hashkey_idx = unique_hashkeys.get(hashkey, -1)
     
     # storing duplicate numbers
     if hashkey_idx != -1:
@@ -159,7 +178,7 @@ def get_unique_systems_hashkeys(systems_list, hashkeyRadius=None):
     else:
       unique_cnt += 1
       
-      unique_hashkeys.append(hashkey)
+      unique_hashkeys[hashkey] = len(unique_systems)
       unique_systems.append(systems_list[system_cnt])
     
     system_cnt += 1
@@ -180,65 +199,262 @@ def get_file_list(extension="*"):
   
   return file_list
 
-def get_file_list_recursive_simple(extension="*", file_list=[]):
+def get_file_list_recursive_simple(extension="*", file_list=None):
   """
   Returns a list of files with a specific extension by analysing directories recursively
   
   """
+  
+  if file_list is None:
+    file_list = []
+  
+  file_list += find_files(os.getcwd(), extension=extension)
+  
+  return file_list
 
-  cwd = os.getcwd()
+def get_file_list_recursive(extension="*", file_list=None, dir_path=None, recurs_iter=0, recurs_max=8):
+  """
+  Returns a list of files with a specific extension by analysing directories recursively (up to recurs_max levels)
   
-  for root, dirs, files in os.walk("./"):
+  """
+  
+  if file_list is None:
+    file_list = []
+  
+  if dir_path is None:
+    dir_path = os.getcwd()
+  
+  file_list += find_files(os.path.abspath(dir_path), extension=extension, max_depth=recurs_max-recurs_iter)
+  
+  return file_list
+
+def _file_pattern(extension="*", prefix=None):
+  """
+  Returns the compiled pattern of the file names: prefix*.extension (as in glob).
+  
+  """
+  
+  if prefix is None:
+    prefix = ""
+  
+  return re.compile(fnmatch.translate("%s*.%s" % (prefix, extension)))
+
+def _scan_dir(dir_path):
+  """
+  Returns the names of the files and of the subdirectories of a directory. Symbolic links to directories 
+  are not followed.
+  
+  """
+  
+  files = []
+  dirs = []
+  
+  try:
+    if scandir_imported:
+      for entry in scandir(dir_path):
+        if entry.is_dir(follow_symlinks=False):
+          dirs.append(entry.name)
+        
+        elif entry.is_file():
+          files.append(entry.name)
     
-    dir_path_add = os.path.join(cwd, root[2:])
-    os.chdir(dir_path_add)
+    else:
+      for name in os.listdir(dir_path):
+        path = os.path.join(dir_path, name)
+        
+        if os.path.isdir(path):
+          if not os.path.islink(path):
+            dirs.append(name)
+        
+        elif os.path.isfile(path):
+          files.append(name)
+  
+  except OSError:
+    pass
+  
+  return files, dirs
+
+def iter_files(dir_path=".", extension="*", prefix=None, max_depth=None):
+  """
+  Yields the files (prefix*.extension) of a directory tree while it is being traversed. max_depth limits the 
+  depth of the subdirectories (0 - only the directory itself).
+  
+  """
+  
+  pattern = _file_pattern(extension, prefix)
+  
+  stack = [(dir_path, 0)]
+  
+  while len(stack):
+    path, depth = stack.pop()
     
-    # looking for files in a directory
-    file_list_dir = glob.glob("*.%s" % (extension))
+    files, dirs = _scan_dir(path)
     
-    # adding directory to the path 
-    for i in range(len(file_list_dir)):
-      file_list_dir[i] = os.path.join(dir_path_add, file_list_dir[i])
-       
-    # joining two lists, python makes it so easy :)
-    file_list += file_list_dir
+    for name in sorted(files):
+      if pattern.match(name):
+        yield os.path.join(path, name)
     
-    os.chdir(cwd)
-        
-  return file_list
+    if (max_depth is None) or (depth < max_depth):
+      for name in sorted(dirs, reverse=True):
+        stack.append((os.path.join(path, name), depth + 1))
 
-def get_file_list_recursive(extension="*", file_list=[], dir_path=None, recurs_iter=0, recurs_max=8):
+def find_files(dir_path=".", extension="*", prefix=None, max_depth=None, threads=1):
   """
-  Returns a list of files with a specific extension by analysing directories recursively
+  Returns the sorted list of the files (prefix*.extension) of a directory tree. With threads > 1 the 
+  directories of every level of the tree are scanned concurrently (on network file systems the traversal
+  is bound by the latency of the metadata requests).
   
   """
+  
+  if threads == 1:
+    return sorted(iter_files(dir_path, extension=extension, prefix=prefix, max_depth=max_depth))
+  
+  pattern = _file_pattern(extension, prefix)
+  
+  file_list = []
+  
+  level = [dir_path]
+  depth = 0
+  
+  pool = multiprocessing.pool.ThreadPool(threads)
+  
+  while len(level):
+    results = pool.map(_scan_dir, level)
+    
+    next_level = []
+    
+    for path, (files, dirs) in zip(level, results):
+      file_list.extend(os.path.join(path, name) for name in files if pattern.match(name))
+      
+      if (max_depth is None) or (depth < max_depth):
+        next_level.extend(os.path.join(path, name) for name in dirs)
+    
+    level = next_level
+    depth += 1
+  
+  pool.close()
+  pool.join()
+  
+  file_list.sort()
+  
+  return file_list
 
-  cwd = os.getcwd()
-  if dir_path is not None:
-    os.chdir(dir_path)
+class FileManifest(object):
+  """
+  Cached listing of a directory tree: the files (with their size and modification time) and the subdirectories
+  of every directory. A directory whose modification time has not changed is not listed again and only the 
+  files of the changed directories are stated (a file modified in place is detected with verify=True).
+  
+  """
   
-  dir_path_add = os.getcwd()
+  def __init__(self, manifestFile):
+    """
+    Loads the manifest file (if it exists).
+    
+    """
+    
+    self.manifestFile = manifestFile
+    
+    # directory -> [mtime, {file name : [size, mtime] or None}, [subdirectories]]
+    self.dirs = {}
+    
+    if os.path.isfile(manifestFile):
+      f = open(manifestFile, "r")
+      self.dirs = json.load(f)
+      f.close()
   
-  for _, dirs, files in os.walk("./"):
+  def save(self):
+    """
+    Saves the manifest file.
+    
+    """
+    
+    tmpFile = self.manifestFile + ".tmp"
+    
+    f = open(tmpFile, "w")
+    json.dump(self.dirs, f)
+    f.close()
+    
+    os.rename(tmpFile, self.manifestFile)
+  
+  def scan(self, dir_path=".", extension="*", prefix=None, max_depth=None, verify=False):
+    """
+    Updates the manifest of a directory tree.
+    
+    Returns the sorted list of (path, size, mtime) of the files (prefix*.extension) and the list of the files 
+    which are new or have changed since the last scan.
     
-    if len(dirs) > 0:
-      for dir_recur in dirs:
-        file_list_dir = get_file_list_recursive(extension=extension, file_list=file_list, 
-                                      dir_path=dir_recur, recurs_iter=recurs_iter+1, recurs_max=recurs_max)
+    """
+    
+    pattern = _file_pattern(extension, prefix)
+    
+    entries = []
+    changed = []
+    visited = set()
+    
+    stack = [(os.path.abspath(dir_path), 0)]
+    
+    while len(stack):
+      path, depth = stack.pop()
       
-    else:
-      file_list_dir = glob.glob("*.%s" % (extension))
+      try:
+        dir_mtime = os.stat(path).st_mtime
+      except OSError:
+        continue
+      
+      visited.add(path)
+      
+      cached = self.dirs.get(path)
+      
+      if (cached is not None) and (cached[0] == dir_mtime):
+        old_files = cached[1]
+        files = old_files
+        dirs = cached[2]
       
-      # adding directory to the path 
-      for i in range(len(file_list_dir)):
-        file_list_dir[i] = os.path.join(dir_path_add, file_list_dir[i])
+      else:
+        old_files = cached[1] if (cached is not None) else {}
+        
+        file_names, dirs = _scan_dir(path)
+        files = dict((name, None) for name in file_names)
+        
+        self.dirs[path] = [dir_mtime, files, dirs]
+      
+      for name in files:
+        if not pattern.match(name):
+          continue
         
-      # joining two lists, python makes it so easy :)
-      file_list += file_list_dir
+        file_path = os.path.join(path, name)
         
-  os.chdir(cwd)
+        if (files[name] is None) or verify:
+          try:
+            st = os.stat(file_path)
+          except OSError:
+            continue
+          
+          old_stat = old_files.get(name)
+          files[name] = [st.st_size, st.st_mtime]
+          
+          if old_stat != files[name]:
+            changed.append(file_path)
+        
+        entries.append((file_path, files[name][0], files[name][1]))
+      
+      if (max_depth is None) or (depth < max_depth):
+        for name in dirs:
+          stack.append((os.path.join(path, name), depth + 1))
     
-  return file_list
+    # forgetting the removed directories
+    if max_depth is None:
+      root = os.path.abspath(dir_path)
+      
+      for path in list(self.dirs.keys()):
+        if (path == root or path.startswith(root + os.sep)) and (path not in visited):
+          del self.dirs[path]
+    
+    entries.sort()
+    changed.sort()
+    
+    return entries, changed
 
 def get_file_list_pre_sub(prefix="*", subfix="*"):
   """
@@ -300,6 +516,22 @@ def removeFile(filePath):
   
   return success, error
 
+def linkFile(sourceFile, targetFile):
+  """
+  Hard links a file (copies it if the file system does not support hard links). An existing target file is
+  replaced.
+  
+  """
+  
+  if os.path.lexists(targetFile):
+    os.unlink(targetFile)
+  
+  try:
+    os.link(sourceFile, targetFile)
+  
+  except OSError:
+    shutil.copyfile(sourceFile, targetFile)
+
 def read_in_systems(systems_paths_list):
   """
   Reads in systems form a list of paths and returns a system list
@@ -383,14 +615,17 @@ def readSystemFromFile(file_name):
     if system is None:
       error = "System cannot be read from file: %s" % (file_name)
   
-  elif file_name.endswith(".out"):
+  elif file_name.endswith(".out") or file_name.endswith(".output"):
+    
+    # imported here: Fhiaims imports IO
+    import Fhiaims
     
     print ("Trying to read [%s]." % (file_name))
     
     cwd = os.getcwd()
         
     # changing into fhiaims simulation dir
-    os.chdir(os.path.dirname(file_name))
+    os.chdir(os.path.dirname(os.path.abspath(file_name)))
     
     # getting fhiaims output file name
     aims_output_file = os.path.basename(file_name)
@@ -839,12 +1074,151 @@ def readSystemFromFileXYZ(fileName):
     
     return system
 
-def save_systems_to_xyz(systems_list, dir_path):
+def _species_symbols(system):
+  """
+  Returns the species symbols of all atoms.
+  
+  """
+  
+  return np.asarray(system.specieList)[system.specie[:system.NAtoms]]
+
+def _positions(system):
+  """
+  Returns the x, y and z columns of the positions.
+  
+  """
+  
+  pos = system.pos[:3*system.NAtoms].reshape(-1, 3)
+  
+  return pos[:, 0], pos[:, 1], pos[:, 2]
+
+def _xyz_frame(system, scfDone=True):
+  """
+  Returns the system formatted as an XYZ frame.
+  
+  """
+  
+  metaData = ""
+  
+  if system.cellDims[0] != 0.0 and system.cellDims[1] != 0.0 and system.cellDims[2] != 0.0:
+    metaData = "%.10f %.10f %.10f" % (system.cellDims[0], system.cellDims[1], system.cellDims[2])
+  
+  elif scfDone and system.totalEnergy != None and system.totalEnergy != 0.0:
+    metaData = "SCF Done             %.10e;" % (system.totalEnergy)
+  
+  x, y, z = _positions(system)
+  
+  return "%d\n%s\n%s" % (system.NAtoms, metaData, 
+    Utilities.format_block("%s %.10f %.10f %.10f %.2f\n", [_species_symbols(system), x, y, z, system.charge[:system.NAtoms]]))
+
+def _car_atoms(system):
+  """
+  Returns the atoms of the system formatted as CAR/ARC lines.
+  
+  """
+  
+  symbols = _species_symbols(system)
+  labels = np.char.add(symbols, np.arange(1, system.NAtoms + 1).astype(str))
+  
+  x, y, z = _positions(system)
+  
+  return Utilities.format_block("%-7s %13.10f %13.10f %13.10f XXXX 1      xx      %-2s %.4f\n", 
+                       [labels, x, y, z, symbols, system.charge[:system.NAtoms]])
+
+def _arc_frame(system, PBC):
+  """
+  Returns the system formatted as an ARC frame.
+  
+  """
+  
+  frame = "%s %.10f\n!DATE\n" % (system.name, system.totalEnergy)
+  
+  if PBC:
+    frame += "PBC %.4f %.4f %.4f %.4f %.4f %.4f (P1)\n" % (system.cellDims[0], system.cellDims[1], system.cellDims[2], 
+                                                         system.cellAngles[0], system.cellAngles[1], 
+                                                         system.cellAngles[2])
+  
+  return frame + _car_atoms(system) + "end\nend\n"
+
+class TrajectoryWriter(object):
   """
-  Saves systems into xyz files
+  Appendable multi-frame writer: all systems (e.g. unique clusters or frames of a trajectory) are saved 
+  into one XYZ or ARC file.
   
   """
   
+  def __init__(self, outputFile, fileFormat="xyz", append=False, scfDone=True):
+    """
+    Opens the output file (fileFormat: xyz or arc).
+    
+    """
+    
+    self.outputFile = outputFile
+    self.fileFormat = fileFormat.lower()
+    self.scfDone = scfDone
+    self.framesCnt = 0
+    
+    if self.fileFormat not in ("xyz", "arc"):
+      raise ValueError("Unsupported multi-frame format: %s" % (fileFormat))
+    
+    # the ARC header is written with the first frame
+    self._header = not (append and os.path.isfile(outputFile) and os.path.getsize(outputFile) > 0)
+    self._PBC = None
+    
+    self.fout = open(outputFile, "a" if append else "w", _writeBufferSize)
+  
+  def __enter__(self):
+    
+    return self
+  
+  def __exit__(self, excType, excValue, traceback):
+    
+    self.close()
+  
+  def write(self, system):
+    """
+    Appends the system as a new frame.
+    
+    """
+    
+    if self.fileFormat == "xyz":
+      self.fout.write(_xyz_frame(system, self.scfDone))
+    
+    else:
+      if self._PBC is None:
+        self._PBC = bool(np.all(system.cellDims != 0.0))
+      
+      if self._header:
+        self.fout.write("!BIOSYM archive 3\nPBC=%s\n" % ("ON" if self._PBC else "OFF"))
+        self._header = False
+      
+      self.fout.write(_arc_frame(system, self._PBC))
+    
+    self.framesCnt += 1
+  
+  def close(self):
+    """
+    Closes the output file.
+    
+    """
+    
+    if self.fout is not None:
+      self.fout.close()
+      self.fout = None
+
+def save_systems_to_xyz(systems_list, dir_path, file_name=None):
+  """
+  Saves systems into xyz files, or into one multi-frame xyz file if the file_name is given
+  
+  """
+  
+  if file_name is not None:
+    with TrajectoryWriter(os.path.join(dir_path, file_name), "xyz") as writer:
+      for system in systems_list:
+        writer.write(system)
+    
+    return
+  
   rank = 1
   for system in systems_list:
     
@@ -855,6 +1229,88 @@ def save_systems_to_xyz(systems_list, dir_path):
   
     rank += 1
     
+class GinTemplate(object):
+  """
+  Parsed GIN template (Master.gin): the header and the footer surrounding the coordinates.
+  
+  """
+  
+  def __init__(self, fileName, mtime, header, footer):
+    """
+    Stores the parsed template.
+    
+    """
+    
+    self.fileName = fileName
+    self.mtime = mtime
+    self.header = header
+    self.footer = footer
+  
+  def write(self, system, outputFile, outputXYZ=False):
+    """
+    Writes system as a GIN file with the template's header and footer.
+    
+    """
+    
+    error = ""
+    success = True
+    
+    try:
+      fout = open(outputFile, "w")
+    except:
+      success = False
+      error = __name__ + ": Cannot open: " + outputFile
+       
+      return success, error
+    
+    x, y, z = _positions(system)
+    
+    fout.write(self.header)
+    
+    fout.write(Utilities.format_block("%s %s %13.10f %13.10f %13.10f %s\n", 
+                                      [_species_symbols(system), system.gulpAtomType[:system.NAtoms], x, y, z, 
+                                       system.gulpAtomExtraInfo[:system.NAtoms]]))
+    
+    fout.write(self.footer)
+    
+    # adding output to xyz
+    if outputXYZ:
+      fout.write("\noutput xyz %s" % (outputFile[:-4]))
+    
+    fout.close()
+    
+    return success, error
+
+# parsed GIN templates: path -> GinTemplate
+_ginTemplates = {}
+
+def load_gin_template(fileName):
+  """
+  Returns the parsed GIN template. The template is parsed once and cached until the file is modified.
+  
+  Returns template (None on failure), error.
+  
+  """
+  
+  if (not os.path.isfile(fileName)):
+    return None, __name__ + ": could not locate Master.gin file"
+  
+  key = os.path.abspath(fileName)
+  mtime = os.path.getmtime(fileName)
+  
+  template = _ginTemplates.get(key)
+  
+  if (template is None) or (template.mtime != mtime):
+    masterSystem, error, header, footer = readSystemFromFileGIN(fileName, outputMode=True)
+    
+    if (masterSystem is None):
+      return None, error
+    
+    template = GinTemplate(fileName, mtime, header, footer)
+    _ginTemplates[key] = template
+  
+  return template, ""
+
 def writeGIN(system, outputFile, controlFile=None, outputXYZ=False):
   """
   Writes system as a GIN file.
@@ -875,58 +1331,43 @@ def writeGIN(system, outputFile, controlFile=None, outputXYZ=False):
     
     return success, error
   
-  if (not os.path.isfile(masterGinFile)):
-    success = False
-    error = __name__ + ": could not locate Master.gin file"
-
-    return success, error
-    
-  masterSystem, error, header, footer = readSystemFromFileGIN(masterGinFile, outputMode=True)
-  
-  if (masterSystem is None):
-    success = False
-    return success, error
+  template, error = load_gin_template(masterGinFile)
   
-  try:
-    fout = open(outputFile, "w")
-  except:
+  if (template is None):
     success = False
-    error = __name__ + ": Cannot open: " + filePath
-     
     return success, error
   
-  fout.write(header)
+  return template.write(system, outputFile, outputXYZ=outputXYZ)
 
-  for i in range(system.NAtoms):
-    tempStr = system.specieList[system.specie[i]]
-    
-#     gulpSpecies = masterSystem.gulpSpecies[tempStr]
-#     
-#     gulpSpeciesArr = gulpSpecies.split(";")
-#     
-#     for j in range(len(gulpSpeciesArr)):
-#       if len(gulpSpeciesArr[j].strip()) > 0:
-#         
-#         gulpSpeciesArr2 = gulpSpeciesArr[j].split(",")
-#                 
-#         type = gulpSpeciesArr2[0].strip()
-#         
-#         try:
-#           charge = float(gulpSpeciesArr2[1].strip())
-#         except:
-#           charge = 0.0
-
-    fout.write("%s %s %13.10f %13.10f %13.10f %s\n" % 
-              (tempStr, system.gulpAtomType[i], system.pos[3*i], system.pos[3*i+1], system.pos[3*i+2], system.gulpAtomExtraInfo[i])) 
-     
-  fout.write(footer)
+def _writeGINStar(args):
+  """
+  Unpacks the arguments for the worker pool.
+  
+  """
   
-  # adding output to xyz
-  if outputXYZ:
-    fout.write("\noutput xyz %s" % (outputFile[:-4]))
+  return writeGIN(*args)
 
-  fout.close()
-    
+def write_gin_files(systems_list, output_files, controlFile=None, outputXYZ=False, processes=None):
+  """
+  Writes the systems as GIN files in a process pool (processes=None uses all cores). The template is parsed 
+  once per process.
+  
+  Returns success, error (of the first failed system).
+  
+  """
+  
+  success = True
+  error = ""
+  
+  args = [(system, output_file, controlFile, outputXYZ) for system, output_file in zip(systems_list, output_files)]
+  
+  results = Utilities.pool_map(_writeGINStar, args, processes)
+  
+  for output_file, (successS, errorS) in zip(output_files, results):
+    if (not successS) and success:
+      success = False
+      error = "%s: %s" % (output_file, errorS)
+  
   return success, error
   
 def writeCAR(system, outputFile):
@@ -948,7 +1389,7 @@ def writeCAR(system, outputFile):
     fout = open(outputFile, "w")
   except:
     success = False
-    error = __name__ + ": Cannot open: " + filePath
+    error = __name__ + ": Cannot open: " + outputFile
     
     return success, error
   
@@ -965,14 +1406,7 @@ def writeCAR(system, outputFile):
   fout.write("\n")
   fout.write("%s\n" % "!DATE")
   
-  for i in range(system.NAtoms):
-    
-    tempStr =  ("%s%d" % (system.specieList[system.specie[i]], i+1))
-    tempStr = "{:<7}".format(tempStr)
-    
-    fout.write("%7s %13.10f %13.10f %13.10f XXXX 1      xx      %2s %.4f\n" % (tempStr, 
-      system.pos[3*i], system.pos[3*i+1], system.pos[3*i+2], 
-      "{:<2}".format(system.specieList[system.specie[i]]), system.charge[i]))
+  fout.write(_car_atoms(system))
   
   fout.write("end\n")
   fout.write("end\n")
@@ -1000,13 +1434,13 @@ def writeAimsGeometry(system, outputFile):
     fout = open(outputFile, "w")
   except:
     success = False
-    error = __name__ + ": Cannot open: " + filePath
+    error = __name__ + ": Cannot open: " + outputFile
     
     return success, error
   
-  for i in range(system.NAtoms):
-    fout.write("atom %.10f %.10f %.10f %s\n" % (system.pos[3*i], system.pos[3*i+1], system.pos[3*i+2], 
-      system.specieList[system.specie[i]]))
+  x, y, z = _positions(system)
+  
+  fout.write(Utilities.format_block("atom %.10f %.10f %.10f %s\n", [x, y, z, _species_symbols(system)]))
   
   fout.close()
   
@@ -1042,22 +1476,7 @@ def writeXYZ(system, outputFile, scfDone=True):
     
     return success, error
     
-  fout.write("%d\n" % system.NAtoms)
-  
-  metaData = ""
-  
-  if system.cellDims[0] != 0.0 and system.cellDims[1] != 0.0 and system.cellDims[2] != 0.0:
-    meta_data = "%.10f %.10f %.10f" % (system.cellDims[0], system.cellDims[1], system.cellDims[2])
-
-  elif scfDone and system.totalEnergy != None and system.totalEnergy != 0.0:
-    metaData = "SCF Done             %.10e;" % (system.totalEnergy)
-  
-  fout.write("%s\n" % (metaData))
-
-  for i in range(system.NAtoms):
-        
-    fout.write("%s %.10f %.10f %.10f %.2f\n" % (system.specieList[system.specie[i]], 
-      system.pos[3*i], system.pos[3*i+1], system.pos[3*i+2], system.charge[i]))
+  fout.write(_xyz_frame(system, scfDone))
   
   fout.close()
     
@@ -0,0 +1,291 @@
+"""
+Jobs module. A local job runner: executes a simulation command in many directories concurrently without
+oversubscribing the node, records the state of every directory and resumes after an interruption.
+
+@author Tomas Lazauskas
+"""
+
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import time
+
+from Messages import log
+
+# verbose level: 0 - off, 1 - on
+_verbose = 1
+
+_stateFile = "jobs_state.json"
+
+# the line of a successfully finished FHI-aims simulation
+_niceDayLine = "Have a nice day."
+
+_statusRunning = "running"
+_statusDone = "done"
+_statusFailed = "failed"
+_statusSkipped = "skipped"
+_statusInterrupted = "interrupted"
+
+# placeholder of the number of cores in the command
+_coresPlaceholder = "{cores}"
+
+# seconds an interrupted simulation is given to exit before it is killed
+_stopGracePeriod = 10.0
+
+def _terminate(signum, frame):
+  """
+  SIGTERM handler of a run: the simulations are stopped as after Ctrl+C.
+  
+  """
+  
+  raise KeyboardInterrupt
+
+def is_completed(outputFile, completedLine=_niceDayLine):
+  """
+  Checks whether the output file contains the line of a successfully finished simulation.
+  
+  """
+  
+  if (completedLine is None) or (not os.path.isfile(outputFile)):
+    return False
+  
+  f = open(outputFile, "r")
+  
+  completed = False
+  for line in f:
+    if completedLine in line:
+      completed = True
+      break
+  
+  f.close()
+  
+  return completed
+
+class JobRunner(object):
+  """
+  Runs a command (its output is redirected to the output file) in a list of directories.
+  
+  At most jobs simulations run at the same time and every simulation gets coresPerJob cores (substituted for
+  {cores} in the command and set as OMP_NUM_THREADS): the number of concurrent simulations is limited so that
+  they do not use more than totalCores cores (totalCores=None - all the cores of the node).
+  
+  The start, end and status of every directory are saved in the state file after every change. The directories
+  whose output file contains the completed line are skipped, hence an interrupted run is resumed by running it
+  again.
+  
+  """
+  
+  def __init__(self, command, outputFile, jobs=1, coresPerJob=1, totalCores=None, stateFile=_stateFile,
+               completedLine=_niceDayLine, pollInterval=0.5):
+    """
+    Constructor. Loads the state file (if it exists).
+    
+    """
+    
+    self.command = command
+    self.outputFile = outputFile
+    self.coresPerJob = max(1, coresPerJob)
+    self.stateFile = stateFile
+    self.completedLine = completedLine
+    self.pollInterval = pollInterval
+    
+    if totalCores is None:
+      totalCores = multiprocessing.cpu_count()
+    
+    self.jobs = max(1, min(jobs, totalCores // self.coresPerJob))
+    
+    # directory -> {"status", "start", "end", "returncode"}
+    self.state = {}
+    
+    if os.path.isfile(stateFile):
+      f = open(stateFile, "r")
+      self.state = json.load(f)
+      f.close()
+  
+  def _save_state(self):
+    """
+    Saves the state file.
+    
+    """
+    
+    tmpFile = self.stateFile + ".tmp"
+    
+    f = open(tmpFile, "w")
+    json.dump(self.state, f, indent=1, sort_keys=True)
+    f.close()
+    
+    os.rename(tmpFile, self.stateFile)
+  
+  def _start(self, dirPath):
+    """
+    Starts the command in the directory in its own process group (the shell and e.g. mpirun and its ranks
+    are stopped together).
+    
+    Returns the process and its output file.
+    
+    """
+    
+    env = dict(os.environ)
+    env["OMP_NUM_THREADS"] = str(self.coresPerJob)
+    
+    command = self.command.replace(_coresPlaceholder, str(self.coresPerJob))
+    
+    out = open(os.path.join(dirPath, self.outputFile), "w")
+    null = open(os.devnull, "r")
+    
+    process = subprocess.Popen(command, shell=True, cwd=dirPath, env=env, stdin=null, stdout=out,
+                               stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+    
+    null.close()
+    
+    self.state[dirPath] = {"status" : _statusRunning, "start" : time.time(), "end" : None, "returncode" : None}
+    self._save_state()
+    
+    return process, out
+  
+  def _stop(self, process):
+    """
+    Stops the process group of a simulation: SIGTERM, then SIGKILL if it is still running after the grace 
+    period. Waits until the whole group has exited.
+    
+    """
+    
+    for sig in [signal.SIGTERM, signal.SIGKILL]:
+      try:
+        os.killpg(process.pid, sig)
+      
+      except OSError:
+        break
+      
+      timeEnd = time.time() + _stopGracePeriod
+      
+      while time.time() < timeEnd:
+        process.poll()
+        
+        # the group is empty
+        try:
+          os.killpg(process.pid, 0)
+        
+        except OSError:
+          return
+        
+        time.sleep(0.05)
+    
+    process.wait()
+  
+  def _finish(self, dirPath, returncode):
+    """
+    Records the end and the status of the simulation in the directory.
+    
+    """
+    
+    if (returncode == 0) and ((self.completedLine is None) or
+                              is_completed(os.path.join(dirPath, self.outputFile), self.completedLine)):
+      status = _statusDone
+    else:
+      status = _statusFailed
+    
+    self.state[dirPath].update({"status" : status, "end" : time.time(), "returncode" : returncode})
+    self._save_state()
+    
+    return status
+  
+  def is_done(self, dirPath):
+    """
+    Checks whether the simulation in the directory has finished: its output file contains the completed line
+    (or it is recorded as done if there is no completed line).
+    
+    """
+    
+    if self.completedLine is None:
+      return self.state.get(dirPath, {}).get("status") in [_statusDone, _statusSkipped]
+    
+    return is_completed(os.path.join(dirPath, self.outputFile), self.completedLine)
+  
+  def run(self, dirList):
+    """
+    Runs the simulations in the directories (in the given order). Ctrl+C or SIGTERM (e.g. from the batch
+    system) stop the running simulations and record them as interrupted.
+    
+    Returns success (no simulation failed), error, (number of done, failed and skipped directories).
+    
+    """
+    
+    pending = []
+    skippedCnt = 0
+    
+    for dirPath in dirList:
+      if self.is_done(dirPath):
+        
+        if self.state.get(dirPath, {}).get("status") != _statusDone:
+          self.state[dirPath] = {"status" : _statusSkipped, "start" : None, "end" : None, "returncode" : None}
+        
+        skippedCnt += 1
+        continue
+      
+      pending.append(dirPath)
+    
+    self._save_state()
+    
+    log(__name__, "Running %d simulations (%d skipped), %d at a time with %d cores each" % (len(pending),
+      skippedCnt, self.jobs, self.coresPerJob), verbose=_verbose)
+    
+    pending.reverse()
+    running = {}
+    
+    doneCnt = 0
+    failed = []
+    
+    previousHandler = signal.signal(signal.SIGTERM, _terminate)
+    
+    try:
+      while len(pending) or len(running):
+        
+        while len(pending) and (len(running) < self.jobs):
+          dirPath = pending.pop()
+          running[dirPath] = self._start(dirPath)
+          
+          log(__name__, "Started: %s" % (dirPath), 1, verbose=_verbose)
+        
+        time.sleep(self.pollInterval)
+        
+        for dirPath in sorted(running.keys()):
+          process, out = running[dirPath]
+          
+          returncode = process.poll()
+          
+          if returncode is None:
+            continue
+          
+          out.close()
+          del running[dirPath]
+          
+          status = self._finish(dirPath, returncode)
+          
+          if status == _statusDone:
+            doneCnt += 1
+          else:
+            failed.append(dirPath)
+          
+          log(__name__, "Finished (%s): %s" % (status, dirPath), 1, verbose=_verbose)
+    
+    except KeyboardInterrupt:
+      for dirPath, (process, out) in running.items():
+        self._stop(process)
+        out.close()
+        
+        self.state[dirPath].update({"status" : _statusInterrupted, "end" : time.time()})
+      
+      self._save_state()
+      
+      raise
+    
+    finally:
+      signal.signal(signal.SIGTERM, previousHandler)
+    
+    success = (len(failed) == 0)
+    error = "" if success else "Simulations failed in: %s" % (", ".join(failed))
+    
+    return success, error, (doneCnt, len(failed), skippedCnt)
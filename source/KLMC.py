@@ -0,0 +1,673 @@
+"""
+KLMC module. Reading of the KLMC GA simulation archives (one N.tar.gz per GA iteration) without
+extracting them onto the disk.
+
+@author Tomas Lazauskas
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import tarfile
+
+import numpy as np
+
+import Utilities
+
+_statsPrefix = "gaStatistics"
+_statsSubfix = ".csv"
+_tarSubfix = ".tar.gz"
+_popKLMCDir = "POP"
+_popSubfix = "_1.xyz"
+
+# number of archives whose member index (and statistics file) is kept in memory
+_maxCachedArchives = 64
+
+# columnar statistics store
+_storeMetaFile = "store.json"
+_maxStoreChunks = 32
+
+# archive path -> GAArchive
+_archiveCache = collections.OrderedDict()
+
+# a record of the genealogy index
+GARecord = collections.namedtuple("GARecord", ["generation", "rank", "name", "hashkey", "energy", "origin", "gaGenNo",
+                                               "parent1", "parent2"])
+
+def get_archive_path(stepNo, dirPath=None):
+  """
+  Returns the path to the archive of the GA iteration.
+  
+  """
+  
+  archivePath = "%d%s" % (stepNo, _tarSubfix)
+  
+  if dirPath is not None:
+    archivePath = os.path.join(dirPath, archivePath)
+  
+  return archivePath
+
+def get_stats_file_name(stepNo):
+  """
+  Returns the name of the statistics file of the GA iteration.
+  
+  """
+  
+  return "%s%d%s" % (_statsPrefix, stepNo, _statsSubfix)
+
+class GAArchive(object):
+  """
+  Member index of a GA iteration archive.
+  
+  The index is built with one pass through the archive, afterwards a member is found without scanning the
+  members again and the statistics file is kept in memory. Reading a member still decompresses the archive
+  up to that member (a gzip stream cannot be seeked), hence read the members once.
+  
+  """
+  
+  def __init__(self, archivePath):
+    """
+    Builds the member index of the archive.
+    
+    """
+    
+    self.path = archivePath
+    self.mtime = os.path.getmtime(archivePath)
+    
+    tar = tarfile.open(archivePath, "r:gz")
+    
+    try:
+      self.members = dict((member.name, member) for member in tar.getmembers() if member.isfile())
+    
+    finally:
+      tar.close()
+    
+    self._statsLines = {}
+  
+  def find_member(self, fileName):
+    """
+    Returns the name of the member with the file name (in any directory) or None.
+    
+    """
+    
+    for name in sorted(self.members.keys()):
+      if os.path.basename(name) == fileName:
+        return name
+    
+    return None
+  
+  def read_member(self, name):
+    """
+    Returns the contents of the member.
+    
+    """
+    
+    tar = tarfile.open(self.path, "r:gz")
+    
+    try:
+      data = tar.extractfile(self.members[name]).read()
+    
+    finally:
+      tar.close()
+    
+    return data
+  
+  def pop_files(self):
+    """
+    Returns the sorted names of the files in the POP directory.
+    
+    """
+    
+    return sorted(os.path.basename(name) for name in self.members
+                  if os.path.basename(os.path.dirname(name)) == _popKLMCDir)
+  
+  def stats_lines(self, stepNo):
+    """
+    Returns the lines of the statistics file of the GA iteration or None if it is not in the archive.
+    
+    """
+    
+    if stepNo not in self._statsLines:
+      name = self.find_member(get_stats_file_name(stepNo))
+      
+      if name is None:
+        return None
+      
+      self._statsLines[stepNo] = self.read_member(name).splitlines()
+    
+    return self._statsLines[stepNo]
+
+def open_archive(archivePath):
+  """
+  Returns the (cached) GAArchive. The cached index is rebuilt if the archive has been modified.
+  
+  """
+  
+  key = os.path.abspath(archivePath)
+  
+  archive = _archiveCache.pop(key, None)
+  
+  if (archive is None) or (archive.mtime != os.path.getmtime(archivePath)):
+    archive = GAArchive(archivePath)
+  
+  _archiveCache[key] = archive
+  
+  if len(_archiveCache) > _maxCachedArchives:
+    _archiveCache.popitem(last=False)
+  
+  return archive
+
+def read_stats_lines(stepNo, dirPath=None):
+  """
+  Reads the statistics file of the GA iteration straight from its archive.
+  
+  Returns success, error, lines.
+  
+  """
+  
+  archivePath = get_archive_path(stepNo, dirPath)
+  
+  try:
+    archive = open_archive(archivePath)
+  
+  except (IOError, OSError, tarfile.TarError) as e:
+    return False, "cannot read %s: %s" % (archivePath, e), None
+  
+  lines = archive.stats_lines(stepNo)
+  
+  if lines is None:
+    return False, "%s does not contain %s" % (archivePath, get_stats_file_name(stepNo)), None
+  
+  return True, "", lines
+
+def read_pop_files(stepNo, dirPath=None):
+  """
+  Lists the files in the POP directory of the GA iteration archive.
+  
+  Returns success, error, file names.
+  
+  """
+  
+  archivePath = get_archive_path(stepNo, dirPath)
+  
+  try:
+    archive = open_archive(archivePath)
+  
+  except (IOError, OSError, tarfile.TarError) as e:
+    return False, "cannot read %s: %s" % (archivePath, e), None
+  
+  return True, "", archive.pop_files()
+
+def save_stats_file(stepNo, outputFile, dirPath=None):
+  """
+  Saves the statistics file of the GA iteration from its archive.
+  
+  Returns success, error.
+  
+  """
+  
+  success, error, lines = read_stats_lines(stepNo, dirPath)
+  
+  if not success:
+    return success, error
+  
+  f = open(outputFile, "w")
+  
+  for line in lines:
+    f.write("%s\n" % (line))
+  
+  f.close()
+  
+  return success, error
+
+def _read_generation(archivePath, generation):
+  """
+  Reads the statistics file and the POP directory of a GA iteration archive.
+  
+  Returns generation, mtime, records (None if the archive cannot be read).
+  
+  """
+  
+  mtime = os.path.getmtime(archivePath)
+  
+  try:
+    archive = GAArchive(archivePath)
+    lines = archive.stats_lines(generation)
+  
+  except (IOError, OSError, tarfile.TarError):
+    return generation, mtime, None
+  
+  if lines is None:
+    return generation, mtime, None
+  
+  # POP files are named rank_name_1.xyz
+  names = {}
+  for popFile in archive.pop_files():
+    if popFile.endswith(_popSubfix):
+      rank, _, name = popFile[:-len(_popSubfix)].partition("_")
+      
+      try:
+        names.setdefault(int(rank), name)
+      
+      except ValueError:
+        pass
+  
+  records = []
+  
+  # the rank is the line number in the statistics file (the header is line 0)
+  for rank in xrange(1, len(lines)):
+    array = lines[rank].strip().split(",")
+    
+    if len(array) < 16:
+      continue
+    
+    try:
+      records.append(GARecord(generation, rank, names.get(rank), array[2], float(array[5]), array[14],
+                              int(array[15]), array[8], array[9]))
+    
+    except ValueError:
+      continue
+  
+  return generation, mtime, records
+
+def _read_generation_star(args):
+  """
+  Unpacks the arguments for the worker pool.
+  
+  """
+  
+  return _read_generation(*args)
+
+def get_generations(dirPath=None):
+  """
+  Returns the sorted GA iteration numbers of the archives in the directory.
+  
+  """
+  
+  generations = []
+  
+  for fileName in os.listdir(dirPath if dirPath is not None else "."):
+    if fileName.endswith(_tarSubfix):
+      try:
+        generations.append(int(fileName[:-len(_tarSubfix)]))
+      
+      except ValueError:
+        continue
+  
+  return sorted(generations)
+
+class GenealogyIndex(object):
+  """
+  Persistent (SQLite) index of the statistics of all GA iterations: generation, rank, POP file name, hashkey,
+  energy, origin, GA generation number and parents of every structure.
+  
+  The index is built once, afterwards only new or modified archives are scanned. Lineage queries are
+  indexed lookups instead of archive extractions.
+  
+  """
+  
+  def __init__(self, dbPath):
+    """
+    Opens (creates) the index database.
+    
+    """
+    
+    self.dbPath = dbPath
+    self.connection = sqlite3.connect(dbPath)
+    
+    self.connection.execute("CREATE TABLE IF NOT EXISTS generations (generation INTEGER PRIMARY KEY, mtime REAL)")
+    
+    self.connection.execute("CREATE TABLE IF NOT EXISTS structures (generation INTEGER, rank INTEGER, name TEXT, "
+                            "hashkey TEXT, energy REAL, origin TEXT, gaGenNo INTEGER, parent1 TEXT, parent2 TEXT, "
+                            "PRIMARY KEY (generation, rank))")
+    
+    self.connection.execute("CREATE INDEX IF NOT EXISTS structures_hashkey ON structures (generation, hashkey)")
+    self.connection.execute("CREATE INDEX IF NOT EXISTS structures_name ON structures (generation, name)")
+    
+    self.connection.commit()
+  
+  def close(self):
+    """
+    Closes the database.
+    
+    """
+    
+    if self.connection is not None:
+      self.connection.close()
+      self.connection = None
+  
+  def update(self, dirPath=None, processes=None):
+    """
+    Scans the archives of the GA iterations which are new or have been modified since the last update
+    (in a process pool, processes=None uses all cores).
+    
+    Returns the number of scanned archives.
+    
+    """
+    
+    indexed = dict(self.connection.execute("SELECT generation, mtime FROM generations"))
+    
+    args = []
+    for generation in get_generations(dirPath):
+      archivePath = get_archive_path(generation, dirPath)
+      
+      if indexed.get(generation) != os.path.getmtime(archivePath):
+        args.append((archivePath, generation))
+    
+    results = Utilities.pool_imap(_read_generation_star, args, processes, ordered=False)
+    
+    for generation, mtime, records in results:
+      self.connection.execute("DELETE FROM structures WHERE generation = ?", (generation,))
+      
+      if records is not None:
+        self.connection.executemany("INSERT INTO structures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+      
+      self.connection.execute("INSERT OR REPLACE INTO generations VALUES (?, ?)", (generation, mtime))
+    
+    self.connection.commit()
+    
+    return len(args)
+  
+  def _query(self, condition, params):
+    """
+    Returns the first (lowest rank) record matching the condition or None.
+    
+    """
+    
+    row = self.connection.execute("SELECT * FROM structures WHERE %s ORDER BY rank LIMIT 1" % (condition),
+                                  params).fetchone()
+    
+    return GARecord(*row) if row is not None else None
+  
+  def find_lowest(self, generation):
+    """
+    Returns the lowest energy (rank 1) structure of the generation.
+    
+    """
+    
+    return self._query("generation = ?", (generation,))
+  
+  def find_hashkey(self, generation, hashkey):
+    """
+    Returns the structure of the generation with the hashkey.
+    
+    """
+    
+    return self._query("generation = ? AND hashkey = ?", (generation, hashkey))
+  
+  def find_file(self, generation, name):
+    """
+    Returns the structure of the generation saved in the POP directory under the name.
+    
+    """
+    
+    return self._query("generation = ? AND name = ?", (generation, name.strip()))
+  
+  def trace_ancestry(self, generation, maxDepth=None):
+    """
+    Generator which traces the ancestry of the lowest energy structure of the generation (depth first,
+    the first parent before the second one). Yields depth, generation, record (None if the structure
+    could not be located). Every structure is visited once.
+    
+    """
+    
+    stack = [(0, generation, None, None)]
+    visited = set()
+    
+    while len(stack) > 0:
+      depth, generation, lookFor, value = stack.pop()
+      
+      if lookFor is None:
+        record = self.find_lowest(generation)
+      
+      elif lookFor == "#":
+        record = self.find_hashkey(generation, value)
+      
+      else:
+        record = self.find_file(generation, value)
+      
+      if record is not None:
+        if (record.generation, record.rank) in visited:
+          continue
+        
+        visited.add((record.generation, record.rank))
+      
+      yield depth, generation, record
+      
+      if record is None:
+        continue
+      
+      # the repopulated or mutated/crossed over structures are looked for by their hashkey
+      if record.origin in ("REPOPM", "MUTCRS"):
+        nextGeneration = record.gaGenNo if record.gaGenNo < generation else generation - 1
+        
+        stack.append((depth, nextGeneration, "#", record.hashkey))
+      
+      # the parents are looked for in the POP directory
+      elif record.origin in ("MUTATE", "CROSSO"):
+        if (maxDepth is not None) and (depth + 1 >= maxDepth):
+          continue
+        
+        nextGeneration = record.gaGenNo - 1 if record.gaGenNo < generation else generation - 1
+        
+        stack.append((depth + 1, nextGeneration, "f", record.parent2))
+        stack.append((depth + 1, nextGeneration, "f", record.parent1))
+
+def _read_stats_columns(filePath, generation):
+  """
+  Reads the statistics file (from the archive or a plain csv file) of the GA iteration into columns.
+  
+  Returns generation, columns (None if the file cannot be read).
+  
+  """
+  
+  try:
+    if filePath.endswith(_tarSubfix):
+      lines = GAArchive(filePath).stats_lines(generation)
+    
+    else:
+      f = open(filePath, "r")
+      lines = f.read().splitlines()
+      f.close()
+  
+  except (IOError, OSError, tarfile.TarError):
+    return generation, None
+  
+  if lines is None:
+    return generation, None
+  
+  rows = [line.split(",") for line in lines[1:]]
+  rows = [row for row in rows if len(row) > 5]
+  
+  columns = {"generation" : np.empty(len(rows), np.int32),
+             "edfn" : np.empty(len(rows), np.int32),
+             "status" : np.empty(len(rows), np.int32),
+             "energy" : np.empty(len(rows), np.float64)}
+  
+  columns["generation"][:] = generation
+  
+  for i, row in enumerate(rows):
+    columns["edfn"][i] = int(row[3])
+    columns["status"][i] = int(row[4])
+    columns["energy"][i] = float(row[5])
+  
+  return generation, columns
+
+def _read_stats_columns_star(args):
+  """
+  Unpacks the arguments for the worker pool.
+  
+  """
+  
+  return _read_stats_columns(*args)
+
+def get_stats_files(dirPath=None):
+  """
+  Returns a dictionary generation -> statistics file of the GA iterations in the directory: the archives or,
+  for the iterations which have not been archived yet, the plain statistics files in their directories.
+  
+  """
+  
+  dirPath = dirPath if dirPath is not None else "."
+  
+  statsFiles = {}
+  
+  for fileName in os.listdir(dirPath):
+    filePath = os.path.join(dirPath, fileName)
+    
+    if fileName.isdigit() and os.path.isfile(os.path.join(filePath, get_stats_file_name(int(fileName)))):
+      statsFiles.setdefault(int(fileName), os.path.join(filePath, get_stats_file_name(int(fileName))))
+  
+  for generation in get_generations(dirPath):
+    statsFiles[generation] = get_archive_path(generation, dirPath)
+  
+  return statsFiles
+
+class GAStatsStore(object):
+  """
+  Columnar store of the statistics of all GA iterations. Every update appends the new GA iterations as a chunk
+  of .npy files (one per column) and records the last processed iteration, the columns are read without 
+  parsing the statistics files again.
+  
+  Columns: generation, edfn, status, energy (rows in the order of the statistics files).
+  
+  """
+  
+  columns = ["generation", "edfn", "status", "energy"]
+  
+  def __init__(self, storeDir):
+    """
+    Opens (creates) the store.
+    
+    """
+    
+    self.storeDir = storeDir
+    
+    if not os.path.isdir(storeDir):
+      os.makedirs(storeDir)
+    
+    self.lastGeneration = -1
+    self.chunks = 0
+    
+    metaPath = os.path.join(storeDir, _storeMetaFile)
+    
+    if os.path.isfile(metaPath):
+      f = open(metaPath, "r")
+      meta = json.load(f)
+      f.close()
+      
+      self.lastGeneration = meta["lastGeneration"]
+      self.chunks = meta["chunks"]
+  
+  def _chunk_path(self, chunk, column):
+    """
+    Returns the path to the column's file of the chunk.
+    
+    """
+    
+    return os.path.join(self.storeDir, "%s_%04d.npy" % (column, chunk))
+  
+  def _save_meta(self):
+    """
+    Saves the last processed GA iteration and the number of chunks.
+    
+    """
+    
+    f = open(os.path.join(self.storeDir, _storeMetaFile), "w")
+    json.dump({"lastGeneration" : self.lastGeneration, "chunks" : self.chunks}, f)
+    f.close()
+  
+  def update(self, dirPath=None, processes=None):
+    """
+    Appends the GA iterations newer than the last processed one (the archives are read in a process pool,
+    processes=None uses all cores). The last (possibly running) iteration is not processed if it has not 
+    been archived yet. The iterations from the first one which cannot be read are left for the next update.
+    
+    Returns the number of appended GA iterations.
+    
+    """
+    
+    statsFiles = get_stats_files(dirPath)
+    
+    generations = [generation for generation in sorted(statsFiles) if generation > self.lastGeneration]
+    
+    # the current iteration can still be running
+    if (len(generations) > 0) and (not statsFiles[generations[-1]].endswith(_tarSubfix)):
+      generations = generations[:-1]
+    
+    if len(generations) == 0:
+      return 0
+    
+    args = [(statsFiles[generation], generation) for generation in generations]
+    
+    results = Utilities.pool_map(_read_stats_columns_star, args, processes)
+    
+    # the iterations are stored up to the first one which cannot be read (yet), it is read again next time
+    readResults = []
+    
+    for generation, columns in results:
+      if columns is None:
+        print ("Error reading in the statistics of GA iteration %d" % (generation))
+        break
+      
+      readResults.append(columns)
+    
+    results = readResults
+    
+    if len(results) > 0:
+      for column in self.columns:
+        np.save(self._chunk_path(self.chunks, column), np.concatenate([columns[column] for columns in results]))
+      
+      self.chunks += 1
+      
+      self.lastGeneration = generations[len(results) - 1]
+    
+    if self.chunks > _maxStoreChunks:
+      self.compact()
+    
+    self._save_meta()
+    
+    return len(results)
+  
+  def compact(self):
+    """
+    Merges all the chunks into one.
+    
+    """
+    
+    if self.chunks < 2:
+      return
+    
+    for column in self.columns:
+      data = self.read([column])[column]
+      
+      for chunk in xrange(self.chunks):
+        os.remove(self._chunk_path(chunk, column))
+      
+      np.save(self._chunk_path(0, column), data)
+    
+    self.chunks = 1
+    self._save_meta()
+  
+  def read(self, columns=None):
+    """
+    Returns a dictionary of the requested columns (all by default).
+    
+    """
+    
+    if columns is None:
+      columns = self.columns
+    
+    data = {}
+    
+    for column in columns:
+      chunks = [np.load(self._chunk_path(chunk, column), mmap_mode="r") for chunk in xrange(self.chunks)]
+      
+      if len(chunks) > 0:
+        data[column] = np.concatenate(chunks)
+      
+      else:
+        data[column] = np.empty(0, np.float64 if column == "energy" else np.int32)
+    
+    return data
@@ -0,0 +1,207 @@
+"""
+Manifest module. Persistent (SQLite) record of the source files analysed by a script: size, modification time,
+status, parsed energy, hashkey and the parsed system of every file. A rerun reads in only the new or modified
+files and merges them with the recorded ones.
+
+@author Tomas Lazauskas
+"""
+
+import cPickle
+import json
+import os
+import sqlite3
+
+import Utilities
+
+_manifestFile = "manifest.db"
+
+_statusOk = "ok"
+_statusFailed = "failed"
+
+def _read_file_star(args):
+  """
+  Reads in a source file with the reader (a worker of the pool).
+  
+  Returns path, size, mtime, status, energy, error, pickled system (None on failure).
+  
+  """
+  
+  readFunc, path, size, mtime = args
+  
+  try:
+    system, error = readFunc(path)
+  
+  except Exception as e:
+    system = None
+    error = "%s" % (e)
+  
+  if system is None:
+    return path, size, mtime, _statusFailed, None, error, None
+  
+  system.path = path
+  
+  return path, size, mtime, _statusOk, system.totalEnergy, "", cPickle.dumps(system, cPickle.HIGHEST_PROTOCOL)
+
+class AnalysisManifest(object):
+  """
+  Manifest of the analysed source files.
+  
+  The parameters (e.g. the hashkey radius) the records depend on are saved with the manifest: if they change
+  the records are discarded.
+  
+  """
+  
+  def __init__(self, dbPath=_manifestFile, params=None):
+    """
+    Opens (creates) the manifest database.
+    
+    """
+    
+    self.dbPath = dbPath
+    self.connection = sqlite3.connect(dbPath)
+    
+    self.connection.execute("CREATE TABLE IF NOT EXISTS params (name TEXT PRIMARY KEY, value TEXT)")
+    
+    self.connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                            "status TEXT, energy REAL, hashkey TEXT, error TEXT, system BLOB)")
+    
+    self.connection.execute("CREATE INDEX IF NOT EXISTS files_energy ON files (status, energy)")
+    
+    if params is not None:
+      value = json.dumps(params, sort_keys=True)
+      
+      row = self.connection.execute("SELECT value FROM params WHERE name = 'params'").fetchone()
+      
+      if (row is None) or (row[0] != value):
+        self.clear()
+        self.connection.execute("INSERT OR REPLACE INTO params VALUES ('params', ?)", (value,))
+    
+    self.connection.commit()
+  
+  def close(self):
+    """
+    Closes the database.
+    
+    """
+    
+    if self.connection is not None:
+      self.connection.close()
+      self.connection = None
+  
+  def clear(self):
+    """
+    Removes all the records.
+    
+    """
+    
+    self.connection.execute("DELETE FROM files")
+    self.connection.commit()
+  
+  def changed(self, paths):
+    """
+    Returns (path, size, mtime) of the files which are new or have been modified since they were recorded.
+    
+    """
+    
+    recorded = dict((path, (size, mtime)) for path, size, mtime in
+                    self.connection.execute("SELECT path, size, mtime FROM files"))
+    
+    entries = []
+    
+    for path in paths:
+      try:
+        st = os.stat(path)
+      except OSError:
+        continue
+      
+      if recorded.get(path) != (st.st_size, st.st_mtime):
+        entries.append((path, st.st_size, st.st_mtime))
+    
+    return entries
+  
+  def prune(self, paths):
+    """
+    Removes the records of the files which are not in the list (have been removed).
+    
+    Returns the number of removed records.
+    
+    """
+    
+    current = set(paths)
+    
+    removed = [(path,) for (path,) in self.connection.execute("SELECT path FROM files") if path not in current]
+    
+    self.connection.executemany("DELETE FROM files WHERE path = ?", removed)
+    self.connection.commit()
+    
+    return len(removed)
+  
+  def sync(self, paths, readFunc, processes=None, changedPaths=None):
+    """
+    Synchronises the manifest with the source files: reads in the new or modified files with readFunc
+    (path -> system, error; in a process pool, processes=None uses all cores) and removes the records of
+    the files which do not exist anymore.
+    
+    changedPaths: the files which have changed since the last run if they are known (e.g. from
+                  IO.FileManifest.scan), only these and the files without a record are stated. If None,
+                  every file is stated and compared with its record.
+    
+    Returns the number of read, failed and removed files.
+    
+    """
+    
+    removedCnt = self.prune(paths)
+    
+    if changedPaths is not None:
+      recorded = set(path for (path,) in self.connection.execute("SELECT path FROM files"))
+      
+      changedPaths = set(changedPaths)
+      paths = [path for path in paths if (path in changedPaths) or (path not in recorded)]
+    
+    args = [(readFunc, path, size, mtime) for path, size, mtime in self.changed(paths)]
+    
+    results = Utilities.pool_imap(_read_file_star, args, processes, ordered=False)
+    
+    failedCnt = 0
+    
+    for path, size, mtime, status, energy, error, system in results:
+      if status != _statusOk:
+        print ("Error reading in [%s]: %s" % (path, error))
+        failedCnt += 1
+      
+      self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, NULL, ?, ?)",
+                              (path, size, mtime, status, energy, error,
+                               sqlite3.Binary(system) if system is not None else None))
+    
+    self.connection.commit()
+    
+    return len(args), failedCnt, removedCnt
+  
+  def systems(self):
+    """
+    Returns the successfully read systems sorted by their energy. The hashkeys are set if they have been saved.
+    
+    """
+    
+    systems = []
+    
+    for path, hashkey, blob in self.connection.execute("SELECT path, hashkey, system FROM files WHERE status = ? "
+                                                       "ORDER BY energy, path", (_statusOk,)):
+      system = cPickle.loads(str(blob))
+      
+      system.path = path
+      system.hashkey = hashkey if hashkey is not None else ""
+      
+      systems.append(system)
+    
+    return systems
+  
+  def save_hashkeys(self, systems):
+    """
+    Saves the hashkeys of the systems (returned by systems()).
+    
+    """
+    
+    self.connection.executemany("UPDATE files SET hashkey = ? WHERE path = ?",
+                                [(system.hashkey, system.path) for system in systems if system.hashkey != ""])
+    self.connection.commit()
@@ -0,0 +1,380 @@
+"""
+Point groups module. A NumPy implementation of the point group (Schoenflies symbol) detection for clusters.
+
+@author Tomas Lazauskas
+"""
+
+import copy
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import Utilities
+
+# distance tolerance (Angstrom) for matching atoms with their images
+_tolerance = 0.1
+
+# tolerance of the cosine between two axes to be treated as parallel or perpendicular
+_angleTolerance = 0.02
+
+# highest order of the rotation axes which are searched for
+_maxOrder = 8
+
+# number of operations tested at once by the prefilter
+_opsChunk = 512
+
+def rotation_matrices(axes, angle):
+  """
+  Returns the rotation matrices[M, 3, 3] by angle around the unit axes[M, 3]
+  
+  """
+  
+  axes = np.asarray(axes, np.float64).reshape(-1, 3)
+  
+  cos_a = np.cos(angle)
+  sin_a = np.sin(angle)
+  
+  cross = np.zeros([len(axes), 3, 3], np.float64)
+  cross[:, 0, 1] = -axes[:, 2]
+  cross[:, 0, 2] = axes[:, 1]
+  cross[:, 1, 0] = axes[:, 2]
+  cross[:, 1, 2] = -axes[:, 0]
+  cross[:, 2, 0] = -axes[:, 1]
+  cross[:, 2, 1] = axes[:, 0]
+  
+  return cos_a * np.eye(3) + sin_a * cross + (1.0 - cos_a) * axes[:, :, np.newaxis] * axes[:, np.newaxis, :]
+
+def reflection_matrices(normals):
+  """
+  Returns the reflection matrices[M, 3, 3] through the planes with the unit normals[M, 3]
+  
+  """
+  
+  normals = np.asarray(normals, np.float64).reshape(-1, 3)
+  
+  return np.eye(3) - 2.0 * normals[:, :, np.newaxis] * normals[:, np.newaxis, :]
+
+def _unit_vectors(vectors, tolerance):
+  """
+  Normalises the vectors, drops the short ones and the duplicates (v and -v are the same axis).
+  
+  """
+  
+  vectors = np.asarray(vectors, np.float64).reshape(-1, 3)
+  
+  norms = np.sqrt(np.sum(vectors * vectors, axis=1))
+  vectors = vectors[norms > tolerance] / norms[norms > tolerance, np.newaxis]
+  
+  if len(vectors) == 0:
+    return vectors
+  
+  # canonical direction: the largest component is positive
+  largest = np.argmax(np.abs(vectors), axis=1)
+  signs = np.sign(vectors[np.arange(len(vectors)), largest])
+  vectors *= signs[:, np.newaxis]
+  
+  _, index = np.unique(np.round(vectors, 3), axis=0, return_index=True)
+  
+  return vectors[np.sort(index)]
+
+def _unique_axes(axes, orders):
+  """
+  Merges the parallel axes, returns the axes and the sets of their orders.
+  
+  """
+  
+  unique_axes = []
+  unique_orders = []
+  
+  for axis, order in zip(axes, orders):
+    for i in range(len(unique_axes)):
+      if abs(np.dot(unique_axes[i], axis)) > 1.0 - _angleTolerance:
+        unique_orders[i].add(order)
+        break
+    
+    else:
+      unique_axes.append(axis)
+      unique_orders.append(set([order]))
+  
+  return unique_axes, unique_orders
+
+class _Cluster(object):
+  """
+  Centred cluster with the structures used for testing symmetry operations.
+  
+  """
+  
+  def __init__(self, system, tolerance):
+    """
+    Centres the cluster on its centre of mass and finds its principal axes.
+    
+    """
+    
+    self.tolerance = tolerance
+    
+    cluster = copy.deepcopy(system)
+    cluster.calcCOM()
+    
+    self.pos = cluster.pos.reshape(-1, 3)
+    self.pos -= cluster.com
+    
+    cluster.calcMOI()
+    
+    _, eigenvectors = np.linalg.eigh(cluster.momentOfInertia)
+    
+    # the first axis has the smallest moment of inertia
+    self.principalAxes = eigenvectors.T
+    
+    self.specie = np.array(cluster.specie[:cluster.NAtoms], np.int32)
+    self.radii = np.sqrt(np.sum(self.pos * self.pos, axis=1))
+    
+    self.trees = []
+    for spec in np.unique(self.specie):
+      mask = self.specie == spec
+      self.trees.append((mask, cKDTree(self.pos[mask])))
+    
+    self.shells = self._find_shells()
+  
+  def _find_shells(self):
+    """
+    Groups the atoms into shells of the same specie and distance from the centre, sorted by the size.
+    
+    """
+    
+    shells = []
+    
+    for spec in np.unique(self.specie):
+      indices = np.where(self.specie == spec)[0]
+      indices = indices[np.argsort(self.radii[indices])]
+      
+      breaks = np.where(np.diff(self.radii[indices]) > self.tolerance)[0] + 1
+      
+      shells.extend(np.split(indices, breaks))
+    
+    shells.sort(key=len)
+    
+    return shells
+  
+  def is_linear(self):
+    """
+    Checks whether all atoms lie on the axis of the smallest moment of inertia.
+    
+    """
+    
+    axis = self.principalAxes[0]
+    perpendicular = self.pos - np.outer(np.dot(self.pos, axis), axis)
+    
+    return np.all(np.sum(perpendicular * perpendicular, axis=1) < self.tolerance * self.tolerance)
+  
+  def candidate_axes(self):
+    """
+    Returns the directions which may be rotation axes or mirror plane normals: the principal axes, directions
+    to the atoms, sums, differences and cross products of pairs from the two smallest shells and normals
+    of the triplets from the smallest shell of at least three atoms.
+    
+    """
+    
+    candidates = [self.principalAxes, self.pos]
+    
+    pair_shells = [shell for shell in self.shells if len(shell) > 1][:2]
+    
+    for shell in pair_shells:
+      i, j = np.triu_indices(len(shell), 1)
+      
+      pos_i = self.pos[shell[i]]
+      pos_j = self.pos[shell[j]]
+      
+      candidates.extend([pos_i + pos_j, pos_i - pos_j, np.cross(pos_i, pos_j)])
+    
+    triplet_shells = [shell for shell in self.shells if len(shell) > 2][:1]
+    
+    for shell in triplet_shells:
+      for first in shell[:2]:
+        others = shell[shell != first]
+        j, k = np.triu_indices(len(others), 1)
+        
+        candidates.append(np.cross(self.pos[others[j]] - self.pos[first], self.pos[others[k]] - self.pos[first]))
+    
+    return _unit_vectors(np.concatenate(candidates), 1.0e-6)
+  
+  def prefilter(self, ops):
+    """
+    Returns a mask of the operations[M, 3, 3] which map the smallest shell onto itself.
+    
+    """
+    
+    shell_pos = self.pos[self.shells[0]]
+    mask = np.empty(len(ops), np.bool)
+    
+    for start in range(0, len(ops), _opsChunk):
+      images = np.einsum("mij,kj->mki", ops[start:start + _opsChunk], shell_pos)
+      
+      diff = images[:, :, np.newaxis, :] - shell_pos[np.newaxis, np.newaxis, :, :]
+      dist2 = np.sum(diff * diff, axis=3)
+      
+      mask[start:start + _opsChunk] = np.all(dist2.min(axis=2) < self.tolerance * self.tolerance, axis=1)
+    
+    return mask
+  
+  def is_operation(self, op):
+    """
+    Checks whether every atom is mapped on an atom of the same specie by the operation.
+    
+    """
+    
+    images = np.dot(self.pos, op.T)
+    
+    for mask, tree in self.trees:
+      dist, _ = tree.query(images[mask], distance_upper_bound=self.tolerance)
+      
+      if not np.all(np.isfinite(dist)):
+        return False
+    
+    return True
+  
+  def valid_operations(self, ops):
+    """
+    Returns a mask of the symmetry operations.
+    
+    """
+    
+    mask = self.prefilter(ops)
+    
+    for i in np.where(mask)[0]:
+      mask[i] = self.is_operation(ops[i])
+    
+    return mask
+  
+  def has_inversion(self):
+    """
+    Checks whether the cluster has the centre of inversion.
+    
+    """
+    
+    return self.is_operation(-np.eye(3))
+  
+  def has_mirror(self, normals):
+    """
+    Checks whether there is a mirror plane with one of the normals.
+    
+    """
+    
+    if len(normals) == 0:
+      return False
+    
+    return np.any(self.valid_operations(reflection_matrices(normals)))
+  
+  def rotation_axes(self, candidates):
+    """
+    Finds the proper rotation axes among the candidates. Returns the axes and the sets of their orders.
+    
+    """
+    
+    axes = []
+    orders = []
+    
+    for order in range(2, _maxOrder + 1):
+      mask = self.valid_operations(rotation_matrices(candidates, 2.0 * np.pi / order))
+      
+      axes.extend(candidates[mask])
+      orders.extend([order] * np.count_nonzero(mask))
+    
+    return _unique_axes(axes, orders)
+
+def get_point_group(system, tolerance=_tolerance):
+  """
+  Returns the point group (Schoenflies symbol) of a cluster.
+  
+  """
+  
+  if system.NAtoms == 0:
+    return ""
+  
+  if system.NAtoms == 1:
+    return "Kh"
+  
+  cluster = _Cluster(system, tolerance)
+  
+  # linear molecules
+  if cluster.is_linear():
+    return "D*h" if cluster.has_inversion() else "C*v"
+  
+  candidates = cluster.candidate_axes()
+  
+  axes, orders = cluster.rotation_axes(candidates)
+  
+  # no rotation axes
+  if len(axes) == 0:
+    if cluster.has_mirror(candidates):
+      return "Cs"
+    
+    elif cluster.has_inversion():
+      return "Ci"
+    
+    return "C1"
+  
+  maxOrders = np.array([max(axisOrders) for axisOrders in orders])
+  
+  # cubic and icosahedral groups have more than one axis of order three or higher
+  if np.count_nonzero(maxOrders >= 3) > 1:
+    if np.any(maxOrders == 5):
+      return "Ih" if cluster.has_inversion() else "I"
+    
+    elif np.any(maxOrders == 4):
+      return "Oh" if cluster.has_inversion() else "O"
+    
+    elif cluster.has_inversion():
+      return "Th"
+    
+    elif cluster.has_mirror(candidates):
+      return "Td"
+    
+    return "T"
+  
+  # main axis: the highest order axis
+  mainIndex = np.argmax(maxOrders)
+  mainAxis = axes[mainIndex]
+  n = maxOrders[mainIndex]
+  
+  perpendicularC2 = [i for i in range(len(axes)) if (i != mainIndex) and (2 in orders[i]) and
+                     (abs(np.dot(axes[i], mainAxis)) < _angleTolerance)]
+  
+  horizontalMirror = cluster.has_mirror(mainAxis)
+  verticalNormals = candidates[np.abs(np.dot(candidates, mainAxis)) < _angleTolerance]
+  
+  if len(perpendicularC2) > 0:
+    if horizontalMirror:
+      return "D%dh" % (n)
+    
+    elif cluster.has_mirror(verticalNormals):
+      return "D%dd" % (n)
+    
+    return "D%d" % (n)
+  
+  if horizontalMirror:
+    return "C%dh" % (n)
+  
+  elif cluster.has_mirror(verticalNormals):
+    return "C%dv" % (n)
+  
+  elif np.any(cluster.valid_operations(np.matmul(reflection_matrices(mainAxis), 
+                                                 rotation_matrices(mainAxis, np.pi / n)))):
+    return "S%d" % (2 * n)
+  
+  return "C%d" % (n)
+
+def _get_point_group_star(args):
+  """
+  Unpacks the arguments for the worker pool.
+  
+  """
+  
+  return get_point_group(*args)
+
+def get_point_groups(systems, tolerance=_tolerance, processes=None):
+  """
+  Returns the point groups of a list of clusters evaluated in parallel (processes=None uses all cores).
+  
+  """
+  
+  return Utilities.pool_map(_get_point_group_star, [(system, tolerance) for system in systems], processes)
@@ -1,13 +1,18 @@
 #!/usr/bin/env python
 
-#import jpype
 import os
-import jpype
-from jpype import *
+
+try:
+  import jpype
+  from jpype import *
+  jpype_imported = True
+except:
+  jpype_imported = False
 
 import Constants
 import IO
 import Messages
+import PointGroups
 import timer
 import Utilities
 
@@ -24,6 +29,9 @@ class Symmetrizer:
   """
   A class to control JAVA environment and launch symmetry identification code.
   
+  If JPype or the JVM is not available (or useJVM is False) the point groups are evaluated by 
+  the PointGroups module instead, in parallel over the worker processes.
+  
   """
   
   def __del__(self):
@@ -33,7 +41,7 @@ class Symmetrizer:
     
     self.__shutdownJVM()
   
-  def __init__(self, options=None, args=None, standAlone=True):
+  def __init__(self, options=None, args=None, standAlone=True, useJVM=True, processes=None):
     """
     Constructor
     """
@@ -42,18 +50,21 @@ class Symmetrizer:
     
     self._globJVMOn = False
     self._globJVMSymm = None
+    self._globJVMMolecule = None
+    self._globJVMSymmetry = None
     
-    randomName = Utilities.get_random_name(8)
-    
-    self._globJVMOutPath =  os.path.join(self.cwd, "jvm%s.out" % (randomName))
-    self._globJVMErrPath =  os.path.join(self.cwd, "jvm%s.err" % (randomName))
+    self._globJVMOut = None
+    self._globJVMErr = None
     
     self._options = options
     self._args = args
     
     self._input = None
     
-    self.__startJVM()
+    self._processes = processes
+    
+    if useJVM and jpype_imported:
+      self.__startJVM()
   
   def __startJVM(self):
     """
@@ -67,13 +78,19 @@ class Symmetrizer:
       
       self._globJVMOn = True
       self._globJVMSymm = JPackage('net.webmo.symmetry').Main
+      self._globJVMMolecule = JPackage('net.webmo.symmetry.molecule').Molecule
+      self._globJVMSymmetry = JPackage('net.webmo.symmetry').Symmetry
       Messages.log(__name__, "JVM initialised!", verbose=1)
-            
-      #TODO: In future this should be done via streams
-      fs = jpype.JClass("java.io.File")
+      
+      # the output of the symmetrizer is captured in memory
+      bs = jpype.JClass("java.io.ByteArrayOutputStream")
       ps = jpype.JClass("java.io.PrintStream")
-      jpype.java.lang.System.setOut(ps(fs(self._globJVMOutPath)))
-      jpype.java.lang.System.setErr(ps(fs(self._globJVMErrPath)))
+      
+      self._globJVMOut = bs()
+      self._globJVMErr = bs()
+      
+      jpype.java.lang.System.setOut(ps(self._globJVMOut, True))
+      jpype.java.lang.System.setErr(ps(self._globJVMErr, True))
 
     except:
       self._globJVMOn = False
@@ -91,52 +108,50 @@ class Symmetrizer:
       self._globJVMOn = False
       self._globJVMSymm = None
       Messages.log(__name__, "JVM shut down!", verbose=1)
-      
-      self._deleteJVMOutputFiles()
   
-  def _deleteJVMOutputFiles(self):
+  def _readJVMOutput(self):
     """
-    Deletes JVM output files.
+    Returns the captured JVM output lines and clears the output streams.
     """
-
-    try:
-      IO.removeFile(self._globJVMOutPath)
-      IO.removeFile(self._globJVMErrPath)
-      
-    except:
-      Messages.warning(__name__, "Cannot remove JVM output files!", verbose=2)
+    
+    lines = str(self._globJVMOut.toString()).splitlines()
+    
+    self._globJVMOut.reset()
+    self._globJVMErr.reset()
+    
+    return lines
   
-  def _clearJVMOutputFiles(self):
+  def _getSymmetryMolecule(self, clusterO):
     """
-    Clears JVM output files.
+    Evaluates the symmetry of a cluster passed to the symmetrizer as an in-memory molecule.
+    
     """
-
-    try:
-      open(self._globJVMOutPath, 'w').close()
-      open(self._globJVMErrPath, 'w').close()
-      
-    except:
-      Messages.warning(__name__, "Cannot remove JVM output files!", verbose=2)
+    
+    molecule = self._globJVMMolecule()
+    
+    for i in xrange(clusterO.NAtoms):
+      molecule.addAtom(str(clusterO.specieList[clusterO.specie[i]]), 
+                       float(clusterO.pos[3*i]), float(clusterO.pos[3*i+1]), float(clusterO.pos[3*i+2]))
+    
+    pointGroups = self._globJVMSymmetry(molecule.getAtoms(), clusterO.name, float(_tolerance)).getPointGroups()
+    
+    self._readJVMOutput()
+    
+    if pointGroups.size() == 0:
+      return False, "Could not find the symmetry from symmetrizer", ""
+    
+    return True, "", str(pointGroups.get(0).getName())
   
-  def getSymmetry(self, clusterO):
+  def _getSymmetryMain(self, clusterO):
     """
-    Evaluates the symmetry (point group) of a cluster.
+    Evaluates the symmetry of a cluster by running the symmetrizer on an xyz file.
     
     """
     
-    success = True
-    error = ""
     symmetry = ""
     
-    if not self._globJVMOn:
-      success = False
-      error = "JVM is has not been initialized"
-      
-      return success, error, symmetry
-    
     # Saves a cluster in to an xyz file.
-    cwd = os.getcwd()
-    tempClusterFile = "%s/%s.xyz" % (cwd, Utilities.get_random_name(10))
+    tempClusterFile = os.path.join(os.getcwd(), "%s.xyz" % (Utilities.get_random_name(10)))
     
     success, error = IO.writeXYZ(clusterO, tempClusterFile, scfDone=False)
     
@@ -151,21 +166,62 @@ class Symmetrizer:
       #TODO: catch the Symmetrizer error
       success = False
       error = "error while running Symmetrizer"
-       
-      return success, error, symmetry
     
     IO.removeFile(tempClusterFile)
     
-    #TODO: In future this should be done via streams
-    success, error, symmetry = _getSymmetryFromFile(self._globJVMOutPath, self._globJVMErrPath)
+    if success:
+      success, error, symmetry = _getSymmetryFromOutput(self._readJVMOutput())
     
-    self._clearJVMOutputFiles()
+    return success, error, symmetry
+  
+  def getSymmetries(self, clusters):
+    """
+    Evaluates the symmetries (point groups) of a list of clusters in one JVM session.
+    
+    Returns a list of point groups, an empty string for the clusters whose symmetry could not be found.
+    
+    """
+    
+    success = True
+    error = ""
+    symmetries = []
     
-    return  success, error, symmetry   
+    if not self._globJVMOn:
+      symmetries = PointGroups.get_point_groups(clusters, processes=self._processes)
+      
+      return success, error, symmetries
+    
+    for clusterO in clusters:
+      try:
+        successC, errorC, symmetry = self._getSymmetryMolecule(clusterO)
+      
+      except:
+        # falling back to the command line interface of the symmetrizer
+        successC, errorC, symmetry = self._getSymmetryMain(clusterO)
+      
+      if not successC and success:
+        success = False
+        error = "%s: %s" % (clusterO.name, errorC)
+      
+      symmetries.append(symmetry)
+    
+    return success, error, symmetries
+  
+  def getSymmetry(self, clusterO):
+    """
+    Evaluates the symmetry (point group) of a cluster.
+    
+    """
+    
+    success, error, symmetries = self.getSymmetries([clusterO])
+    
+    symmetry = symmetries[0] if len(symmetries) else ""
+    
+    return success, error, symmetry
 
-def _getSymmetryFromFile(outFilePath, errFilePath):
+def _getSymmetryFromOutput(lines):
   """
-  Reads the symmetry value from the symmetrizer output. At the end clears the files.
+  Reads the symmetry value from the symmetrizer output lines.
   
   """
     
@@ -173,25 +229,11 @@ def _getSymmetryFromFile(outFilePath, errFilePath):
   error = ""
   symmetry = ""
   
-  # reading the symmetrizer output and looking for symmetry
-  if not os.path.isfile(outFilePath):
-    print "File [%s] doesn't exist." % (outFilePath)
-    return success, error, symmetry
-  
-  try:
-    f = open(outFilePath)
-  except:
-    print "Cannot read file [%s]" % (outFilePath)
-    return success, error, symmetry
-  
-  i = 0
-  
   startLooking = 0
   symmetryFound = 0
   
-  for line in f:
+  for line in lines:
     
-    i += 1
     line = line.strip()
     
     if not startLooking and _pointGroupFound in line:
@@ -209,24 +251,9 @@ def _getSymmetryFromFile(outFilePath, errFilePath):
           symmetryFound = 1
           
         break
-    
-  f.close()
   
   if not symmetryFound:
     success = False
     error = "Could not find the symmetry from symmetrizer"
-  
-  # Removing the output
-  try:
-    open(outFilePath, 'w').close()
-    open(errFilePath, 'w').close()
-    
-  except:
-    f = open(outFilePath, 'r+')
-    f.truncate()
-    
-    f = open(errFilePath, 'r+')
-    f.truncate()
 
   return success, error, symmetry
-  
\ No newline at end of file
@@ -11,6 +11,7 @@ import copy
 import math
 import numpy as np
 import os
+import tempfile
 
 # import Atoms
 # import Utilities
@@ -21,6 +22,148 @@ from scipy.constants.constants import Rydberg
 _const_zero_value = 0.0
 _const_def_value = -9999999999.9
 _const_path_to_arvo = "thirdparty/arvo_c/arvo_c"
+_const_root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def get_arvo_path(arvo_path=None):
+  """
+  Returns the path to the arvo_c executable, by default the one compiled in the thirdparty directory.
+  
+  """
+  
+  if arvo_path is None:
+    arvo_path = os.path.join(_const_root_dir, _const_path_to_arvo)
+  
+  return arvo_path
+
+def _parse_arvo_output(output):
+  """
+  Parses the volume, area and the number of spheres from the arvo_c output.
+  
+  """
+  
+  for line in output.splitlines():
+    if line.startswith("Volume:"):
+      output_array = line.split()
+      
+      return True, "", np.float64(output_array[1]), np.float64(output_array[3]), int(output_array[6])
+  
+  return False, "arvo_c output does not contain the results: %s" % (output.strip()), None, None, None
+
+def _run_arvo(system, radius, arvo_path=None):
+  """
+  Runs arvo_c on the system written to a unique temporary file.
+  
+  Returns success, error, volume, area, spheres.
+  
+  """
+  
+  fd, temp_file = tempfile.mkstemp(suffix=".ats")
+  os.close(fd)
+  
+  try:
+    success, error = system._writeATS(temp_file, radius)
+    
+    if not success:
+      return success, error, None, None, None
+    
+    command = "\"%s\" protein=\"%s\"" % (get_arvo_path(arvo_path), temp_file)
+    output, stderr, status = Utilities.run_sub_process(command)
+    
+    if status:
+      return False, "arvo_c failed (%s): %s" % (status, (output + stderr).strip()), None, None, None
+    
+    return _parse_arvo_output(output)
+  
+  finally:
+    os.unlink(temp_file)
+
+def _run_arvo_star(args):
+  """
+  Unpacks the arguments for the worker pool.
+  
+  """
+  
+  return _run_arvo(*args)
+
+def calc_arvo_geo_measures_batch(systems, radius, arvo_path=None, processes=None):
+  """
+  Calculates the volumes and areas of a list of systems with arvo_c running in a process pool 
+  (processes=None uses all cores). The results are saved on the systems in their order.
+  
+  Returns success, error (of the first failed system).
+  
+  """
+  
+  success = True
+  error = ""
+  
+  args = [(system, radius, arvo_path) for system in systems]
+  
+  results = Utilities.pool_map(_run_arvo_star, args, processes)
+  
+  for system, (successS, errorS, volume, area, spheres) in zip(systems, results):
+    if successS:
+      system.arvo_calc = True
+      system.arvo_volume = volume
+      system.arvo_area = area
+      system.arvo_spheres = spheres
+    
+    elif success:
+      success = False
+      error = "%s: %s" % (system.name, errorS)
+  
+  return success, error
+
+def _del_area_star(args):
+  """
+  Unpacks the arguments for the worker pool.
+  
+  """
+  
+  system, radius, backend = args
+  
+  return Utilities.delaunay3DArea(system, radius=radius, backend=backend)
+
+def calc_del_areas(systems, radius=None, backend=None, processes=None):
+  """
+  Calculates the Delaunay's triangulation areas of a list of systems in a process pool
+  (processes=None uses all cores). The results are saved on the systems in their order.
+  
+  """
+  
+  args = [(system, radius, backend) for system in systems]
+  
+  areas = Utilities.pool_map(_del_area_star, args, processes)
+  
+  for system, delArea in zip(systems, areas):
+    if delArea is not None:
+      system.del_calc = True
+      system.del_area = delArea
+
+def _hashkeys_star(args):
+  """
+  Calculates the hashkeys of a batch of systems with one dreadnaut process (a worker of the pool).
+  
+  """
+  
+  systems, hashkeyRadius = args
+  
+  return Utilities.runDreadnautBatch([system.makeGraphString(hashkeyRadius=hashkeyRadius) for system in systems])
+
+def calculate_hashkeys(systems, hashkeyRadius=None, processes=None, batchSize=64):
+  """
+  Calculates the hashkeys of a list of systems in batches (one dreadnaut process per batch) in a process pool
+  (processes=None uses all cores). The hashkeys are saved on the systems in their order.
+  
+  """
+  
+  args = [(systems[i:i+batchSize], hashkeyRadius) for i in range(0, len(systems), batchSize)]
+  
+  results = Utilities.pool_map(_hashkeys_star, args, processes, chunksize=1)
+  
+  for (batch, _), hashkeys in zip(args, results):
+    for system, hashkey in zip(batch, hashkeys):
+      system.hashkey = hashkey
 
 class System(object):
   """
@@ -138,6 +281,7 @@ class System(object):
     self.antPos = None
     self.onAntPos = None
     self.onAntSpecie = None
+    self.defectResult = None
     
   def addAtom(self, sym, pos, charge):
     """
@@ -314,35 +458,24 @@ class System(object):
     self.momentOfInertia[2][0] = moi[4]
     self.momentOfInertia[2][1] = moi[5]
   
-  def calc_arvo_geo_measures(self, radius):
+  def calc_arvo_geo_measures(self, radius, arvo_path=None):
     """
     Calculates geometrical measures: volume, area
     
     """
     
-    _temp_file = Utilities.get_random_name()
-    _temp_file = "temp"
-    
     # TODO: Need a way set the surface radius for a each atom. Probably add it as 
     #       as a new column in the atoms.in file.
     
-    # prepare a temporary file
-    self._writeATS(_temp_file, radius)
+    success, error, volume, area, spheres = _run_arvo(self, radius, arvo_path)
     
-    command = "%s protein=%s" % ("/Users/Tomas/git/Analysis-Toolkit/thirdparty/arvo_c/arvo_c", _temp_file)
-    output, stderr, status = Utilities.run_sub_process(command)
-        
-    # if the execution of the was successful:
-    if not status:
-      
-      output_array = output.split()
-      
+    if success:
       self.arvo_calc = True
-      self.arvo_volume = np.float64(output_array[1])
-      self.arvo_area = np.float64(output_array[3])
-      self.arvo_spheres = np.int16(output_array[6])
-  
-    os.unlink(_temp_file)
+      self.arvo_volume = volume
+      self.arvo_area = area
+      self.arvo_spheres = spheres
+    
+    return success, error
     
   def calc_arvo_surface_energy(self, radius):
     """
@@ -459,7 +592,7 @@ class System(object):
     for i in xrange(len(self.antisites)):
       print ("Antisite %d : %s on %s : %f %f %f on %f %f %f" % (i+1, 
         self.specieList[self.onAntSpecie[i]], self.specieList[self.antSpecie[i]],
-        self.onAntSpecie[3*i], self.onAntSpecie[3*i+1], self.onAntSpecie[3*i+2],
+        self.onAntPos[3*i], self.onAntPos[3*i+1], self.onAntPos[3*i+2],
         self.antPos[3*i], self.antPos[3*i+1], self.antPos[3*i+2]))
 
   def removeAtom( self, index ):
@@ -612,7 +745,6 @@ class System(object):
     # TODO: Need a way set the surface radius for a each atom. Probably add it as 
     #       as a new column in the atoms.in file.
     
-    atoms_cnt = 0
     error = ""
     success = True
     
@@ -639,12 +771,11 @@ class System(object):
     
     group_name = "LE"
     
-    for i in range(self.NAtoms):
-      atoms_cnt += 1
-            
-      fout.write("%16f %16f %16f %5f %8s %d \n" % 
-                 (self.pos[3*i], self.pos[3*i+1], self.pos[3*i+2], 
-                  radius, group_name, atoms_cnt))
+    pos = self.pos[:3*self.NAtoms].reshape(-1, 3)
+    
+    fout.write(Utilities.format_block("%16f %16f %16f %5f %8s %d \n", 
+                                      [pos[:, 0], pos[:, 1], pos[:, 2], [radius] * self.NAtoms, 
+                                       [group_name] * self.NAtoms, np.arange(1, self.NAtoms + 1)]))
       
     fout.close()
       
@@ -8,21 +8,30 @@ Utilities module.
 """
 
 import copy
-import math
+import itertools
+import multiprocessing
+import numpy as np
 import os
 import random
+import re
 import string
 import sys
 import subprocess
 
+from scipy.spatial import cKDTree, Delaunay
+
 try:
   import vtk
+  from vtk.util import numpy_support
   vtk_imported = True
 except:
   vtk_imported = False
 
 _systems_stats_file = "Stats.csv"
 
+# hashkey line of the dreadnaut output
+_dreadnautHashkeyLine = re.compile(r"^\[\S+ \S+ \S+\]$")
+
 #import Constants
 import Constants
 
@@ -46,22 +55,31 @@ def countUniqueStringOccurences(stringList):
   
   return uniqueStringList, stringOccurenceCnt
 
-def delaunay3DArea(system, radius=None, render=False):
+def delaunay3DArea(system, radius=None, render=False, backend=None):
   """
   Estimates system's area by summing all the triangles from Delaunay's triangulation
   
+  backend: "vtk" (vtkDelaunay3D) or "scipy" (alpha shape of scipy's Delaunay triangulation),
+           by default vtk is used if it is available
+  
   """
   if radius is None:
     delaunayAlpha = 2.0
   else:
     delaunayAlpha = radius
-    
+  
+  points = np.asarray(system.pos[:3*system.NAtoms], np.float64).reshape(-1, 3)
+  
+  if backend is None:
+    backend = "vtk" if vtk_imported else "scipy"
+  
+  if backend == "scipy":
+    return alphaShapeArea(points, delaunayAlpha)
+  
   delaunayTolerance = 1.0
   
   clusterPoints = vtk.vtkPoints()
-    
-  for i in range(system.NAtoms):
-    clusterPoints.InsertPoint(i, system.pos[i*3 + 0], system.pos[i*3 + 1], system.pos[i*3 + 2])
+  clusterPoints.SetData(numpy_support.numpy_to_vtk(points, deep=True))
   
   polyCluster = vtk.vtkPolyData()
   polyCluster.SetPoints(clusterPoints)
@@ -77,19 +95,17 @@ def delaunay3DArea(system, radius=None, render=False):
   clusterSurfaceFilter.SetInputConnection(delaunayCluster.GetOutputPort())
   clusterSurfaceFilter.Update()
   
-  mapClipper = vtk.vtkDataSetMapper()
-  mapClipper.SetInputConnection(clusterSurfaceFilter.GetOutputPort())
+  surface = clusterSurfaceFilter.GetOutput()
   
   surfaceArea = 0.0
+  
+  if surface.GetNumberOfPolys() > 0:
+    surfacePoints = numpy_support.vtk_to_numpy(surface.GetPoints().GetData())
     
-  clipperPointInput = mapClipper.GetInput()  
-  for i in range(clipperPointInput.GetNumberOfCells()):
-    p1 = clipperPointInput.GetCell(i).GetPoints().GetPoint(0)
-    p2 = clipperPointInput.GetCell(i).GetPoints().GetPoint(1)
-    p3 = clipperPointInput.GetCell(i).GetPoints().GetPoint(2)
+    # cells are stored as [3, i, j, k, 3, ...]
+    cells = numpy_support.vtk_to_numpy(surface.GetPolys().GetData()).reshape(-1, 4)
     
-    triangleArea = vtk.vtkTriangle.TriangleArea(p1, p2, p3)
-    surfaceArea += triangleArea
+    surfaceArea = np.sum(triangleAreas(surfacePoints, cells[:, 1:]))
   
   if render:
     
@@ -127,6 +143,72 @@ def delaunay3DArea(system, radius=None, render=False):
   
   return surfaceArea
 
+def triangleAreas(points, triangles):
+  """
+  Returns the areas of the triangles[T, 3] (indices of points[N, 3])
+  
+  """
+  
+  edges1 = points[triangles[:, 1]] - points[triangles[:, 0]]
+  edges2 = points[triangles[:, 2]] - points[triangles[:, 0]]
+  
+  cross = np.cross(edges1, edges2)
+  
+  return 0.5 * np.sqrt(np.sum(cross * cross, axis=1))
+
+def alphaShapeArea(points, alpha):
+  """
+  Returns the surface area of the alpha shape of the points[N, 3]: the boundary triangles of the Delaunay 
+  tetrahedra whose circumradius is not larger than alpha.
+  
+  """
+  
+  points = np.asarray(points, np.float64)
+  
+  if len(points) < 4:
+    return 0.0
+  
+  try:
+    tetrahedra = Delaunay(points).simplices
+  except:
+    # flat or degenerate point sets
+    return 0.0
+  
+  a = points[tetrahedra[:, 0]]
+  u = points[tetrahedra[:, 1]] - a
+  v = points[tetrahedra[:, 2]] - a
+  w = points[tetrahedra[:, 3]] - a
+  
+  # circumcentres relative to the first vertex
+  vw = np.cross(v, w)
+  wu = np.cross(w, u)
+  uv = np.cross(u, v)
+  
+  denominator = 2.0 * np.sum(u * vw, axis=1)
+  
+  numerator = (np.sum(u * u, axis=1)[:, np.newaxis] * vw + np.sum(v * v, axis=1)[:, np.newaxis] * wu + 
+               np.sum(w * w, axis=1)[:, np.newaxis] * uv)
+  
+  valid = np.abs(denominator) > 1.0e-12
+  
+  circumradii = np.empty(len(tetrahedra), np.float64)
+  circumradii[~valid] = np.inf
+  circumradii[valid] = np.sqrt(np.sum(numerator[valid] * numerator[valid], axis=1)) / np.abs(denominator[valid])
+  
+  tetrahedra = tetrahedra[circumradii <= alpha]
+  
+  if len(tetrahedra) == 0:
+    return 0.0
+  
+  # faces of the kept tetrahedra, the boundary faces belong to one tetrahedron only
+  faces = np.concatenate((tetrahedra[:, [0, 1, 2]], tetrahedra[:, [0, 1, 3]], 
+                          tetrahedra[:, [0, 2, 3]], tetrahedra[:, [1, 2, 3]]))
+  faces.sort(axis=1)
+  
+  faces, counts = np.unique(faces, axis=0, return_counts=True)
+  
+  return np.sum(triangleAreas(points, faces[counts == 1]))
+
 def distanceSq(pos1x, pos1y, pos1z, pos2x, pos2y, pos2z):
   """
   Returns a squared distance between two positions in the Cartesian system 
@@ -158,6 +240,61 @@ def atomicSeparation2(atomPos1, atomPos2, cellDims, PBC):
       
   return sep2
 
+def minimum_image(vectors, cellDims, PBC):
+  """
+  Applies the minimum image convention to an array of separation vectors[B, 3]
+  
+  """
+  
+  vectors = np.array(vectors, dtype=np.float64, copy=True)
+  
+  for k in range(3):
+    if PBC[k] == 1:
+      vectors[:, k] -= np.round(vectors[:, k] / cellDims[k]) * cellDims[k]
+  
+  return vectors
+
+def neighbour_list(pos, cellDims, PBC, maxRadius, minRadius=0.0):
+  """
+  Builds a neighbour list (with accounted periodic boundary conditions) using a KD-tree.
+  
+  Returns bond arrays: first atom indices[B], second atom indices[B] (i < j) and 
+  bond lengths[B] for all pairs with minRadius < distance < maxRadius.
+  
+  """
+  
+  points = np.asarray(pos, dtype=np.float64).reshape(-1, 3)
+  boxsize = np.zeros(3, np.float64)
+  
+  if len(points) < 2:
+    return np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float64)
+  
+  # the tree requires periodic dimensions to be wrapped into [0, L)
+  points_tree = points.copy()
+  for k in range(3):
+    if PBC[k] == 1:
+      boxsize[k] = cellDims[k]
+      points_tree[:, k] = np.mod(points_tree[:, k], boxsize[k])
+      points_tree[points_tree[:, k] >= boxsize[k], k] = 0.0
+  
+  tree = cKDTree(points_tree, boxsize=boxsize)
+  pairs = tree.query_pairs(maxRadius, output_type='ndarray')
+  
+  if len(pairs) == 0:
+    return np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float64)
+  
+  pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+  
+  bond_i = pairs[:, 0].astype(np.int32)
+  bond_j = pairs[:, 1].astype(np.int32)
+  
+  separations = minimum_image(points[bond_j] - points[bond_i], cellDims, PBC)
+  distances = np.sqrt(np.sum(separations * separations, axis=1))
+  
+  mask = (distances > minRadius) & (distances < maxRadius)
+  
+  return bond_i[mask], bond_j[mask], distances[mask]
+
 def get_random_name(n=10):
   """
   Generates a n length random string
@@ -174,6 +311,73 @@ def getPathToDreadnaut():
   #nauty25r9
   return os.path.join(os.path.abspath(os.path.dirname(__file__)+"/../"), "thirdparty", "nauty25r9", "dreadnaut")
 
+def _pool_chunksize(argsCnt, processes=None):
+  """
+  Returns the chunk size of the worker pool tasks: a quarter of the tasks of a process.
+  
+  """
+  
+  return max(1, argsCnt // (4 * (processes or multiprocessing.cpu_count())))
+
+def pool_map(func, args, processes=None, chunksize=None):
+  """
+  Applies func to every element of args in a process pool (processes=None uses all cores) or serially if 
+  processes is 1 or there are less than two elements. The pool is closed even if a worker fails.
+  
+  Returns the list of the results in the order of args.
+  
+  """
+  
+  args = list(args)
+  
+  if (processes == 1) or (len(args) < 2):
+    return map(func, args)
+  
+  if chunksize is None:
+    chunksize = _pool_chunksize(len(args), processes)
+  
+  pool = multiprocessing.Pool(processes)
+  
+  try:
+    return pool.map(func, args, chunksize)
+  
+  finally:
+    pool.close()
+    pool.join()
+
+def pool_imap(func, args, processes=None, chunksize=None, ordered=True):
+  """
+  A generator version of pool_map: yields the results as they are calculated (in the order of args if ordered
+  is set). The pool is closed when the generator is exhausted or closed.
+  
+  """
+  
+  args = list(args)
+  
+  if (processes == 1) or (len(args) < 2):
+    for result in itertools.imap(func, args):
+      yield result
+    
+    return
+  
+  if chunksize is None:
+    chunksize = _pool_chunksize(len(args), processes)
+  
+  pool = multiprocessing.Pool(processes)
+  
+  try:
+    if ordered:
+      results = pool.imap(func, args, chunksize)
+    else:
+      results = pool.imap_unordered(func, args, chunksize)
+    
+    for result in results:
+      yield result
+  
+  finally:
+    pool.close()
+    pool.join()
+
 def run_sub_process(command, verbose=0):
   """
   Run command using subprocess module.
@@ -197,17 +401,7 @@ def sort_systems(systems_list):
   
   """
   
-  systems_list_len = len(systems_list)
-
-  for i in range(systems_list_len):
-    for j in range(systems_list_len):
-      if systems_list[i].totalEnergy < systems_list[j].totalEnergy:
-        temp = copy.deepcopy(systems_list[i])
-        
-        systems_list[i] = copy.deepcopy(systems_list[j])
-        systems_list[j] = copy.deepcopy(temp)
-    
-    if (i % 100 == 0): print ("Sorting %d/%d" % (i+1, systems_list_len))
+  systems_list.sort(key=lambda system: system.totalEnergy)
 
 def stringInFile(strExpr, fileObject):
   """
@@ -254,6 +448,21 @@ def systems_statistics(systems_list, dir_path=None):
                                      system.cellDims[0], system.cellDims[1], system.cellDims[2]))
   f.close()
   
+def format_block(lineFormat, columns):
+  """
+  Formats the columns (sequences of the same length) with the line format at once.
+  
+  """
+  
+  rows = len(columns[0])
+  
+  if rows == 0:
+    return ""
+  
+  columns = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns]
+  
+  return (lineFormat * rows) % tuple(itertools.chain.from_iterable(itertools.izip(*columns)))
+
 def runDreadnaut(graphString):
   """
   Runs dreadnaut on the given graph
@@ -286,6 +495,38 @@ def runDreadnaut(graphString):
       print ("WARNING: dreadnaut FAILED")
       return None
      
+def runDreadnautBatch(graphStrings):
+  """
+  Runs one dreadnaut process on the given graphs and returns their hashkeys (None if it failed). The graphs
+  are run one by one if the batch fails.
+  
+  """
+  
+  if len(graphStrings) == 0:
+    return []
+  
+  dreadnaut = getPathToDreadnaut()
+  
+  try:
+    process = subprocess.Popen([dreadnaut], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, stderr = process.communicate("".join(graphStrings) + "q\n")
+    status = process.poll()
+  
+  except OSError as e:
+    output, stderr, status = "", "%s" % (e), 1
+  
+  # the hashkey lines: [xxxxxxxx xxxxxxxx xxxxxxx]
+  hashkeys = [modifyLineHashkey(line.strip()) for line in output.decode("utf-8").split("\n") 
+              if _dreadnautHashkeyLine.match(line.strip())]
+  
+  if status or (len(hashkeys) != len(graphStrings)):
+    print ("WARNING: dreadnaut batch FAILED, running the graphs one by one")
+    print (stderr)
+    
+    return [runDreadnaut(graphString) for graphString in graphStrings]
+  
+  return hashkeys
+     
 def modifyLineHashkey(line):
     """
     Modifies the hashkey line
@@ -314,21 +555,50 @@ def replace_line(file_path, line_no, new_line):
         
 def calculateVibrationalEntropy(eigenValues, temperature):
   """
-  Calculates the vibrational entropy Svib of a set of harmonic vibrations
+  Calculates the vibrational entropy Svib (eV/K) of a set of harmonic vibrations
+  
   """
+  
+  _, entropy, _ = vibrational_thermodynamics(eigenValues, temperature)
+  
+  return entropy[0]
 
-  const = temperature * Constants.kB
+def vibrational_thermodynamics(frequencies, temperatures):
+  """
+  Calculates the harmonic zero point energy, vibrational entropy and vibrational free energy
+  for a batch of systems at a number of temperatures.
   
-  # Expression from DOI:10.1016/j.cplett.2008.01.018
-  sum = 0.0
-  for i in range(len(eigenValues)):
-      
-    value = (planckConst * ( Constants.lightSpeedConts*eigenValues[i] )) / (2.0 * const)
-        
-    valueSinh = 2.0 * math.sinh(value)
-          
-    sum += math.log(valueSinh)
-    
-  vibEnergy = sum * Constants.kB * temperature
+  frequencies[S, M] or [M]: eigenfrequencies (cm^-1), non-positive entries (padding, imaginary modes) are ignored
+  temperatures[T] or scalar: temperatures (K)
+  
+  Returns zpe[S] (eV), entropy[S, T] (eV/K) and free energy[S, T] (eV). 
+  
+  """
+  
+  freqs = np.atleast_2d(np.asarray(frequencies, dtype=np.float64))
+  temps = np.atleast_1d(np.asarray(temperatures, dtype=np.float64))
+  
+  mask = freqs > 0.0
+  
+  # vibrational quanta h*nu (eV)
+  quanta = np.where(mask, Constants.planckConst * Constants.lightSpeedConts * freqs, 0.0)
+  
+  zpe = 0.5 * np.sum(quanta, axis=1)
+  
+  # x = h*nu / (2kT), broadcasted to [S, T, M]
+  kT = Constants.kB * temps
+  x = quanta[:, np.newaxis, :] / (2.0 * kT[np.newaxis, :, np.newaxis])
+  
+  # Expression from DOI:10.1016/j.cplett.2008.01.018: F = kT * sum(ln(2*sinh(x)))
+  # ln(2*sinh(x)) is evaluated as x + ln(1 - exp(-2x)) to avoid overflows
+  x_safe = np.where(mask[:, np.newaxis, :], x, 1.0)
+  ln_2sinh = np.where(mask[:, np.newaxis, :], x_safe + np.log1p(-np.exp(-2.0 * x_safe)), 0.0)
+  x_coth = np.where(mask[:, np.newaxis, :], x_safe / np.tanh(x_safe), 0.0)
+  
+  free_energy = kT[np.newaxis, :] * np.sum(ln_2sinh, axis=2)
+  entropy = Constants.kB * np.sum(x_coth - ln_2sinh, axis=2)
+  
+  if np.ndim(frequencies) == 1:
+    return zpe[0], entropy[0], free_energy[0]
   
-  return vibEnergy
\ No newline at end of file
+  return zpe, entropy, free_energy
@@ -8,6 +8,9 @@
 #include <math.h>
 #include <stdio.h>
 #include <limits.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 #include "defects.h"
 
 /*******************************************************************************
@@ -42,6 +45,112 @@ double atomicSeparation2(double ax, double ay, double az, double bx, double by,
     return r2;
 }
 
+/*******************************************************************************
+ ** return the first reference site (in the box neighbourhood order) within the
+ ** vacancy radius of the given position which has not been filled yet,
+ ** -1 if there is no such site. If filled is NULL all sites are considered.
+ *******************************************************************************/
+static int findReferenceSite(double xpos, double ypos, double zpos, double *refPos, int *filled,
+                             double vacRad2, double *cellDims, int *PBC, struct Boxes *boxes)
+{
+    int j, k, nboxes, checkBox, refIndex;
+    int boxNebList[27];
+    double sep2;
+
+    /* find neighbouring boxes */
+    nboxes = getBoxNeighbourhood(boxIndexOfAtom(xpos, ypos, zpos, boxes), boxNebList, boxes);
+
+    /* loop over neighbouring boxes */
+    for (j = 0; j < nboxes; j++)
+    {
+        checkBox = boxNebList[j];
+
+        /* now loop over all reference atoms in the box */
+        for ( k=0; k<boxes->boxNAtoms[checkBox]; k++ )
+        {
+            refIndex = boxes->boxAtoms[checkBox][k];
+
+            /* if this vacancy has already been filled then skip to the next one */
+            if ( (filled != NULL) && (filled[refIndex] == 0) )
+            {
+                continue;
+            }
+
+            /* atomic separation of possible vacancy and possible interstitial */
+            sep2 = atomicSeparation2(xpos, ypos, zpos, refPos[3*refIndex], refPos[3*refIndex+1], refPos[3*refIndex+2],
+                                     cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+
+            if ( sep2 < vacRad2 )
+            {
+                return refIndex;
+            }
+        }
+    }
+
+    return -1;
+}
+
+/*******************************************************************************
+ ** mark input atoms within the inclusion radius of a defect
+ *******************************************************************************/
+static void markDefectNeighbourhood(double refxpos, double refypos, double refzpos, int NAtoms, double *pos,
+                                    int *defectList, double incRad2, double *cellDims, int *PBC, struct Boxes *boxes)
+{
+    int j, k, nboxes, checkBox, index;
+    int boxNebList[27];
+    double sep2;
+
+    /* find neighbouring boxes */
+    nboxes = getBoxNeighbourhood(boxIndexOfAtom(refxpos, refypos, refzpos, boxes), boxNebList, boxes);
+
+    for (j = 0; j < nboxes; j++)
+    {
+        checkBox = boxNebList[j];
+
+        /* loop over atoms in box */
+        for ( k=0; k<boxes->boxNAtoms[checkBox]; k++ )
+        {
+            index = boxes->boxAtoms[checkBox][k];
+
+            /* if already on defect list continue */
+            if (defectList[index] == 1)
+            {
+                continue;
+            }
+
+            /* if close to defect add to list */
+            sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], refxpos, refypos, refzpos,
+                                     cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+
+            if ( sep2 < incRad2 )
+            {
+                #pragma omp atomic write
+                defectList[index] = 1;
+            }
+        }
+    }
+}
+
+/*******************************************************************************
+ ** box the reference atoms, the returned structure can be reused by
+ ** findDefectsReference for any number of input systems and must be released
+ ** with freeBoxes
+ *******************************************************************************/
+struct Boxes * createReferenceBoxes(int refNAtoms, double *refPos, double vacancyRadius, double *minPos, double *maxPos,
+                                    int *PBC, double *cellDims)
+{
+    double approxBoxWidth;
+    struct Boxes *boxes;
+
+    /* approx width, must be at least vacRad */
+    approxBoxWidth = 1.1 * vacancyRadius;
+
+    boxes = setupBoxes(approxBoxWidth, minPos, maxPos, PBC, cellDims);
+    putAtomsInBoxes(refNAtoms, refPos, boxes);
+
+    return boxes;
+}
+
 /*******************************************************************************
  * Search for defects and return the sub-system surrounding them
  *******************************************************************************/
@@ -52,35 +161,67 @@ int findDefects( int includeVacs, int includeInts, int includeAnts,
 				 int NAtoms, char* specieList, int* specie, double* pos,
 				 int refNAtoms, char* specieListRef, int* specieRef, double* refPos,
 				 double *cellDims, int *PBC, double vacancyRadius, double inclusionRadius, double *minPos, double *maxPos,
-                 int verboseLevel, int debugDefects)
+                 int verboseLevel, int debugDefects, int numThreads)
 {
-    int i, exitLoop, k, j, index;
-    double vacRad2, xpos, ypos, zpos;
-    int boxNebList[27];
+    int count;
+    struct Boxes *refBoxes;
+
+    /* box reference atoms */
+    refBoxes = createReferenceBoxes(refNAtoms, refPos, vacancyRadius, minPos, maxPos, PBC, cellDims);
+
+    count = findDefectsReference(refBoxes, includeVacs, includeInts, includeAnts, defectList, NDefectsByType,
+                                 vacancies, interstitials, antisites, onAntisites,
+                                 inclSpecDim, inclSpec, exclSpecInputDim, exclSpecInput, exclSpecRefDim, exclSpecRef,
+                                 NAtoms, specieList, specie, pos, refNAtoms, specieListRef, specieRef, refPos,
+                                 cellDims, PBC, vacancyRadius, inclusionRadius, minPos, maxPos,
+                                 verboseLevel, debugDefects, numThreads);
+
+    freeBoxes(refBoxes);
+
+    return count;
+}
+
+/*******************************************************************************
+ * Search for defects using reference atoms boxed by createReferenceBoxes
+ *
+ * The per-atom searches are performed in parallel (OpenMP, numThreads <= 0
+ * uses the default number of threads). The order of the vacancies,
+ * interstitials and antisites arrays is identical to the serial search.
+ *******************************************************************************/
+int findDefectsReference( struct Boxes *refBoxes, int includeVacs, int includeInts, int includeAnts,
+				 int* defectList, int* NDefectsByType,
+				 int* vacancies, int* interstitials, int* antisites, int* onAntisites,
+				 int inclSpecDim, int* inclSpec, int exclSpecInputDim, int* exclSpecInput, int exclSpecRefDim, int* exclSpecRef,
+				 int NAtoms, char* specieList, int* specie, double* pos,
+				 int refNAtoms, char* specieListRef, int* specieRef, double* refPos,
+				 double *cellDims, int *PBC, double vacancyRadius, double inclusionRadius, double *minPos, double *maxPos,
+                 int verboseLevel, int debugDefects, int numThreads)
+{
+    int i, j, refIndex;
+    double vacRad2;
     char symtemp[3], symtemp2[3];
-    int checkBox, refIndex, comp, boxIndex;
-    double refxpos, refypos, refzpos;
-    double sep2, incRad2, approxBoxWidth;
+    double incRad2, approxBoxWidth;
     int NDefects, NAntisites, NInterstitials, NVacancies;
     int *possibleVacancy, *possibleInterstitial;
     int *possibleAntisite, *possibleOnAntisite;
-    int count, addToInt, skip;
+    int *firstSite;
+    int count, addToInt, skip, nthreads;
     struct Boxes *boxes;
 
+#ifdef _OPENMP
+    nthreads = (numThreads > 0) ? numThreads : omp_get_max_threads();
+#else
+    nthreads = 1;
+#endif
+
     if ( verboseLevel > 2)
     {
         printf("CLIB: finding defects\n");
         printf("  vac rad %f\n", vacancyRadius);
         printf("  inc rad %f\n", inclusionRadius);
+        printf("  threads %d\n", nthreads);
     }
 
-    /* approx width, must be at least vacRad */
-    approxBoxWidth = 1.1 * vacancyRadius;
-
-    /* box reference atoms */
-    boxes = setupBoxes(approxBoxWidth, minPos, maxPos, PBC, cellDims);
-    putAtomsInBoxes(refNAtoms, refPos, boxes);
-
     /* allocate local arrays for checking atoms */
     possibleVacancy = malloc( refNAtoms * sizeof(int) );
     if (possibleVacancy == NULL)
@@ -110,6 +251,13 @@ int findDefects( int includeVacs, int includeInts, int includeAnts,
         exit(1);
     }
 
+    firstSite = malloc( NAtoms * sizeof(int) );
+    if (firstSite == NULL)
+    {
+        printf("ERROR: Boxes: could not allocate firstSite\n");
+        exit(1);
+    }
+
     /* initialise arrays */
     for ( i=0; i<NAtoms; i++ )
     {
@@ -121,104 +269,62 @@ int findDefects( int includeVacs, int includeInts, int includeAnts,
         possibleAntisite[i] = 1;
     }
 
-    /* build local specie list */
-
     vacRad2 = vacancyRadius * vacancyRadius;
     incRad2 = inclusionRadius * inclusionRadius;
 
-    /* loop over all input atoms */
+    /* find the first reference site of every input atom (in parallel) */
+    #pragma omp parallel for schedule(static) num_threads(nthreads)
     for ( i=0; i<NAtoms; i++ )
     {
-        int nboxes;
-
-        xpos = pos[3*i];
-        ypos = pos[3*i+1];
-        zpos = pos[3*i+2];
+        firstSite[i] = findReferenceSite(pos[3*i], pos[3*i+1], pos[3*i+2], refPos, NULL,
+                                         vacRad2, cellDims, PBC, refBoxes);
+    }
 
-        /* get box index of this atom */
-        boxIndex = boxIndexOfAtom(xpos, ypos, zpos, boxes);
+    /* assign input atoms to reference sites in order, only conflicting atoms are searched again */
+    for ( i=0; i<NAtoms; i++ )
+    {
+        refIndex = firstSite[i];
 
-        /* find neighbouring boxes */
-        nboxes = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+        if ( (refIndex >= 0) && (possibleVacancy[refIndex] == 0) )
+        {
+            refIndex = findReferenceSite(pos[3*i], pos[3*i+1], pos[3*i+2], refPos, possibleVacancy,
+                                         vacRad2, cellDims, PBC, refBoxes);
+        }
 
-        /* loop over neighbouring boxes */
-        exitLoop = 0;
-        for (j = 0; j < nboxes; j++)
+        /* within vacancy radius, is it an antisite or normal lattice point */
+        if ( refIndex >= 0 )
         {
-            if (exitLoop)
-            {
-                break;
-            }
+            /* compare symbols */
+            symtemp[0] = specieList[2*specie[i]];
+            symtemp[1] = specieList[2*specie[i]+1];
+            symtemp[2] = '\0';
 
-            checkBox = boxNebList[j];
+            symtemp2[0] = specieListRef[2*specieRef[refIndex]];
+            symtemp2[1] = specieListRef[2*specieRef[refIndex]+1];
+            symtemp2[2] = '\0';
 
-            /* now loop over all reference atoms in the box */
-            for ( k=0; k<boxes->boxNAtoms[checkBox]; k++ )
+            if ( strcmp( symtemp, symtemp2 ) == 0 )
             {
-                refIndex = boxes->boxAtoms[checkBox][k];
-
-                /* if this vacancy has already been filled then skip to the next one */
-                if ( possibleVacancy[refIndex] == 0 )
-                {
-                    continue;
-                }
-
-                refxpos = refPos[3*refIndex];
-                refypos = refPos[3*refIndex+1];
-                refzpos = refPos[3*refIndex+2];
-
-                /* atomic separation of possible vacancy and possible interstitial */
-                sep2 = atomicSeparation2(xpos, ypos, zpos, refxpos, refypos, refzpos,
-                                         cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
-
-                /* if within vacancy radius, is it an antisite or normal lattice point */
-                if ( sep2 < vacRad2 )
-                {
-                    /* compare symbols */
-                    symtemp[0] = specieList[2*specie[i]];
-                    symtemp[1] = specieList[2*specie[i]+1];
-                    symtemp[2] = '\0';
-
-                    symtemp2[0] = specieListRef[2*specieRef[refIndex]];
-                    symtemp2[1] = specieListRef[2*specieRef[refIndex]+1];
-                    symtemp2[2] = '\0';
-
-                    comp = strcmp( symtemp, symtemp2 );
-                    if ( comp == 0 )
-                    {
-                        /* match, so not antisite */
-                        possibleAntisite[refIndex] = 0;
-                    }
-                    else
-                    {
-                        possibleOnAntisite[refIndex] = i;
-                    }
-
-                    /* not an interstitial or vacancy */
-                    possibleInterstitial[i] = 0;
-                    possibleVacancy[refIndex] = 0;
-
-                    /* no need to check further for this (no longer) possible interstitial */
-                    exitLoop = 1;
-                    break;
-                }
+                /* match, so not antisite */
+                possibleAntisite[refIndex] = 0;
             }
+            else
+            {
+                possibleOnAntisite[refIndex] = i;
+            }
+
+            /* not an interstitial or vacancy */
+            possibleInterstitial[i] = 0;
+            possibleVacancy[refIndex] = 0;
         }
     }
 
-    /* free boxes structure */
-    freeBoxes(boxes);
-
-    /* now box input atoms, approx width must be at least incRad */
-    approxBoxWidth = 1.1 * inclusionRadius;
-    boxes = setupBoxes(approxBoxWidth, minPos, maxPos, PBC, cellDims);
-    putAtomsInBoxes(NAtoms, pos, boxes);
+    free(firstSite);
 
     /* now classify defects */
     NVacancies = 0;
     NInterstitials = 0;
     NAntisites = 0;
-    count = 0;
     for ( i=0; i<refNAtoms; i++ )
     {
         skip = 0;
@@ -240,99 +346,17 @@ int findDefects( int includeVacs, int includeInts, int includeAnts,
         {
             if (includeVacs == 1)
             {
-                int nboxes;
-
                 vacancies[NVacancies] = i;
                 NVacancies++;
-
-                /* find input atoms within inclusionRadius of this vacancy */
-                refxpos = refPos[3*i];
-                refypos = refPos[3*i+1];
-                refzpos = refPos[3*i+2];
-                boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
-
-                /* find neighbouring boxes */
-                nboxes = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-
-                for (j = 0; j < nboxes; j++ )
-                {
-                    checkBox = boxNebList[j];
-
-                    /* loop over atoms in box */
-                    for ( k=0; k<boxes->boxNAtoms[checkBox]; k++ )
-                    {
-                        index = boxes->boxAtoms[checkBox][k];
-
-                        /* if already on defect list continue */
-                        if (defectList[index] == 1)
-                        {
-                            continue;
-                        }
-
-                        /* if close to defect add to list */
-                        xpos = pos[3*index];
-                        ypos = pos[3*index+1];
-                        zpos = pos[3*index+2];
-                        sep2 = atomicSeparation2(xpos, ypos, zpos, refxpos, refypos, refzpos,
-                                                 cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
-
-                        if ( sep2 < incRad2 )
-                        {
-                            defectList[index] = 1;
-                            count++;
-                        }
-                    }
-                }
             }
         }
 
         /* antisites */
         else if ( (possibleAntisite[i] == 1) && (includeAnts == 1) )
         {
-            int nboxes;
-
             antisites[NAntisites] = i;
             onAntisites[NAntisites] = possibleOnAntisite[i];
             NAntisites++;
-
-            /* find input atoms within inclusionRadius of this antisite */
-            refxpos = refPos[3*i];
-            refypos = refPos[3*i+1];
-            refzpos = refPos[3*i+2];
-            boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
-
-            /* find neighbouring boxes */
-            nboxes = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-
-            for (j = 0; j < nboxes; j++)
-            {
-                checkBox = boxNebList[j];
-
-                /* loop over atoms in box */
-                for ( k=0; k<boxes->boxNAtoms[checkBox]; k++ )
-                {
-                    index = boxes->boxAtoms[checkBox][k];
-
-                    /* if already on defect list continue */
-                    if (defectList[index] == 1)
-                    {
-                        continue;
-                    }
-
-                    /* if close to defect add to list */
-                    xpos = pos[3*index];
-                    ypos = pos[3*index+1];
-                    zpos = pos[3*index+2];
-                    sep2 = atomicSeparation2(xpos, ypos, zpos, refxpos, refypos, refzpos,
-                                             cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
-
-                    if ( sep2 < incRad2 )
-                    {
-                        defectList[index] = 1;
-                        count++;
-                    }
-                }
-            }
         }
     }
 
@@ -368,59 +392,44 @@ int findDefects( int includeVacs, int includeInts, int includeAnts,
             /* interstitials */
             if ( (possibleInterstitial[i] == 1) || (addToInt == 1) )
             {
-                int nboxes;
-
                 interstitials[NInterstitials] = i;
                 NInterstitials++;
                 defectList[i] = 1;
-                count++;
+            }
+        }
+    }
 
-                /* find input atoms within inclusionRadius of this interstitial */
-                refxpos = pos[3*i];
-                refypos = pos[3*i+1];
-                refzpos = pos[3*i+2];
-                boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
+    /* now box input atoms, approx width must be at least incRad */
+    approxBoxWidth = 1.1 * inclusionRadius;
+    boxes = setupBoxes(approxBoxWidth, minPos, maxPos, PBC, cellDims);
+    putAtomsInBoxes(NAtoms, pos, boxes);
 
-                /* find neighbouring boxes */
-                nboxes = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+    /* find input atoms within inclusionRadius of the defects (in parallel) */
+    #pragma omp parallel for schedule(dynamic, 64) num_threads(nthreads)
+    for ( i=0; i<NVacancies; i++ )
+    {
+        int refIndex = vacancies[i];
 
-                for (j = 0; j < nboxes; j++)
-                {
-                    checkBox = boxNebList[j];
-
-                    /* loop over atoms in box */
-                    for ( k=0; k<boxes->boxNAtoms[checkBox]; k++ )
-                    {
-                        index = boxes->boxAtoms[checkBox][k];
-
-                        /* if same atom continue */
-                        if ( index == i )
-                        {
-                            continue;
-                        }
-
-                        /* if already on defect list continue */
-                        if (defectList[index] == 1)
-                        {
-                            continue;
-                        }
-
-                        /* if close to defect add to list */
-                        xpos = pos[3*index];
-                        ypos = pos[3*index+1];
-                        zpos = pos[3*index+2];
-                        sep2 = atomicSeparation2(xpos, ypos, zpos, refxpos, refypos, refzpos,
-                                                 cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
-
-                        if ( sep2 < incRad2 )
-                        {
-                            defectList[index] = 1;
-                            count++;
-                        }
-                    }
-                }
-            }
-        }
+        markDefectNeighbourhood(refPos[3*refIndex], refPos[3*refIndex+1], refPos[3*refIndex+2], NAtoms, pos,
+                                defectList, incRad2, cellDims, PBC, boxes);
+    }
+
+    #pragma omp parallel for schedule(dynamic, 64) num_threads(nthreads)
+    for ( i=0; i<NAntisites; i++ )
+    {
+        int refIndex = antisites[i];
+
+        markDefectNeighbourhood(refPos[3*refIndex], refPos[3*refIndex+1], refPos[3*refIndex+2], NAtoms, pos,
+                                defectList, incRad2, cellDims, PBC, boxes);
+    }
+
+    #pragma omp parallel for schedule(dynamic, 64) num_threads(nthreads)
+    for ( i=0; i<NInterstitials; i++ )
+    {
+        int refIndex = interstitials[i];
+
+        markDefectNeighbourhood(pos[3*refIndex], pos[3*refIndex+1], pos[3*refIndex+2], NAtoms, pos,
+                                defectList, incRad2, cellDims, PBC, boxes);
     }
 
     /* shift indexes to zero */
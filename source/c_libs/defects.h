@@ -1,6 +1,14 @@
 int findDefects(int, int, int, int *, int *, int *, int *, int *, int *, int, int *, int, int *, int,
 		int *, int, char *, int *, double *, int, char *, int *, double *, double *, int *, double, double,
-		double *, double *, int, int);
+		double *, double *, int, int, int);
+
+struct Boxes;
+
+struct Boxes * createReferenceBoxes(int, double *, double, double *, double *, int *, double *);
+
+int findDefectsReference(struct Boxes *, int, int, int, int *, int *, int *, int *, int *, int *, int, int *, int, int *, int,
+		int *, int, char *, int *, double *, int, char *, int *, double *, double *, int *, double, double,
+		double *, double *, int, int, int);
 
 double atomicSeparation2( double, double, double, double, double, double, double, double, double, int, int, int );
 
@@ -1,6 +1,6 @@
 import os
 
-from ctypes import CDLL, c_double, POINTER, c_int, c_char_p, c_char
+from ctypes import CDLL, c_double, POINTER, c_int, c_char_p, c_char, c_void_p
 
 from .numpy_utils import CPtrToDouble, CPtrToInt, CPtrToChar
 from .numpy_utils import Allocator as alloc
@@ -18,22 +18,77 @@ _lib.findDefects.restype = c_int
 _lib.findDefects.argtypes = [c_int, c_int, c_int, POINTER(c_int), POINTER(c_int), POINTER(c_int), POINTER(c_int), POINTER(c_int), 
                                     POINTER(c_int), c_int, POINTER(c_int), c_int, POINTER(c_int), c_int, POINTER(c_int), c_int, POINTER(c_char), 
                                     POINTER(c_int), POINTER(c_double), c_int, POINTER(c_char), POINTER(c_int), POINTER(c_double), POINTER(c_double), 
-                                    POINTER(c_int), c_double, c_double, POINTER(c_double), POINTER(c_double), c_int, c_int]
+                                    POINTER(c_int), c_double, c_double, POINTER(c_double), POINTER(c_double), c_int, c_int, c_int]
 
 # findDefects
 def findDefects(includeVacs, includeInts, includeAnts, defectList, NDefectsByType, vacancies, interstitials, antisites, onAntisites, 
                        inclSpec, exclSpecInput, exclSpecRef, NAtoms, specieList, specie, pos, refNAtoms, specieListRef, specieRef, refPos,
-                       cellDims, PBC, vacancyRadius, inclusionRadius, minPos, maxPos, verboseLevel, debugDefects):
+                       cellDims, PBC, vacancyRadius, inclusionRadius, minPos, maxPos, verboseLevel, debugDefects, numThreads=1):
     """
     findDefects
     
+    numThreads: number of OpenMP threads (<= 0 uses the OpenMP default)
+    
     """
     return _lib.findDefects(includeVacs, includeInts, includeAnts, CPtrToInt(defectList), CPtrToInt(NDefectsByType), CPtrToInt(vacancies), 
                             CPtrToInt(interstitials), CPtrToInt(antisites), CPtrToInt(onAntisites), len(inclSpec), CPtrToInt(inclSpec), 
                             len(exclSpecInput), CPtrToInt(exclSpecInput), len(exclSpecRef), CPtrToInt(exclSpecRef), NAtoms, CPtrToChar(specieList), 
                             CPtrToInt(specie), CPtrToDouble(pos), refNAtoms, CPtrToChar(specieListRef), CPtrToInt(specieRef), CPtrToDouble(refPos),
                             CPtrToDouble(cellDims), CPtrToInt(PBC), vacancyRadius, inclusionRadius, CPtrToDouble(minPos), CPtrToDouble(maxPos), 
-                            verboseLevel, debugDefects)
+                            verboseLevel, debugDefects, numThreads)
+
+################################################################################
+
+# createReferenceBoxes prototype
+_lib.createReferenceBoxes.restype = c_void_p
+_lib.createReferenceBoxes.argtypes = [c_int, POINTER(c_double), c_double, POINTER(c_double), POINTER(c_double), POINTER(c_int), 
+                                      POINTER(c_double)]
+
+# createReferenceBoxes
+def createReferenceBoxes(refNAtoms, refPos, vacancyRadius, minPos, maxPos, PBC, cellDims):
+    """
+    Box the reference atoms. Returns a handle which has to be released with freeBoxes.
+    
+    """
+    return _lib.createReferenceBoxes(refNAtoms, CPtrToDouble(refPos), vacancyRadius, CPtrToDouble(minPos), CPtrToDouble(maxPos), 
+                                     CPtrToInt(PBC), CPtrToDouble(cellDims))
+
+################################################################################
+
+# freeBoxes prototype
+_lib.freeBoxes.restype = None
+_lib.freeBoxes.argtypes = [c_void_p]
+
+# freeBoxes
+def freeBoxes(boxes):
+    """
+    Free the boxes created by createReferenceBoxes.
+    
+    """
+    _lib.freeBoxes(boxes)
+
+################################################################################
+
+# findDefectsReference prototype
+_lib.findDefectsReference.restype = c_int
+_lib.findDefectsReference.argtypes = [c_void_p] + _lib.findDefects.argtypes
+
+# findDefectsReference
+def findDefectsReference(refBoxes, includeVacs, includeInts, includeAnts, defectList, NDefectsByType, vacancies, interstitials, antisites, 
+                         onAntisites, inclSpec, exclSpecInput, exclSpecRef, NAtoms, specieList, specie, pos, refNAtoms, specieListRef, 
+                         specieRef, refPos, cellDims, PBC, vacancyRadius, inclusionRadius, minPos, maxPos, verboseLevel, debugDefects, 
+                         numThreads=1):
+    """
+    findDefects with the reference atoms already boxed by createReferenceBoxes
+    
+    """
+    return _lib.findDefectsReference(refBoxes, includeVacs, includeInts, includeAnts, CPtrToInt(defectList), CPtrToInt(NDefectsByType), 
+                                     CPtrToInt(vacancies), CPtrToInt(interstitials), CPtrToInt(antisites), CPtrToInt(onAntisites), 
+                                     len(inclSpec), CPtrToInt(inclSpec), len(exclSpecInput), CPtrToInt(exclSpecInput), len(exclSpecRef), 
+                                     CPtrToInt(exclSpecRef), NAtoms, CPtrToChar(specieList), CPtrToInt(specie), CPtrToDouble(pos), refNAtoms, 
+                                     CPtrToChar(specieListRef), CPtrToInt(specieRef), CPtrToDouble(refPos), CPtrToDouble(cellDims), 
+                                     CPtrToInt(PBC), vacancyRadius, inclusionRadius, CPtrToDouble(minPos), CPtrToDouble(maxPos), 
+                                     verboseLevel, debugDefects, numThreads)
 
 ################################################################################
 
@@ -6,15 +6,54 @@ A script to perform unittests for the analysis tool
 @email tomas.lazauskas[a]gmail.com
 """
 
+import copy
+import math
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
+import numpy as np
+
+import source.Constants as Constants
+import source.Fhiaims as Fhiaims
 import source.IO as IO
+import source.Jobs as Jobs
+import source.KLMC as KLMC
+import source.Manifest as Manifest
+import source.PointGroups as PointGroups
+import source.System as System
+import source.Utilities as Utilities
+
+_available_tests = ["DM_Surface_Energy", "Vibrational_Thermodynamics", "Worker_Pool", "Neighbour_List", 
+                    "Coordination_Bonding", "Reference_Lattice", "Defect_Clusters", "Point_Groups", "Arvo", "Delaunay_Area", 
+                    "KLMC_Archive", "IO_Writers", "File_Discovery", "Analysis_Manifest", "Hashkeys", "DM_Comparison", 
+                    "Job_Runner"]
 
-_available_tests = ["DM_Surface_Energy"]
+class TempDirTestCase(unittest.TestCase):
+  """
+  Base unittest class of the tests which write files: every test gets its own temporary directory (self.temp_dir)
+  
+  """
+  
+  def setUp(self):
+    """
+    Creates the temporary directory
+    
+    """
+    
+    self.temp_dir = tempfile.mkdtemp()
+  
+  def tearDown(self):
+    """
+    Removes the temporary directory
+    
+    """
+    
+    shutil.rmtree(self.temp_dir)
 
-class Test_DM_Surface_Energy(unittest.TestCase):
+class Test_DM_Surface_Energy(TempDirTestCase):
   """
   DM_Surface_Energy unittest class
   
@@ -42,8 +81,1714 @@ class Test_DM_Surface_Energy(unittest.TestCase):
     
     # calculating the surface energy
     self.system.calc_surface_energy(radius)
-      
+    
     self.assertEqual(1, 1)
+  
+  def test_batch_surface_energy(self):
+    """
+    Testing the batch mode and the area cache
+    """
+    
+    import DM_Surface_Energy
+    
+    for i in range(3):
+      shutil.copy("unittests/DM_Surface_Energy/Ti_n13.xyz", os.path.join(self.temp_dir, "Ti_n13_%d.xyz" % (i)))
+    
+    output_file = os.path.join(self.temp_dir, "SurfaceEnergies.csv")
+    cache_file = os.path.join(self.temp_dir, "SurfaceAreas.csv")
+    
+    args = (self.temp_dir, 2.5, -23000.0)
+    kwargs = {"method" : "delaunay", "backend" : "scipy", "processes" : 2,
+              "output_file" : output_file, "cache_file" : cache_file}
+    
+    success, error = DM_Surface_Energy.batch_surface_energy(*args, **kwargs)
+    self.assertTrue(success, error)
+    
+    table = np.genfromtxt(output_file, delimiter=",", names=True, dtype=None)
+    self.assertEqual(len(table), 3)
+    
+    area = Utilities.delaunay3DArea(self.system, radius=2.5, backend="scipy")
+    energy = (self.system.totalEnergy - 13 * -23000.0) / area
+    
+    self.assertTrue(np.allclose(table["Area"], area))
+    self.assertTrue(np.allclose(table["SurfaceEnergy"], energy, rtol=1.0e-5))
+    
+    # identical structures are calculated once and then read from the cache
+    cache = DM_Surface_Energy.read_cache(cache_file)
+    self.assertEqual(len(cache), 1)
+    
+    _, _, areas, calc_cnt = DM_Surface_Energy.calc_areas([self.system], "delaunay", 2.5, backend="scipy",
+                                                         cache_file=cache_file)
+    self.assertEqual(calc_cnt, 0)
+    self.assertAlmostEqual(areas[0][0], area, places=6)
+    
+    # the structures are read according to the extension
+    car_dir = os.path.join(self.temp_dir, "car")
+    os.makedirs(car_dir)
+    
+    IO.writeCAR(self.system, os.path.join(car_dir, "Ti_n13.car"))
+    
+    success, error = DM_Surface_Energy.batch_surface_energy(car_dir, 2.5, -23000.0, extension="car", **kwargs)
+    self.assertTrue(success, error)
+    
+    table = np.genfromtxt(output_file, delimiter=",", names=True, dtype=None)
+    self.assertEqual(table.size, 1)
+    self.assertTrue(np.allclose(table["Area"], area))
+
+class Test_Vibrational_Thermodynamics(unittest.TestCase):
+  """
+  Harmonic vibrational thermodynamics unittest class
+  
+  """
+  
+  @classmethod
+  def setUpClass(self):
+    """
+    Set ups the environment for testing
+    
+    """
+    
+    self.file_list = ["unittests/Vibrational_Thermodynamics/H2O.vib.out", 
+                      "unittests/Vibrational_Thermodynamics/CO.vib.out",
+                      "unittests/Vibrational_Thermodynamics/missing.vib.out"]
+    
+    self.temps = np.array([100.0, 293.0, 1000.0])
+  
+  def test_read_frequencies(self):
+    """
+    Testing reading and padding of the frequencies
+    """
+    
+    success, freqs, modes_cnt, c_zpe, w_zpe = Fhiaims.read_aims_frequencies_files(self.file_list, processes=2)
+    
+    self.assertEqual(list(success), [True, True, False])
+    self.assertEqual(list(modes_cnt), [3, 1, 0])
+    self.assertEqual(freqs.shape, (3, 3))
+    self.assertAlmostEqual(freqs[1, 0], 2128.10711302)
+    self.assertEqual(freqs[1, 1], 0.0)
+    self.assertAlmostEqual(w_zpe[0], 0.56549906)
+  
+  def test_thermodynamics(self):
+    """
+    Testing the vectorised expressions against the explicit ones
+    """
+    
+    _, freqs, _, _, w_zpe = Fhiaims.read_aims_frequencies_files(self.file_list, processes=1)
+    
+    zpe, entropy, free_energy = Utilities.vibrational_thermodynamics(freqs, self.temps)
+    
+    self.assertEqual(entropy.shape, (3, 3))
+    self.assertAlmostEqual(zpe[0], w_zpe[0], places=3)
+    self.assertEqual(zpe[2], 0.0)
+    
+    for j in range(len(self.temps)):
+      kT = Constants.kB * self.temps[j]
+      
+      sum_f = 0.0
+      sum_s = 0.0
+      for freq in freqs[0, :]:
+        x = Constants.planckConst * Constants.lightSpeedConts * freq / (2.0 * kT)
+        
+        sum_f += math.log(2.0 * math.sinh(x))
+        sum_s += x / math.tanh(x) - math.log(2.0 * math.sinh(x))
+      
+      self.assertAlmostEqual(free_energy[0, j], kT * sum_f, places=10)
+      self.assertAlmostEqual(entropy[0, j], Constants.kB * sum_s, places=12)
+    
+    self.assertAlmostEqual(Utilities.calculateVibrationalEntropy(freqs[0, :], 293.0), entropy[0, 1])
+
+class Test_Worker_Pool(unittest.TestCase):
+  """
+  Worker pool helpers unittest class
+  
+  """
+  
+  def test_pool_map(self):
+    """
+    Testing the order of the results and closing of the pool when a worker fails
+    """
+    
+    import multiprocessing
+    
+    args = [str(-i) for i in range(50)]
+    
+    for processes in [1, 2, None]:
+      self.assertEqual(Utilities.pool_map(int, args, processes), range(0, -50, -1))
+      self.assertEqual(list(Utilities.pool_imap(int, args, processes)), range(0, -50, -1))
+      self.assertEqual(sorted(Utilities.pool_imap(int, args, processes, ordered=False)), range(-49, 1))
+    
+    self.assertEqual(Utilities.pool_map(int, ["7"], 4), [7])
+    
+    self.assertRaises(ValueError, Utilities.pool_map, int, args + ["x"], 2)
+    self.assertRaises(ValueError, list, Utilities.pool_imap(int, ["x"] + args, 2))
+    
+    self.assertEqual(multiprocessing.active_children(), [])
+
+class Test_Neighbour_List(unittest.TestCase):
+  """
+  Neighbour list unittest class
+  
+  """
+  
+  def test_neighbour_list_pbc(self):
+    """
+    Testing the neighbour list with and without PBC against a brute force search
+    """
+    
+    np.random.seed(7)
+    
+    cellDims = np.array([6.0, 7.0, 8.0])
+    pos = (np.random.rand(40, 3) * cellDims).flatten()
+    
+    for PBC in [np.zeros(3, np.int32), np.array([1, 0, 1], np.int32), np.ones(3, np.int32)]:
+      bond_i, bond_j, dist = Utilities.neighbour_list(pos, cellDims, PBC, 2.5, minRadius=0.5)
+      
+      expected = []
+      for i in range(40):
+        for j in range(i+1, 40):
+          sep2 = Utilities.atomicSeparation2(pos[3*i:3*i+3], pos[3*j:3*j+3], cellDims, PBC)
+          
+          if sep2 > 0.25 and sep2 < 6.25:
+            expected.append((i, j, math.sqrt(sep2)))
+      
+      self.assertEqual(zip(bond_i, bond_j), [(i, j) for (i, j, _) in expected])
+      self.assertTrue(np.allclose(dist, [d for (_, _, d) in expected]))
+
+class Test_Coordination_Bonding(TempDirTestCase):
+  """
+  Coordination and bonding batch mode unittest class
+  
+  """
+  
+  def test_analyse_directory(self):
+    """
+    Testing that the batch csv file matches the analysis of the individual files
+    """
+    
+    import csv
+    
+    import DM_Coordination_Bonding
+    
+    os.makedirs(os.path.join(self.temp_dir, "sub"))
+    
+    shutil.copy("unittests/DM_Surface_Energy/Ti_n13.xyz", os.path.join(self.temp_dir, "Ti_n13.xyz"))
+    
+    # a ZnO square and a chain with one Zn-Zn bond
+    structures = {"sub/ZnO_4.xyz" : [("Zn", 0.0, 0.0, 0.0), ("O", 2.2, 0.0, 0.0), ("Zn", 2.2, 2.2, 0.0), 
+                                     ("O", 0.0, 2.2, 0.0)],
+                  "ZnO_3.xyz" : [("Zn", 0.0, 0.0, 0.0), ("Zn", 2.4, 0.0, 0.0), ("O", 4.4, 0.0, 0.0)],
+                  "OZn_2.xyz" : [("O", 0.0, 0.0, 0.0), ("Zn", 2.0, 0.0, 0.0)]}
+    
+    for file_name, atoms in structures.items():
+      f = open(os.path.join(self.temp_dir, file_name), "w")
+      f.write("%d\nSCF Done -1.0\n" % (len(atoms)))
+      for atom in atoms:
+        f.write("%s %f %f %f 0.0\n" % atom)
+      f.close()
+    
+    f = open(os.path.join(self.temp_dir, "broken.xyz"), "w")
+    f.write("2\n\nZn 0.0\n")
+    f.close()
+    
+    output_file = os.path.join(self.temp_dir, "Coordination.csv")
+    
+    DM_Coordination_Bonding.analyseDirectory(self.temp_dir, "xyz", 0.0, 3.0, outputFile=output_file, processes=2)
+    
+    f = open(output_file)
+    rows = list(csv.DictReader(f))
+    f.close()
+    
+    # the same bond is in one column whatever the order of the species in a file
+    pairs = ["O-O", "O-Zn", "Ti-Ti", "Zn-Zn"]
+    
+    self.assertEqual(sorted(rows[0].keys()), sorted(["System", "File", "NAtoms", "AvgCoord", "MinCoord", "MaxCoord", 
+                                                     "StdCoord"] + ["%s_AvgDist" % (pair) for pair in pairs] + 
+                                                    ["%s_Cnt" % (pair) for pair in pairs]))
+    
+    self.assertEqual([row["File"] for row in rows], [os.path.join(self.temp_dir, file_name) for file_name in 
+                                                     ["OZn_2.xyz", "Ti_n13.xyz", "ZnO_3.xyz", "sub/ZnO_4.xyz"]])
+    
+    for row in rows:
+      _, descriptors, error = DM_Coordination_Bonding.analyseFile(row["File"], 0.0, 3.0)
+      self.assertEqual(error, "")
+      
+      self.assertEqual(int(row["NAtoms"]), descriptors["NAtoms"])
+      self.assertEqual(int(row["MinCoord"]), descriptors["minCoord"])
+      self.assertEqual(int(row["MaxCoord"]), descriptors["maxCoord"])
+      self.assertAlmostEqual(float(row["AvgCoord"]), descriptors["avgCoord"], places=5)
+      self.assertAlmostEqual(float(row["StdCoord"]), descriptors["stdCoord"], places=5)
+      
+      for pair in pairs:
+        self.assertAlmostEqual(float(row["%s_AvgDist" % (pair)]), descriptors["bondDist"].get(pair, 0.0), places=5)
+        self.assertEqual(int(row["%s_Cnt" % (pair)]), descriptors["bondCnt"].get(pair, 0))
+    
+    zno = rows[3]
+    
+    self.assertEqual((zno["MinCoord"], zno["MaxCoord"], zno["O-Zn_Cnt"], zno["Zn-Zn_Cnt"]), ("2", "2", "4", "0"))
+    self.assertAlmostEqual(float(zno["O-Zn_AvgDist"]), 2.2, places=5)
+    self.assertEqual((rows[2]["Zn-Zn_Cnt"], rows[2]["O-Zn_Cnt"]), ("1", "1"))
+    self.assertEqual(rows[0]["O-Zn_Cnt"], "1")
+    self.assertAlmostEqual(float(rows[0]["O-Zn_AvgDist"]), 2.0, places=5)
+
+class Test_Reference_Lattice(unittest.TestCase):
+  """
+  Reusable reference lattice unittest class (requires the compiled C libraries)
+  
+  """
+  
+  def make_system(self, pos, specie, cellDims):
+    """
+    Creates a MgO system with the given positions
+    """
+    
+    system = System.System(len(specie))
+    system.addSpecie("Mg")
+    system.addSpecie("O")
+    system.pos[:] = pos.flatten()
+    system.specie[:] = specie
+    system.cellDims[:] = cellDims
+    
+    return system
+  
+  def test_reference_lattice_frames(self):
+    """
+    Testing that the boxed reference lattice gives the same defects as find_defects in every frame
+    """
+    
+    import source.Defects as Defects
+    
+    np.random.seed(11)
+    
+    n = 6
+    a = 2.1
+    cellDims = np.ones(3) * n * a
+    
+    grid = np.array([(i, j, k) for i in range(n) for j in range(n) for k in range(n)], np.float64)
+    specie = (grid.sum(axis=1) % 2).astype(np.int32)
+    
+    reference = self.make_system(grid * a, specie, cellDims)
+    lattice = Defects.ReferenceLattice(reference, 0.8, num_threads=2, verbose_level=0)
+    
+    for frame_cnt in range(4):
+      pos = grid * a + np.random.normal(0.0, 0.1, grid.shape)
+      
+      # displaced atoms leave a vacancy and become interstitials
+      pos[:frame_cnt] += 0.5 * a
+      
+      frame_specie = specie.copy()
+      frame_specie[-1] = 1 - frame_specie[-1]
+      
+      frame = self.make_system(np.mod(pos, cellDims), frame_specie, cellDims)
+      frame2 = self.make_system(np.mod(pos, cellDims), frame_specie, cellDims)
+      
+      success, error = lattice.find(frame)
+      self.assertTrue(success, error)
+      
+      Defects.find_defects(reference, frame2, 0.8)
+      
+      self.assertEqual((frame.NVac, frame.NInt, frame.NAnt), (frame_cnt, frame_cnt, 1))
+      self.assertEqual(list(frame.antisites), [grid.shape[0] - 1])
+      
+      for attr in ["vacancies", "interstitials", "antisites", "onAntisites"]:
+        self.assertTrue(np.array_equal(getattr(frame, attr), getattr(frame2, attr)))
+      
+      self.assertTrue(frame.defectResult.vacPos is frame.vacPos)
+      self.assertTrue(np.array_equal(frame.vacPos.reshape(-1, 3), (grid * a)[frame.vacancies]))
+      self.assertTrue(np.array_equal(frame.intPos.reshape(-1, 3), frame.pos.reshape(-1, 3)[frame.interstitials]))
+      self.assertEqual(list(frame.onAntSpecie), [frame_specie[-1]])
+    
+    lattice.free()
+  
+  def test_threads_match_serial(self):
+    """
+    Testing that the defects and their neighbourhoods found with several threads match the serial ones
+    """
+    
+    import source.Defects as Defects
+    
+    np.random.seed(5)
+    
+    n = 10
+    a = 2.1
+    cellDims = np.ones(3) * n * a
+    
+    grid = np.array([(i, j, k) for i in range(n) for j in range(n) for k in range(n)], np.float64)
+    specie = (grid.sum(axis=1) % 2).astype(np.int32)
+    
+    reference = self.make_system(grid * a, specie, cellDims)
+    
+    # many displaced atoms (vacancies and interstitials) and antisites
+    pos = grid * a + np.random.normal(0.0, 0.1, grid.shape)
+    
+    displaced = np.random.choice(grid.shape[0], 150, replace=False)
+    pos[displaced] += 0.5 * a
+    
+    frame_specie = specie.copy()
+    swapped = np.random.choice(grid.shape[0], 150, replace=False)
+    frame_specie[swapped] = 1 - frame_specie[swapped]
+    
+    frames = []
+    
+    for num_threads in [1, 4]:
+      frame = self.make_system(np.mod(pos, cellDims), frame_specie, cellDims)
+      
+      success, error = Defects.find_defects(reference, frame, 0.8, num_threads=num_threads)
+      self.assertTrue(success, error)
+      
+      frames.append(frame)
+    
+    self.assertTrue(frames[0].NVac > 50 and frames[0].NInt > 50 and frames[0].NAnt > 50)
+    
+    for attr in ["vacancies", "interstitials", "antisites", "onAntisites", "defectCluster"]:
+      self.assertTrue(np.array_equal(getattr(frames[0], attr), getattr(frames[1], attr)))
+
+class Test_Defect_Clusters(unittest.TestCase):
+  """
+  Defect cluster analysis unittest class (requires the compiled C libraries)
+  
+  """
+  
+  def test_defect_clusters(self):
+    """
+    Testing cluster sizes, compositions and centroids of clusters crossing the periodic boundary
+    """
+    
+    import source.Defects as Defects
+    
+    cellDims = np.array([20.0, 20.0, 20.0])
+    PBC = np.ones(3, np.int32)
+    
+    refPos = np.array([[0.5, 10.0, 10.0], [10.0, 10.0, 10.0], [5.0, 5.0, 5.0]])
+    pos = np.array([[19.5, 10.0, 10.0], [19.0, 11.0, 10.0], [11.0, 10.0, 10.0], [15.0, 15.0, 15.0]])
+    specie = np.zeros(4, np.int32)
+    
+    # vacancies 0, 1; interstitials 0, 1, 2, 3; antisite 2 (occupied by atom 3)
+    result = Defects.DefectResult(refPos.flatten(), np.zeros(3, np.int32), pos.flatten(), specie, 
+                                  np.array([0, 1], np.int32), np.array([0, 1, 2, 3], np.int32), 
+                                  np.array([2], np.int32), np.array([3], np.int32), np.empty(0, np.int32), 7, 
+                                  cellDims, PBC)
+    
+    clusters = result.find_clusters(1.6)
+    
+    self.assertEqual(clusters.NClusters, 4)
+    self.assertEqual(list(clusters.labels), [0, 1, 0, 0, 1, 2, 3])
+    self.assertEqual(list(clusters.sizes), [3, 2, 1, 1])
+    self.assertEqual(clusters.composition.tolist(), [[1, 2, 0], [1, 1, 0], [0, 1, 0], [0, 0, 1]])
+    self.assertEqual(list(clusters.sizeHistogram), [0, 2, 1, 1])
+    
+    self.assertTrue(np.allclose(clusters.centroids[0], [19.66666667, 10.33333333, 10.0]))
+    self.assertTrue(np.allclose(clusters.centroids[1], [10.5, 10.0, 10.0]))
+    self.assertTrue(np.allclose(clusters.centroids[3], [5.0, 5.0, 5.0]))
+
+class Test_Point_Groups(unittest.TestCase):
+  """
+  Point group detection unittest class
+  
+  """
+  
+  def make_cluster(self, symbols, pos):
+    """
+    Creates a randomly rotated and translated cluster
+    """
+    
+    rotation = np.linalg.qr(np.random.randn(3, 3))[0]
+    
+    system = System.System(len(symbols))
+    
+    for i in range(len(symbols)):
+      if symbols[i] not in system.specieList:
+        system.addSpecie(symbols[i])
+      
+      system.specie[i] = system.specieIndex(symbols[i])
+    
+    system.pos[:] = (np.dot(np.array(pos, np.float64), rotation.T) + np.random.rand(3)).flatten()
+    
+    return system
+  
+  def test_point_groups(self):
+    """
+    Testing the point groups of water, methane, an octahedron and a square planar cluster
+    """
+    
+    np.random.seed(5)
+    
+    t = 1.09 / math.sqrt(3.0)
+    
+    clusters = [self.make_cluster(["O", "H", "H"], [[0.0, 0.0, 0.1173], [0.0, 0.7572, -0.4692], [0.0, -0.7572, -0.4692]]),
+                self.make_cluster(["C", "H", "H", "H", "H"], [[0, 0, 0], [t, t, t], [-t, -t, t], [-t, t, -t], [t, -t, -t]]),
+                self.make_cluster(["S", "F", "F", "F", "F", "F", "F"], [[0, 0, 0], [1.56, 0, 0], [-1.56, 0, 0], [0, 1.56, 0], 
+                                                                      [0, -1.56, 0], [0, 0, 1.56], [0, 0, -1.56]]),
+                self.make_cluster(["Pt", "Cl", "Cl", "Cl", "Cl"], [[0, 0, 0], [2.3, 0, 0], [-2.3, 0, 0], [0, 2.3, 0], [0, -2.3, 0]])]
+    
+    expected = ["C2v", "Td", "Oh", "D4h"]
+    
+    for i in range(len(clusters)):
+      self.assertEqual(PointGroups.get_point_group(clusters[i]), expected[i])
+    
+    self.assertEqual(PointGroups.get_point_groups(clusters, processes=2), expected)
+
+class Test_Arvo(TempDirTestCase):
+  """
+  arvo_c volume and area unittest class
+  
+  """
+  
+  def test_parse_arvo_output(self):
+    """
+    Testing the parsing of the arvo_c output
+    """
+    
+    output = "Reading...\nVolume:   1234.5678\tArea:    567.25\tSpheres num:  13\n"
+    
+    self.assertEqual(System._parse_arvo_output(output), (True, "", 1234.5678, 567.25, 13))
+    
+    success, error, volume, area, spheres = System._parse_arvo_output("Error: cannot open the file\n")
+    
+    self.assertFalse(success)
+    self.assertTrue("Error: cannot open the file" in error)
+    self.assertEqual((volume, area, spheres), (None, None, None))
+    
+    self.assertFalse(System._parse_arvo_output("")[0])
+  
+  def test_arvo_batch(self):
+    """
+    Testing the batch mode with a stub arvo_c which reports the number of atoms
+    """
+    
+    arvo_path = os.path.join(self.temp_dir, "arvo_c")
+    
+    f = open(arvo_path, "w")
+    f.write("#!/bin/sh\n")
+    f.write("atoms=`wc -l < \"${1#protein=}\"`\n")
+    f.write("printf \"Volume: %d.5\\tArea: %d.25\\tSpheres num: %d\\n\" $atoms $atoms $atoms\n")
+    f.close()
+    os.chmod(arvo_path, 0755)
+    
+    system = IO.readSystemFromFileXYZ("unittests/DM_Surface_Energy/Ti_n13.xyz")
+    
+    systems = []
+    for atoms in [3, 13, 7]:
+      systems.append(copy.deepcopy(system))
+      systems[-1].NAtoms = atoms
+    
+    success, error = System.calc_arvo_geo_measures_batch(systems, 1.47, arvo_path=arvo_path, processes=2)
+    self.assertTrue(success, error)
+    
+    for atoms, system in zip([3, 13, 7], systems):
+      self.assertTrue(system.arvo_calc)
+      self.assertEqual((system.arvo_volume, system.arvo_area, system.arvo_spheres), (atoms + 0.5, atoms + 0.25, atoms))
+    
+    success, error = systems[0].calc_arvo_geo_measures(1.47, arvo_path=arvo_path)
+    self.assertTrue(success, error)
+    self.assertEqual(systems[0].arvo_spheres, 3)
+    
+    # a system that cannot be written is reported
+    empty = System.System(1)
+    empty.name = "empty"
+    
+    success, error = System.calc_arvo_geo_measures_batch([systems[1], empty], 1.47, arvo_path=arvo_path)
+    self.assertFalse(success)
+    self.assertTrue(error.startswith("empty: "))
+    self.assertFalse(empty.arvo_calc)
+
+class Test_Delaunay_Area(unittest.TestCase):
+  """
+  Delaunay (alpha shape) surface area unittest class
+  
+  """
+  
+  def test_alpha_shape_area(self):
+    """
+    Testing the alpha shape area against the convex hull and a cube
+    """
+    
+    from scipy.spatial import ConvexHull
+    
+    np.random.seed(3)
+    
+    points = np.random.rand(200, 3) * 10.0
+    
+    # with a large alpha all tetrahedra are kept and the surface is the convex hull
+    self.assertAlmostEqual(Utilities.alphaShapeArea(points, 1.0e6), ConvexHull(points).area, places=8)
+    
+    # unit cube with a point in the centre
+    cube = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)] + [[0.5, 0.5, 0.5]], np.float64)
+    
+    self.assertAlmostEqual(Utilities.alphaShapeArea(cube, 10.0), 6.0, places=10)
+    self.assertEqual(Utilities.alphaShapeArea(cube, 0.1), 0.0)
+    
+    system = IO.readSystemFromFileXYZ("unittests/DM_Surface_Energy/Ti_n13.xyz")
+    
+    self.assertAlmostEqual(Utilities.delaunay3DArea(system, radius=100.0, backend="scipy"), 
+                           ConvexHull(system.pos.reshape(-1, 3)).area, places=8)
+
+class Test_KLMC_Archive(TempDirTestCase):
+  """
+  KLMC GA archive reader unittest class
+  
+  """
+  
+  def make_archive(self, dir_path, step, rows, pop=True):
+    """
+    Creates a GA iteration archive with the statistics file and the POP directory
+    """
+    
+    import tarfile
+    
+    stats_path = os.path.join(dir_path, "gaStatistics%d.csv" % (step))
+    
+    f = open(stats_path, "w")
+    f.write("Rank,Name,Hashkey,EDFN,Status,Energy,6,7,Parent1,Parent2,10,11,12,13,Origin,GAGenNo\n")
+    for row in rows:
+      f.write("%s\n" % (",".join(row)))
+    f.close()
+    
+    tar = tarfile.open(os.path.join(dir_path, "%d.tar.gz" % (step)), "w:gz")
+    tar.add(stats_path, arcname="run/%d/gaStatistics%d.csv" % (step, step))
+    
+    if pop:
+      for row in rows:
+        tar.add(stats_path, arcname="run/%d/POP/%s_%s_1.xyz" % (step, row[0], row[1]))
+    
+    tar.close()
+    
+    os.remove(stats_path)
+  
+  def test_read_archive(self):
+    """
+    Testing reading of the statistics and POP files without extracting the archive
+    """
+    
+    import GA_Family_Tree
+    
+    cwd = os.getcwd()
+    
+    rows = [["1", "abc", "h1", "1", "1", "-10.5", "", "", "p1", "p2", "", "", "", "", "MUTATE", "4"], 
+            ["2", "def", "h2", "1", "1", "-10.1", "", "", "p3", "p4", "", "", "", "", "REPOPM", "3"]]
+    
+    try:
+      self.make_archive(self.temp_dir, 5, rows)
+      
+      success, error, lines = KLMC.read_stats_lines(5, self.temp_dir)
+      self.assertTrue(success, error)
+      self.assertEqual(len(lines), 3)
+      
+      success, error, pop_files = KLMC.read_pop_files(5, self.temp_dir)
+      self.assertEqual(pop_files, ["1_abc_1.xyz", "2_def_1.xyz"])
+      
+      # the member index is cached
+      archive = KLMC.open_archive(KLMC.get_archive_path(5, self.temp_dir))
+      self.assertTrue(KLMC.open_archive(KLMC.get_archive_path(5, self.temp_dir)) is archive)
+      
+      success, error, _ = KLMC.read_stats_lines(6, self.temp_dir)
+      self.assertFalse(success)
+      
+      os.chdir(self.temp_dir)
+      
+      found, rank, hashkey, energy, origin, gaGenNo, parent1, parent2 = GA_Family_Tree.findFile(5, "def")
+      self.assertEqual((found, rank, hashkey, energy, origin, gaGenNo), (True, 2, "h2", -10.1, "REPOPM", 3))
+      
+      found, rank, _, energy, _, _, parent1, parent2 = GA_Family_Tree.findHashkey(5, "h1")
+      self.assertEqual((found, rank, energy, parent1, parent2), (True, 1, -10.5, "p1", "p2"))
+      
+      self.assertEqual(GA_Family_Tree.findLowest(5)[2], "h1")
+      
+      # nothing has been extracted
+      self.assertEqual(os.listdir(self.temp_dir), ["5.tar.gz"])
+    
+    finally:
+      os.chdir(cwd)
+  
+  def test_genealogy_index(self):
+    """
+    Testing the genealogy index and the ancestry traversal
+    """
+    
+    def row(rank, name, hashkey, origin, gaGenNo, parent1="", parent2=""):
+      return [str(rank), name, hashkey, "1", "1", "-%d.0" % (10 + gaGenNo), "", "", parent1, parent2, 
+              "", "", "", "", origin, str(gaGenNo)]
+    
+    self.make_archive(self.temp_dir, 1, [row(1, "c", "hC", "INITIA", 1), row(2, "x", "hA", "INITIA", 1)])
+    self.make_archive(self.temp_dir, 2, [row(1, "a", "hA", "REPOPM", 1), row(2, "b", "hB", "CROSSO", 2, "c", "c")])
+    self.make_archive(self.temp_dir, 3, [row(1, "g", "hG", "MUTATE", 3, "a", "b")])
+    
+    index = KLMC.GenealogyIndex(os.path.join(self.temp_dir, "genealogy.db"))
+    
+    self.assertEqual(index.update(self.temp_dir, processes=2), 3)
+    self.assertEqual(index.update(self.temp_dir, processes=2), 0)
+    
+    self.assertEqual(index.find_file(2, "b").hashkey, "hB")
+    self.assertEqual(index.find_hashkey(1, "hA").rank, 2)
+    
+    trace = [(depth, generation, record.hashkey if record is not None else None) 
+             for depth, generation, record in index.trace_ancestry(3)]
+    
+    self.assertEqual(trace, [(0, 3, "hG"), (1, 2, "hA"), (1, 1, "hA"), (1, 2, "hB"), (2, 1, "hC")])
+    
+    trace = [generation for _, generation, _ in index.trace_ancestry(3, maxDepth=1)]
+    self.assertEqual(trace, [3])
+    
+    index.close()
+  
+  def test_stats_store(self):
+    """
+    Testing the incremental columnar store of the statistics
+    """
+    
+    def rows(cnt, offset):
+      return [[str(i+1), "s%d" % (i), "h%d" % (i), "1", str(i % 2), "%f" % (offset - 0.01 * i), "", "", "", "", 
+               "", "", "", "", "INITIA", "1"] for i in range(cnt)]
+    
+    self.make_archive(self.temp_dir, 1, rows(1500, -10.0), pop=False)
+    self.make_archive(self.temp_dir, 2, rows(10, -11.0), pop=False)
+    
+    # the last GA iteration which has not been archived yet is skipped
+    os.makedirs(os.path.join(self.temp_dir, "3"))
+    open(os.path.join(self.temp_dir, "3", "gaStatistics3.csv"), "w").write("header\n")
+    
+    store = KLMC.GAStatsStore(os.path.join(self.temp_dir, "store"))
+    
+    self.assertEqual(store.update(self.temp_dir, processes=2), 2)
+    self.assertEqual(store.lastGeneration, 2)
+    self.assertEqual(KLMC.GAStatsStore(os.path.join(self.temp_dir, "store")).update(self.temp_dir), 0)
+    
+    columns = store.read(["generation", "status", "energy"])
+    
+    self.assertEqual(len(columns["energy"]), 1510)
+    self.assertEqual(np.count_nonzero(columns["generation"] == 1), 1500)
+    self.assertAlmostEqual(columns["energy"][1499], -24.99)
+    self.assertEqual(columns["status"][1], 1)
+    
+    self.make_archive(self.temp_dir, 3, rows(5, -12.0), pop=False)
+    
+    self.assertEqual(store.update(self.temp_dir), 1)
+    self.assertEqual(store.chunks, 2)
+    
+    energies = store.read(["energy"])["energy"]
+    
+    store.compact()
+    
+    self.assertEqual(store.chunks, 1)
+    self.assertTrue(np.array_equal(store.read(["energy"])["energy"], energies))
+    self.assertTrue(np.array_equal(store.read()["generation"][-5:], [3] * 5))
+    
+    # an unreadable archive and the ones after it are read again by the next update
+    self.make_archive(self.temp_dir, 5, rows(4, -13.0), pop=False)
+    self.make_archive(self.temp_dir, 6, rows(6, -14.0), pop=False)
+    
+    open(os.path.join(self.temp_dir, "4.tar.gz"), "w").write("half-written")
+    
+    self.assertEqual(store.update(self.temp_dir, processes=1), 0)
+    self.assertEqual(store.lastGeneration, 3)
+    
+    self.make_archive(self.temp_dir, 4, rows(3, -15.0), pop=False)
+    
+    self.assertEqual(store.update(self.temp_dir, processes=1), 3)
+    self.assertEqual(store.lastGeneration, 6)
+    self.assertEqual(list(np.bincount(store.read(["generation"])["generation"])[3:]), [5, 3, 4, 6])
+
+class Test_IO_Writers(TempDirTestCase):
+  """
+  Bulk and multi-frame writers unittest class
+  
+  """
+  
+  def test_multi_frame_writer(self):
+    """
+    Testing the appendable multi-frame xyz and arc files
+    """
+    
+    system = IO.readSystemFromFileXYZ("unittests/DM_Surface_Energy/Ti_n13.xyz")
+    
+    xyz_file = os.path.join(self.temp_dir, "frames.xyz")
+    
+    IO.save_systems_to_xyz([system] * 3, self.temp_dir, file_name="frames.xyz")
+    
+    with IO.TrajectoryWriter(xyz_file, "xyz", append=True) as writer:
+      writer.write(system)
+    
+    lines = open(xyz_file).read().splitlines()
+    
+    self.assertEqual(len(lines), 4 * (system.NAtoms + 2))
+    self.assertEqual(lines[2 * (system.NAtoms + 2)], "%d" % (system.NAtoms))
+    
+    # every frame is identical to the single frame file
+    single_file = os.path.join(self.temp_dir, "single.xyz")
+    IO.writeXYZ(system, single_file)
+    
+    self.assertEqual(lines[-(system.NAtoms + 2):], open(single_file).read().splitlines())
+    
+    # arc frames are read back by the ARC reader
+    system.cellDims[:] = [20.0, 21.0, 22.0]
+    system.cellAngles[:] = [90.0, 90.0, 90.0]
+    
+    arc_file = os.path.join(self.temp_dir, "frames.arc")
+    
+    with IO.TrajectoryWriter(arc_file, "arc") as writer:
+      writer.write(system)
+      writer.write(system)
+    
+    arc_system = IO.readSystemFromFileARC(arc_file)
+    
+    self.assertEqual(arc_system.NAtoms, system.NAtoms)
+    self.assertTrue(np.allclose(arc_system.pos, system.pos))
+    self.assertTrue(np.allclose(arc_system.cellDims, system.cellDims))
+    self.assertEqual(list(arc_system.specieList), list(system.specieList))
+  
+  def test_gin_template(self):
+    """
+    Testing the cached GIN template and the batch GIN writer
+    """
+    
+    master_file = os.path.join(self.temp_dir, "Master.gin")
+    
+    f = open(master_file, "w")
+    f.write("opti conp\ncartesian\nZn core 0.0 0.0 0.0\nO core 1.9 0.0 0.0\nspecies 2\nZn core 2.0\nO core -2.0\n")
+    f.close()
+    
+    template, error = IO.load_gin_template(master_file)
+    
+    self.assertEqual(template.header, "opti conp\ncartesian\n")
+    self.assertEqual(template.footer, "species 2\nZn core 2.0\nO core -2.0\n")
+    self.assertTrue(IO.load_gin_template(master_file)[0] is template)
+    
+    system, error = IO.readSystemFromFileGIN(master_file)
+    
+    output_files = [os.path.join(self.temp_dir, "%d.gin" % (i)) for i in range(4)]
+    
+    success, error = IO.write_gin_files([system] * 4, output_files, controlFile=master_file, processes=2)
+    self.assertTrue(success, error)
+    
+    for output_file in output_files:
+      gin_system, _ = IO.readSystemFromFileGIN(output_file)
+      
+      self.assertTrue(np.allclose(gin_system.pos, system.pos))
+      self.assertEqual(open(output_file).read().splitlines()[-3:], template.footer.splitlines())
+    
+    # the template is parsed again once the file is modified
+    os.utime(master_file, (0, 0))
+    self.assertFalse(IO.load_gin_template(master_file)[0] is template)
+    
+    self.assertFalse(IO.writeGIN(system, os.path.join(self.temp_dir, "x.gin"), 
+                                 controlFile=os.path.join(self.temp_dir, "missing.gin"))[0])
+  
+  def test_batch_convert(self):
+    """
+    Testing the batch conversion of a directory tree
+    """
+    
+    import DM_Convert_Files
+    
+    input_dir = os.path.join(self.temp_dir, "input")
+    output_dir = os.path.join(self.temp_dir, "output")
+    
+    for i in range(4):
+      sub_dir = os.path.join(input_dir, "run%d" % (i % 2))
+      
+      if not os.path.isdir(sub_dir):
+        os.makedirs(sub_dir)
+      
+      shutil.copy("unittests/DM_Surface_Energy/Ti_n13.xyz", os.path.join(sub_dir, "Ti_%d.xyz" % (i)))
+    
+    success, error, counts = DM_Convert_Files.batchConvert(input_dir, ".xyz", ".car", outputDir=output_dir, 
+                                                           recursive=True, processes=2)
+    
+    self.assertTrue(success, error)
+    self.assertEqual(counts, (4, 0, 0))
+    
+    car_system = IO.readSystemFromFileCAR(os.path.join(output_dir, "run1", "Ti_3.car"))
+    self.assertEqual(car_system.NAtoms, 13)
+    
+    # up to date files are skipped, modified ones are converted again
+    os.utime(os.path.join(input_dir, "run0", "Ti_0.xyz"), None)
+    os.utime(os.path.join(output_dir, "run0", "Ti_0.car"), (0, 0))
+    
+    success, error, counts = DM_Convert_Files.batchConvert(input_dir, ".xyz", ".car", outputDir=output_dir, 
+                                                           recursive=True, processes=1)
+    
+    self.assertEqual(counts, (1, 3, 0))
+    
+    # without the recursion only the top level is converted
+    self.assertEqual(DM_Convert_Files.batchConvert(input_dir, ".xyz", ".in", processes=1)[2], (0, 0, 0))
+  
+  def test_spin_directories(self):
+    """
+    Testing the preparation of the spin simulation directories with the linked control and geometry files
+    """
+    
+    import optparse
+    
+    import DM_FHIaims_Spin_Analysis
+    
+    system = IO.readSystemFromFileXYZ("unittests/DM_Surface_Energy/Ti_n13.xyz")
+    
+    cwd = os.getcwd()
+    
+    try:
+      os.chdir(self.temp_dir)
+      
+      f = open("control.in", "w")
+      f.write("xc pbe\ndefault_initial_moment 0\nspin collinear\n")
+      f.close()
+      
+      control_lines = open("control.in").readlines()
+      
+      self.assertEqual(DM_FHIaims_Spin_Analysis.render_control_file(control_lines, 3), 
+                       "xc pbe\ndefault_initial_moment 3\nspin collinear\n")
+      
+      systems_list = []
+      
+      for i in range(2):
+        system.name = "Ti_%d" % (i)
+        systems_list.append(copy.deepcopy(system))
+      
+      os.makedirs("input")
+      shutil.move("control.in", os.path.join("input", "control.in"))
+      
+      options = optparse.Values({"spinfr" : 0.0, "spinto" : 2.0})
+      
+      # preparing twice replaces the files of the previous run
+      for _ in range(2):
+        DM_FHIaims_Spin_Analysis.prepare_spins(systems_list, options)
+      
+      self.assertEqual(sorted(IO.get_dir_list("geometry.in")), 
+                       ["./output/spin_ini_%d/Ti_%d" % (spin, i) for spin in range(3) for i in range(2)])
+      
+      f = open("output/spin_ini_2/Ti_1/control.in")
+      self.assertTrue("default_initial_moment 2\n" in f.read())
+      f.close()
+      
+      geometry_file = "output/spin_ini_1/Ti_1/geometry.in"
+      
+      self.assertTrue(os.path.samefile(geometry_file, "output/spin_ini_0/Ti_1/geometry.in"))
+      self.assertFalse(os.path.samefile(geometry_file, "output/spin_ini_1/Ti_0/geometry.in"))
+      f = open(geometry_file)
+      self.assertEqual(len([line for line in f if line.startswith("atom")]), 13)
+      f.close()
+    
+    finally:
+      os.chdir(cwd)
+
+class Test_File_Discovery(TempDirTestCase):
+  """
+  File discovery unittest class
+  
+  """
+  
+  def test_find_files(self):
+    """
+    Testing the filters, the depth limit and the cached manifest
+    """
+    
+    def touch(*path):
+      f = open(os.path.join(self.temp_dir, *path), "w")
+      f.write("1\n")
+      f.close()
+    
+    os.makedirs(os.path.join(self.temp_dir, "a", "b"))
+    
+    touch("top.xyz")
+    touch("top.car")
+    touch("a", "run_1.xyz")
+    touch("a", "b", "run_2.xyz")
+    touch("a", "b", "other.xyz")
+    
+    all_xyz = IO.find_files(self.temp_dir, extension="xyz")
+    
+    self.assertEqual([os.path.relpath(path, self.temp_dir) for path in all_xyz], 
+                     ["a/b/other.xyz", "a/b/run_2.xyz", "a/run_1.xyz", "top.xyz"])
+    self.assertEqual(IO.find_files(self.temp_dir, extension="xyz", threads=3), all_xyz)
+    self.assertEqual(list(IO.iter_files(self.temp_dir, extension="xyz", max_depth=0)), 
+                     [os.path.join(self.temp_dir, "top.xyz")])
+    self.assertEqual(len(IO.find_files(self.temp_dir, extension="xyz", prefix="run", threads=2)), 2)
+    
+    # the mutable default list is not shared between the calls
+    cwd = os.getcwd()
+    os.chdir(self.temp_dir)
+    
+    try:
+      self.assertEqual(len(IO.get_file_list_recursive_simple(extension="xyz")), 4)
+      self.assertEqual(len(IO.get_file_list_recursive_simple(extension="xyz")), 4)
+    
+    finally:
+      os.chdir(cwd)
+    
+    manifest_file = os.path.join(self.temp_dir, "manifest.json")
+    
+    manifest = IO.FileManifest(manifest_file)
+    entries, changed = manifest.scan(self.temp_dir, extension="xyz")
+    manifest.save()
+    
+    self.assertEqual(len(entries), 4)
+    self.assertEqual(len(changed), 4)
+    
+    # nothing has changed
+    manifest = IO.FileManifest(manifest_file)
+    entries, changed = manifest.scan(self.temp_dir, extension="xyz")
+    
+    self.assertEqual(len(entries), 4)
+    self.assertEqual(changed, [])
+    
+    # a new file and a removed directory
+    touch("a", "run_3.xyz")
+    shutil.rmtree(os.path.join(self.temp_dir, "a", "b"))
+    os.utime(os.path.join(self.temp_dir, "a"), (0, 0))
+    
+    entries, changed = manifest.scan(self.temp_dir, extension="xyz")
+    
+    self.assertEqual([os.path.relpath(path, self.temp_dir) for path, _, _ in entries], 
+                     ["a/run_1.xyz", "a/run_3.xyz", "top.xyz"])
+    self.assertEqual(changed, [os.path.join(self.temp_dir, "a", "run_3.xyz")])
+    self.assertFalse(os.path.join(self.temp_dir, "a", "b") in manifest.dirs)
+    
+    # a file modified in place is found only by verifying
+    f = open(os.path.join(self.temp_dir, "top.xyz"), "a")
+    f.write("2\n")
+    f.close()
+    
+    self.assertEqual(manifest.scan(self.temp_dir, extension="xyz")[1], [])
+    self.assertEqual(manifest.scan(self.temp_dir, extension="xyz", verify=True)[1], 
+                     [os.path.join(self.temp_dir, "top.xyz")])
+
+class Test_Analysis_Manifest(TempDirTestCase):
+  """
+  Analysis manifest unittest class
+  
+  """
+  
+  def test_manifest_sync(self):
+    """
+    Testing that only the new and modified files are read in again
+    """
+    
+    system = IO.readSystemFromFileXYZ("unittests/DM_Surface_Energy/Ti_n13.xyz")
+    
+    paths = []
+    
+    for i in range(4):
+      system.totalEnergy = -10.0 * i
+      system.name = "Ti_%d" % (i)
+      
+      paths.append(os.path.join(self.temp_dir, "Ti_%d.xyz" % (i)))
+      IO.writeXYZ(system, paths[-1])
+    
+    db_path = os.path.join(self.temp_dir, "manifest.db")
+    
+    manifest = Manifest.AnalysisManifest(db_path, params={"hashkeyRadius" : 3.0})
+    
+    self.assertEqual(manifest.sync(paths, IO.readSystemFromFile, processes=2), (4, 0, 0))
+    
+    systems = manifest.systems()
+    
+    self.assertEqual([os.path.basename(s.path) for s in systems], ["Ti_3.xyz", "Ti_2.xyz", "Ti_1.xyz", "Ti_0.xyz"])
+    self.assertTrue(np.allclose(systems[0].pos, system.pos))
+    
+    for s in systems:
+      s.hashkey = "hashkey_%s" % (s.name)
+    
+    manifest.save_hashkeys(systems)
+    manifest.close()
+    
+    # nothing has changed
+    manifest = Manifest.AnalysisManifest(db_path, params={"hashkeyRadius" : 3.0})
+    
+    self.assertEqual(manifest.sync(paths, IO.readSystemFromFile, processes=1), (0, 0, 0))
+    self.assertEqual(manifest.systems()[0].hashkey, "hashkey_Ti_3")
+    
+    # a modified, a removed and a corrupted file
+    system.totalEnergy = -100.0
+    IO.writeXYZ(system, paths[1])
+    os.utime(paths[1], (0, 0))
+    
+    os.unlink(paths[2])
+    
+    f = open(os.path.join(self.temp_dir, "broken.xyz"), "w")
+    f.write("2\n\nTi 0.0\n")
+    f.close()
+    
+    paths = [paths[0], paths[1], paths[3], os.path.join(self.temp_dir, "broken.xyz")]
+    
+    self.assertEqual(manifest.sync(paths, IO.readSystemFromFile, processes=1), (2, 1, 1))
+    
+    systems = manifest.systems()
+    
+    self.assertEqual([s.totalEnergy for s in systems], [-100.0, -30.0, 0.0])
+    self.assertEqual([s.hashkey for s in systems], ["", "hashkey_Ti_3", "hashkey_Ti_0"])
+    
+    manifest.close()
+    
+    # the records depend on the parameters
+    manifest = Manifest.AnalysisManifest(db_path, params={"hashkeyRadius" : 3.5})
+    
+    self.assertEqual(manifest.systems(), [])
+    
+    manifest.close()
+  
+  def test_manifest_changed_paths(self):
+    """
+    Testing that with the changed files of a file manifest only these and the unrecorded files are read in
+    """
+    
+    system = IO.readSystemFromFileXYZ("unittests/DM_Surface_Energy/Ti_n13.xyz")
+    
+    os.makedirs(os.path.join(self.temp_dir, "a"))
+    os.makedirs(os.path.join(self.temp_dir, "b"))
+    
+    for i, dir_name in enumerate(["a", "a", "b"]):
+      system.totalEnergy = -10.0 * i
+      IO.writeXYZ(system, os.path.join(self.temp_dir, dir_name, "Ti_%d.xyz" % (i)))
+    
+    files_manifest = IO.FileManifest(os.path.join(self.temp_dir, "files.json"))
+    manifest = Manifest.AnalysisManifest(os.path.join(self.temp_dir, "manifest.db"))
+    
+    entries, changed = files_manifest.scan(self.temp_dir, extension="xyz")
+    paths = [path for path, _, _ in entries]
+    
+    self.assertEqual(manifest.sync(paths, IO.readSystemFromFile, processes=1, changedPaths=changed), (3, 0, 0))
+    
+    # a file modified in place is only read in if it is reported as changed
+    path = os.path.join(self.temp_dir, "a", "Ti_0.xyz")
+    
+    system.totalEnergy = -100.0
+    IO.writeXYZ(system, path)
+    os.utime(path, (0, 0))
+    
+    self.assertEqual(manifest.sync(paths, IO.readSystemFromFile, processes=1, changedPaths=[]), (0, 0, 0))
+    
+    entries, changed = files_manifest.scan(self.temp_dir, extension="xyz", verify=True)
+    
+    self.assertEqual(changed, [path])
+    self.assertEqual(manifest.sync(paths, IO.readSystemFromFile, processes=1, changedPaths=changed), (1, 0, 0))
+    self.assertEqual(manifest.systems()[0].totalEnergy, -100.0)
+    
+    # the files without a record are read in (e.g. after a rebuild)
+    manifest.clear()
+    
+    self.assertEqual(manifest.sync(paths, IO.readSystemFromFile, processes=1, changedPaths=[]), (3, 0, 0))
+    
+    manifest.close()
+
+class Test_Hashkeys(TempDirTestCase):
+  """
+  Batched hashkeys and the FHI-aims tops and unique files unittest class
+  
+  """
+  
+  def write_dreadnaut_stub(self, file_path, extra_line=False):
+    """
+    Writes a stub of dreadnaut: the hashkey of a graph is made of its number of vertices, a graph of 1 vertex 
+    fails. With extra_line a batch run (ended with q) prints one hashkey line too many.
+    """
+    
+    f = open(file_path, "w")
+    f.write("#!/bin/sh\n")
+    f.write("while read line; do\n")
+    f.write("  case \"$line\" in\n")
+    f.write("    n=*) n=${line#n=}; n=${n%% *};;\n")
+    f.write("    x) echo \"[fixing partition]\"; echo \"cpu time = 0.00 seconds\";;\n")
+    f.write("    z) [ \"$n\" = \"1\" ] && exit 1\n")
+    f.write("       echo \"[$n a$n b$n]\";;\n")
+    if extra_line:
+      f.write("    q) echo \"[0 0 0]\";;\n")
+    f.write("  esac\n")
+    f.write("done\n")
+    f.close()
+    
+    os.chmod(file_path, 0755)
+  
+  def make_systems(self, atoms_list):
+    """
+    Creates the systems of the Ti cluster with the given numbers of atoms
+    """
+    
+    system = IO.readSystemFromFileXYZ("unittests/DM_Surface_Energy/Ti_n13.xyz")
+    
+    systems = []
+    
+    for i, atoms in enumerate(atoms_list):
+      systems.append(copy.deepcopy(system))
+      systems[-1].NAtoms = atoms
+      systems[-1].name = "Ti_%d" % (i)
+    
+    return systems
+  
+  def test_hashkey_line(self):
+    """
+    Testing the recognition of the hashkey lines of the dreadnaut output
+    """
+    
+    self.assertTrue(Utilities._dreadnautHashkeyLine.match("[3b2ae8a1 60ac8db4 4a97e26]"))
+    
+    for line in ["[fixing partition]", "cpu time = 0.00 seconds", "[3b2ae8a1 60ac8db4 4a97e26] x", 
+                 "3b2ae8a1 60ac8db4 4a97e26", "[3b2ae8a1 60ac8db4  4a97e26]"]:
+      self.assertFalse(Utilities._dreadnautHashkeyLine.match(line), line)
+  
+  def test_calculate_hashkeys_stub(self):
+    """
+    Testing the batches (order, count mismatch and failures) with a stub of dreadnaut
+    """
+    
+    getPathToDreadnaut = Utilities.getPathToDreadnaut
+    
+    try:
+      stub = os.path.join(self.temp_dir, "dreadnaut")
+      Utilities.getPathToDreadnaut = lambda: stub
+      
+      graphs = [system.makeGraphString(hashkeyRadius=3.0) for system in self.make_systems([3, 5])]
+      
+      # the output lines which are not hashkeys are skipped
+      self.write_dreadnaut_stub(stub)
+      self.assertEqual(Utilities.runDreadnautBatch(graphs), ["3_a3_b3", "5_a5_b5"])
+      self.assertEqual(Utilities.runDreadnautBatch([]), [])
+      
+      # a count mismatch falls back to one run per graph
+      self.write_dreadnaut_stub(stub, extra_line=True)
+      self.assertEqual(Utilities.runDreadnautBatch(graphs), ["3_a3_b3", "5_a5_b5"])
+      
+      # the order of the systems is kept across the batches of the pool, a failed graph has no hashkey
+      atoms_list = [4, 2, 1, 7, 13, 5, 9]
+      
+      for extra_line in [False, True]:
+        self.write_dreadnaut_stub(stub, extra_line=extra_line)
+        
+        systems = self.make_systems(atoms_list)
+        
+        System.calculate_hashkeys(systems, hashkeyRadius=3.0, processes=2, batchSize=2)
+        
+        self.assertEqual([system.hashkey for system in systems], 
+                         ["%d_a%d_b%d" % (atoms, atoms, atoms) if atoms != 1 else None for atoms in atoms_list])
+        
+        for system in systems:
+          hashkey = system.hashkey
+          
+          system.calculateHashkey(hashkeyRadius=3.0)
+          self.assertEqual(system.hashkey, hashkey)
+    
+    finally:
+      Utilities.getPathToDreadnaut = getPathToDreadnaut
+  
+  def test_calculate_hashkeys_dreadnaut(self):
+    """
+    Testing that the batched hashkeys match the hashkeys of one dreadnaut run per system
+    """
+    
+    output, _, status = Utilities.run_sub_process("\"%s\" < /dev/null" % (Utilities.getPathToDreadnaut()))
+    
+    if status:
+      self.skipTest("dreadnaut cannot be run")
+    
+    systems = self.make_systems([13, 6, 13, 9, 4])
+    
+    System.calculate_hashkeys(systems, hashkeyRadius=3.0, processes=2, batchSize=2)
+    
+    hashkeys = [system.hashkey for system in systems]
+    
+    self.assertEqual(hashkeys[0], hashkeys[2])
+    self.assertEqual(len(set(hashkeys)), 4)
+    
+    for system, hashkey in zip(systems, hashkeys):
+      system.calculateHashkey(hashkeyRadius=3.0)
+      self.assertEqual(system.hashkey, hashkey)
+  
+  def test_save_files(self):
+    """
+    Testing that a rerun writes and hashes only the systems without a hashkey and removes the stale tops files
+    """
+    
+    import DM_FHIaims_Analysis
+    
+    getPathToDreadnaut = Utilities.getPathToDreadnaut
+    
+    cwd = os.getcwd()
+    
+    try:
+      stub = os.path.join(self.temp_dir, "dreadnaut")
+      self.write_dreadnaut_stub(stub)
+      
+      Utilities.getPathToDreadnaut = lambda: stub
+      
+      # Ti_1 and Ti_2 are the same, Ti_3 cannot be hashed, Ti_4 is added by the rerun
+      systems = self.make_systems([5, 7, 7, 1, 9])
+      new_system = systems.pop()
+      
+      os.chdir(self.temp_dir)
+      
+      unique_systems = DM_FHIaims_Analysis.saveFiles(systems, processes=1)
+      
+      self.assertEqual([system.hashkey for system in systems], ["5_a5_b5", "7_a7_b7", "7_a7_b7", ""])
+      self.assertEqual([system.name for system in unique_systems], ["Ti_0", "Ti_1", "Ti_3"])
+      self.assertEqual(sorted(os.listdir("tops")), ["Ti_0.xyz", "Ti_1.xyz", "Ti_2.xyz", "Ti_3.xyz"])
+      self.assertEqual(sorted(os.listdir("unique")), ["n01_003_Ti_3.xyz", "n05_001_Ti_0.xyz", "n07_002_Ti_1.xyz"])
+      self.assertTrue(os.path.samefile("tops/Ti_1.xyz", "unique/n07_002_Ti_1.xyz"))
+      
+      for file_name in os.listdir("tops"):
+        os.utime(os.path.join("tops", file_name), (0, 0))
+      
+      # rerun (as read from the manifest): Ti_0 is kept, Ti_2 has been removed and Ti_4 is new
+      systems[0].hashkey = "recorded"
+      
+      systems = [systems[0], systems[1], systems[3], new_system]
+      
+      unique_systems = DM_FHIaims_Analysis.saveFiles(systems, processes=1)
+      
+      self.assertEqual([system.hashkey for system in systems], ["recorded", "7_a7_b7", "", "9_a9_b9"])
+      self.assertEqual(sorted(os.listdir("tops")), ["Ti_0.xyz", "Ti_1.xyz", "Ti_3.xyz", "Ti_4.xyz"])
+      self.assertEqual(len(unique_systems), 4)
+      
+      # only the systems without a hashkey are written again
+      self.assertEqual([os.path.getmtime(os.path.join("tops", "%s.xyz" % (name))) == 0 
+                        for name in ["Ti_0", "Ti_1", "Ti_3", "Ti_4"]], [True, True, False, False])
+      
+      # the unique files are copied if the file system does not support hard links
+      link = os.link
+      
+      def no_link(source_file, target_file):
+        raise OSError("hard links are not supported")
+      
+      os.link = no_link
+      
+      try:
+        IO.linkFile("tops/Ti_0.xyz", "unique/n05_001_Ti_0.xyz")
+      
+      finally:
+        os.link = link
+      
+      self.assertFalse(os.path.samefile("tops/Ti_0.xyz", "unique/n05_001_Ti_0.xyz"))
+      
+      f = open("tops/Ti_0.xyz")
+      data = f.read()
+      f.close()
+      
+      f = open("unique/n05_001_Ti_0.xyz")
+      self.assertEqual(f.read(), data)
+      f.close()
+    
+    finally:
+      os.chdir(cwd)
+      Utilities.getPathToDreadnaut = getPathToDreadnaut
+
+class Test_DM_Comparison(TempDirTestCase):
+  """
+  Comparison of the levels of theory unittest class
+  
+  """
+  
+  def write_file(self, file_path, lines):
+    """
+    Writes the lines into a file (the directories are created)
+    """
+    
+    dir_path = os.path.dirname(file_path)
+    
+    if not os.path.isdir(dir_path):
+      os.makedirs(dir_path)
+    
+    f = open(file_path, "w")
+    f.write("".join(["%s\n" % (line) for line in lines]))
+    f.close()
+  
+  def make_result(self, structures):
+    """
+    Returns a SimulationResult of (energy, hashkey) structures
+    """
+    
+    import DM_Comparison
+    
+    result = DM_Comparison.SimulationResult(DM_Comparison._inputTypeJobArr, 2)
+    
+    for i, (energy, hashkey) in enumerate(structures):
+      result.appendStructure(energy, hashkey, -1, i + 1, -1)
+    
+    return result
+  
+  def test_read_config(self):
+    """
+    Testing the configuration of the levels of theory
+    """
+    
+    import DM_Comparison
+    
+    config_file = os.path.join(self.temp_dir, "comparison.ini")
+    
+    self.write_file(config_file, ["[IP]", "path = /data/ip", "type = KLMC_GA", "limit = 50", 
+                                  "[DFT light]", "path = /data/light", "type = JOBARR_DM", 
+                                  "[DFT tight]", "path = /data/tight", "type = KLMC_DM", "limit = 0", 
+                                  "format = xyz"])
+    
+    success, error, theories = DM_Comparison.readConfig(config_file)
+    self.assertTrue(success, error)
+    
+    self.assertEqual([theory["label"] for theory in theories], ["IP", "DFT light", "DFT tight"])
+    self.assertEqual([theory["type"] for theory in theories], ["KLMC_GA", "JOBARR_DM", "KLMC_DM"])
+    self.assertEqual([theory["limit"] for theory in theories], [50, None, None])
+    self.assertEqual(theories[2]["path"], "/data/tight")
+    self.assertEqual(theories[2]["format"], "xyz")
+    
+    # the command line limit overrides the configured ones (0 - no limit)
+    self.assertEqual([theory["limit"] for theory in DM_Comparison.readConfig(config_file, limit=10)[2]], [10] * 3)
+    self.assertEqual([theory["limit"] for theory in DM_Comparison.readConfig(config_file, limit=0)[2]], [None] * 3)
+    
+    # errors
+    self.assertFalse(DM_Comparison.readConfig(os.path.join(self.temp_dir, "missing.ini"))[0])
+    
+    for lines in [["[IP]", "type = KLMC_GA", "[DFT]", "path = /data/dft", "type = JOBARR_DM"], 
+                  ["[IP]", "path = /data/ip", "[DFT]", "path = /data/dft", "type = JOBARR_DM"], 
+                  ["[IP]", "path = /data/ip", "type = VASP", "[DFT]", "path = /data/dft", "type = JOBARR_DM"], 
+                  ["[IP]", "path = /data/ip", "type = KLMC_GA"]]:
+      self.write_file(config_file, lines)
+      
+      success, error, _ = DM_Comparison.readConfig(config_file)
+      
+      self.assertFalse(success)
+      self.assertTrue(len(error) > 0)
+  
+  def test_match_structures(self):
+    """
+    Testing the hashkey join keeping the lowest energy of every hashkey
+    """
+    
+    import DM_Comparison
+    
+    result = self.make_result([(-3.0, "h1"), (-1.0, "h2"), (-5.0, "h1"), (-9.0, ""), (-9.0, "-"), (-2.0, "h3")])
+    
+    self.assertEqual(result.structCnt, 6)
+    
+    energies1 = DM_Comparison.getHashkeyEnergies(result)
+    self.assertEqual(energies1, {"h1" : -5.0, "h2" : -1.0, "h3" : -2.0})
+    
+    energies2 = {"h3" : -7.0, "h1" : -6.0, "h4" : -8.0}
+    
+    hashkeys, e1, e2 = DM_Comparison.matchStructures(energies1, energies2)
+    
+    self.assertEqual(hashkeys, ["h1", "h3"])
+    self.assertTrue(np.array_equal(e1, [-5.0, -2.0]))
+    self.assertTrue(np.array_equal(e2, [-6.0, -7.0]))
+    
+    hashkeys, e1, e2 = DM_Comparison.matchStructures(energies1, {"h5" : 0.0})
+    
+    self.assertEqual((hashkeys, len(e1), len(e2)), ([], 0, 0))
+  
+  def test_rank_correlations(self):
+    """
+    Testing the rank correlations of three levels of theory
+    """
+    
+    import DM_Comparison
+    
+    hashkey_energies = [{"a" : 1.0, "b" : 2.0, "c" : 3.0, "d" : 4.0}, 
+                        {"a" : 10.0, "b" : 30.0, "c" : 20.0, "d" : 40.0, "e" : 0.0}, 
+                        {"a" : 5.0, "z" : 1.0}]
+    
+    spearman, kendall, common = DM_Comparison.rankCorrelations(hashkey_energies)
+    
+    self.assertTrue(np.array_equal(common, [[4, 4, 1], [4, 5, 1], [1, 1, 2]]))
+    
+    # one swapped pair out of four structures
+    self.assertAlmostEqual(spearman[0, 1], 0.8)
+    self.assertAlmostEqual(spearman[1, 0], 0.8)
+    self.assertAlmostEqual(kendall[0, 1], 4.0 / 6.0)
+    
+    self.assertTrue(np.allclose(np.diag(spearman), 1.0))
+    self.assertTrue(np.allclose(np.diag(kendall), 1.0))
+    
+    # less than two structures in common
+    for matrix in [spearman, kendall]:
+      self.assertTrue(np.isnan(matrix[0, 2]) and np.isnan(matrix[2, 0]))
+      self.assertTrue(np.isnan(matrix[1, 2]) and np.isnan(matrix[2, 1]))
+  
+  def test_rank_readers(self):
+    """
+    Testing the indexes of the initial and current ranks of the DM and job array structures
+    """
+    
+    import DM_Comparison
+    
+    # KLMC DM: the last match of the initial rank, the first match of the name and of the hashkey
+    dm_dir = os.path.join(self.temp_dir, "dm")
+    
+    self.write_file(os.path.join(dm_dir, "KLMC.log"), 
+                    ["Reading structure from restart/3_A12.xyz as X1 energy", 
+                     "Reading structure from restart/5_A7.xyz as X2 energy", 
+                     "Reading structure from restart/abc_A9.xyz as X4 energy", 
+                     "Reading structure from restart/6_A9.xyz", 
+                     "Reading structure from restart/8_A9.xyz as X1 energy"])
+    
+    self.write_file(os.path.join(dm_dir, "top_structures", "statistics"), 
+                    ["Rank Name Hashkey", "1 A2 hk2", "2 A1 hk1", "3 A2 hk3"])
+    
+    self.write_file(os.path.join(dm_dir, "top_structures", "hashkeys"), 
+                    ["Rank Name Hashkey", "1 A2 hk2", "2 A7 hk2", "3 A1 hk1"])
+    
+    self.write_file(os.path.join(dm_dir, "run", "prodStatistics.csv"), 
+                    ["No,Name,Hashkey,EDFN,Energy", "1,A1,hk1,1,-10.0", "2,A2,hk2,1,-9.0", "3,A4,hk4,1,-8.0", 
+                     "4,A5,hk5,0,-7.0"])
+    
+    prev_ranks = DM_Comparison.readIniStructuresKLMC(os.path.join(dm_dir, "KLMC.log"))
+    
+    self.assertEqual(prev_ranks, {"X1" : 8, "X2" : 5})
+    self.assertEqual(DM_Comparison.lookForIniStructureKLMC(prev_ranks, "A1"), 8)
+    self.assertEqual(DM_Comparison.lookForIniStructureKLMC(prev_ranks, "A4"), -1)
+    self.assertEqual(DM_Comparison.readIniStructuresKLMC(os.path.join(dm_dir, "missing.log")), {})
+    
+    stats_file = os.path.join(dm_dir, "top_structures", "statistics")
+    hashkeys_file = os.path.join(dm_dir, "top_structures", "hashkeys")
+    
+    self.assertEqual(DM_Comparison.readStructureRanksKLMC(stats_file, 1), {"A2" : 1, "A1" : 2})
+    self.assertEqual(DM_Comparison.readStructureRanksKLMC(hashkeys_file, 2), {"hk2" : 1, "hk1" : 3})
+    self.assertEqual(DM_Comparison.readStructureRanksKLMC(os.path.join(dm_dir, "missing"), 1), {})
+    
+    success, error, result = DM_Comparison.readStructuresData(dm_dir, None, DM_Comparison._inputTypeKLMC_DM, "")
+    self.assertTrue(success, error)
+    
+    self.assertEqual(result.structCnt, 3)
+    self.assertEqual(result.hashkeys, ["hk1", "hk2", "hk4"])
+    self.assertEqual(list(result.prevRank[:3]), [8, 5, -1])
+    self.assertEqual(list(result.currRank[:3]), [2, 1, -1])
+    self.assertEqual(list(result.currRankHash[:3]), [3, 1, -1])
+    
+    # job array: the ranks are the line numbers of the first match
+    jobarr_dir = os.path.join(self.temp_dir, "jobarr")
+    
+    self.write_file(os.path.join(jobarr_dir, "output", "unique", "Stats.csv"), 
+                    ["Name,Energy,Hashkey", "A_3,-5.0,hk3", "A_1,-4.0,hk1", "A_3,-3.0,hk9", "B12,-2.0,hk1"])
+    
+    self.write_file(os.path.join(jobarr_dir, "output", "Stats.csv"), 
+                    ["Name,Energy,Hashkey", "A_1,-4.0,hk1", "B12,-2.0,hk9", "Cx,-1.0,hk7", "A_2,0.0,hk2"])
+    
+    name_ranks, hashkey_ranks = DM_Comparison.readStructureRanksJobArr(os.path.join(jobarr_dir, "output", "unique", 
+                                                                                    "Stats.csv"))
+    
+    self.assertEqual(name_ranks, {"A_3" : 1, "A_1" : 2, "B12" : 4})
+    self.assertEqual(hashkey_ranks, {"hk3" : 1, "hk1" : 2, "hk9" : 3})
+    self.assertEqual(DM_Comparison.readStructureRanksJobArr(os.path.join(jobarr_dir, "missing.csv")), ({}, {}))
+    
+    success, error, result = DM_Comparison.readStructuresData(jobarr_dir, None, DM_Comparison._inputTypeJobArr, "")
+    self.assertTrue(success, error)
+    
+    self.assertEqual(result.structCnt, 3)
+    self.assertEqual(list(result.prevRank[:3]), [1, 12, -1])
+    self.assertEqual(list(result.currRank[:3]), [2, 4, -1])
+    self.assertEqual(list(result.currRankHash[:3]), [2, 3, -1])
+    
+    # the structure limit
+    result = DM_Comparison.readStructuresData(jobarr_dir, 2, DM_Comparison._inputTypeJobArr, "")[2]
+    self.assertEqual(result.structCnt, 2)
+  
+  def test_compare_landscapes(self):
+    """
+    Testing the comparison of job array levels of theory and its csv outputs
+    """
+    
+    import DM_Comparison
+    
+    levels = [("light", [("A_1", -10.0, "h1"), ("A_2", -9.0, "h2"), ("A_3", -8.0, "h3"), ("A_4", -7.5, "h3")]), 
+              ("tight", [("A_2", -20.0, "h2"), ("A_1", -19.0, "h1"), ("A_3", -18.0, "h3")])]
+    
+    config_lines = []
+    
+    for label, structures in levels:
+      self.write_file(os.path.join(self.temp_dir, label, "output", "Stats.csv"), 
+                      ["Name,Energy,Hashkey"] + ["%s,%f,%s" % structure for structure in structures])
+      
+      config_lines += ["[%s]" % (label), "path = %s" % (os.path.join(self.temp_dir, label)), "type = JOBARR_DM"]
+    
+    config_file = os.path.join(self.temp_dir, "comparison.ini")
+    self.write_file(config_file, config_lines)
+    
+    prefix = os.path.join(self.temp_dir, "Comparison")
+    
+    success, error = DM_Comparison.compareLandscapes(config_file, processes=2, outputPrefix=prefix)
+    self.assertTrue(success, error)
+    
+    f = open("%s_Common.csv" % (prefix))
+    self.assertEqual(f.read().splitlines(), [",light,tight", "light,3,3", "tight,3,3"])
+    f.close()
+    
+    # h1 and h2 are swapped: rho = 0.5, tau = 1/3
+    for name, expected in [("Spearman", 0.5), ("Kendall", 1.0 / 3.0)]:
+      f = open("%s_%s.csv" % (prefix, name))
+      lines = f.read().splitlines()
+      f.close()
+      
+      self.assertEqual(lines[0], ",light,tight")
+      self.assertEqual([line.split(",")[0] for line in lines[1:]], ["light", "tight"])
+      
+      matrix = np.array([[float(value) for value in line.split(",")[1:]] for line in lines[1:]])
+      
+      self.assertTrue(np.allclose(matrix, [[1.0, expected], [expected, 1.0]], atol=1.0e-6))
+    
+    # a level of theory which cannot be read is skipped
+    self.write_file(config_file, config_lines + ["[missing]", "path = %s" % (os.path.join(self.temp_dir, "missing")), 
+                                                 "type = JOBARR_DM"])
+    
+    self.assertTrue(DM_Comparison.compareLandscapes(config_file, processes=1, outputPrefix=prefix)[0])
+    
+    f = open("%s_Common.csv" % (prefix))
+    self.assertEqual(f.readline().strip(), ",light,tight")
+    f.close()
+
+class Test_Job_Runner(TempDirTestCase):
+  """
+  Local job runner unittest class
+  
+  """
+  
+  def test_job_runner(self):
+    """
+    Testing the concurrency limit, the state file and resuming with a stub executable
+    """
+    
+    import json
+    
+    # the stub records its start and end times, the directory "fail" fails
+    stub = os.path.join(self.temp_dir, "aims_stub.sh")
+    
+    f = open(stub, "w")
+    f.write("#!/bin/sh\n")
+    f.write("date +%s.%N > start.txt\n")
+    f.write("echo cores $1 threads $OMP_NUM_THREADS\n")
+    f.write("sleep 0.3\n")
+    f.write("date +%s.%N > end.txt\n")
+    f.write("if [ \"`basename $PWD`\" = \"fail\" ]; then exit 1; fi\n")
+    f.write("echo \"          Have a nice day.\"\n")
+    f.close()
+    
+    dir_list = [os.path.join(self.temp_dir, name) for name in ["a", "b", "c", "d", "e", "fail"]]
+    
+    for dir_path in dir_list:
+      os.makedirs(dir_path)
+    
+    # already finished
+    f = open(os.path.join(dir_list[4], "fhiaims.out"), "w")
+    f.write("Have a nice day.\n")
+    f.close()
+    
+    state_file = os.path.join(self.temp_dir, "jobs_state.json")
+    
+    runner = Jobs.JobRunner("sh %s {cores}" % (stub), "fhiaims.out", jobs=8, coresPerJob=2, totalCores=4,
+                            stateFile=state_file, pollInterval=0.05)
+    
+    self.assertEqual(runner.jobs, 2)
+    
+    success, _, counts = runner.run(dir_list)
+    
+    self.assertFalse(success)
+    self.assertEqual(counts, (4, 1, 1))
+    
+    self.assertFalse(os.path.exists(os.path.join(dir_list[4], "start.txt")))
+    
+    f = open(os.path.join(dir_list[0], "fhiaims.out"))
+    self.assertTrue("cores 2 threads 2" in f.read())
+    f.close()
+    
+    # no more than two simulations at the same time
+    times = []
+    
+    for dir_path in dir_list[:4] + dir_list[5:]:
+      for name, change in [("start.txt", 1), ("end.txt", -1)]:
+        f = open(os.path.join(dir_path, name))
+        times.append((float(f.read()), change))
+        f.close()
+    
+    running = 0
+    max_running = 0
+    
+    for _, change in sorted(times):
+      running += change
+      max_running = max(max_running, running)
+    
+    self.assertEqual(max_running, 2)
+    
+    f = open(state_file)
+    state = json.load(f)
+    f.close()
+    
+    self.assertEqual(state[dir_list[0]]["status"], "done")
+    self.assertEqual(state[dir_list[4]]["status"], "skipped")
+    self.assertEqual(state[dir_list[5]]["status"], "failed")
+    self.assertEqual(state[dir_list[5]]["returncode"], 1)
+    self.assertTrue(state[dir_list[0]]["end"] >= state[dir_list[0]]["start"])
+    
+    # resuming: only the failed simulation is run again
+    runner = Jobs.JobRunner("sh %s {cores}" % (stub), "fhiaims.out", jobs=2, coresPerJob=2, totalCores=4,
+                            stateFile=state_file, pollInterval=0.05)
+    
+    self.assertEqual(runner.run(dir_list)[2], (0, 1, 5))
+  
+  def test_job_runner_interrupt(self):
+    """
+    Testing that a simulation interrupted by Ctrl+C or SIGTERM is stopped together with its child processes and 
+    is run again
+    """
+    
+    import errno
+    import json
+    import signal
+    
+    def interrupt(signum, frame):
+      raise KeyboardInterrupt
+    
+    def terminate(signum, frame):
+      os.kill(os.getpid(), signal.SIGTERM)
+    
+    handler = signal.getsignal(signal.SIGALRM)
+    term_handler = signal.getsignal(signal.SIGTERM)
+    
+    try:
+      # the stub leaves its work to a child process (as mpirun does)
+      stub = os.path.join(self.temp_dir, "aims_stub.sh")
+      
+      f = open(stub, "w")
+      f.write("#!/bin/sh\n")
+      f.write("sleep 30 &\n")
+      f.write("echo $! > child.pid\n")
+      f.write("wait\n")
+      f.close()
+      
+      dir_path = os.path.join(self.temp_dir, "a")
+      os.makedirs(dir_path)
+      
+      state_file = os.path.join(self.temp_dir, "jobs_state.json")
+      
+      for stop in [interrupt, terminate]:
+        signal.signal(signal.SIGALRM, stop)
+        
+        runner = Jobs.JobRunner("sh %s" % (stub), "fhiaims.out", stateFile=state_file, pollInterval=0.05)
+        
+        signal.setitimer(signal.ITIMER_REAL, 0.5)
+        
+        self.assertRaises(KeyboardInterrupt, runner.run, [dir_path])
+        
+        # the previous SIGTERM handler is restored
+        self.assertEqual(signal.getsignal(signal.SIGTERM), term_handler)
+        
+        f = open(state_file)
+        self.assertEqual(json.load(f)[dir_path]["status"], "interrupted")
+        f.close()
+        
+        f = open(os.path.join(dir_path, "child.pid"))
+        child_pid = int(f.read())
+        f.close()
+        
+        # the child has been stopped too
+        try:
+          os.kill(child_pid, 0)
+          child_alive = True
+        
+        except OSError as e:
+          child_alive = (e.errno != errno.ESRCH)
+        
+        self.assertFalse(child_alive)
+      
+      # resuming
+      runner = Jobs.JobRunner("echo Have a nice day.", "fhiaims.out", stateFile=state_file, pollInterval=0.05)
+      
+      self.assertEqual(runner.run([dir_path])[2], (1, 0, 0))
+    
+    finally:
+      signal.setitimer(signal.ITIMER_REAL, 0)
+      signal.signal(signal.SIGALRM, handler)
+      signal.signal(signal.SIGTERM, term_handler)
 
 def perform_unit_tests(analysis_tool):
   """